@@ -11,10 +11,6 @@ try:
     from .lib_clickhelpers import AliasedGroup
 except ImportError:
     click = None
-from .tools import _file2env
-
-from . import module_tools  # NOQA
-from . import odoo_config  # NOQA
 
 SCRIPT_DIRECTORY = Path(inspect.getfile(inspect.currentframe())).absolute().parent
 
@@ -24,22 +20,21 @@ os.environ["ODOO_HOME"] = str(SCRIPT_DIRECTORY)
 
 
 from .cli import cli
-from . import lib_clickhelpers  # NOQA
-from . import lib_composer  # NOQA
-from . import lib_backup  # NOQA
-from . import lib_control  # NOQA
-from . import lib_db  # NOQA
-from . import lib_db_snapshots  # NOQA
-from . import lib_lang  # NOQA
-from . import lib_module  # NOQA
-from . import lib_setup  # NOQA
-from . import lib_src  # NOQA
-from . import lib_docker_registry  # NOQA
-from . import lib_turnintodev  # NOQA
-from . import lib_talk  # NOQA
-from . import daddy_cleanup  # NOQA
-
-# import container specific commands
-from .tools import abort  # NOQA
-from .tools import __dcrun  # NOQA
-from .tools import __dc  # NOQA
+
+# the lib modules with the commands are imported when a command of them is
+# used - see command_index; helpers of tools on first access
+_LAZY_ATTRIBUTES = {
+    "_file2env": "tools",
+    "abort": "tools",
+    "__dcrun": "tools",
+    "__dc": "tools",
+}
+
+
+def __getattr__(name):
+    import importlib
+
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,233 @@
+"""
+Deduplicating chunk store for dumps.
+
+The uncompressed dump stream is cut into chunks at content defined
+boundaries and every chunk is stored once, zlib compressed, under
+<dumps path>/.chunks/<sha256[:2]>/<sha256>. The dump file itself is a
+small index: INDEX_MAGIC + json with dump type and the list of chunks.
+
+Boundaries are line ends whose crc32 matches BOUNDARY_MASK (at least
+MIN_CHUNK_SIZE bytes into the chunk; at MAX_CHUNK_SIZE the chunk is cut
+anyway). A boundary depends only on the line before it, so after an
+insert or delete the chunking falls back into step with the former dump
+at the next boundary. pg_dump output, also custom format without
+compression, is line oriented (COPY data), so lines stay short.
+"""
+import io
+import os
+import json
+import fcntl
+import uuid
+import zlib
+import hashlib
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+INDEX_MAGIC = b"WODOO_CHUNKS\n"
+INDEX_VERSION = 1
+STORE_DIRNAME = ".chunks"
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+# a boundary after about every 4096th line (12 bits)
+BOUNDARY_MASK = 0x27FF
+COMPRESSION_LEVEL = 6
+
+
+def get_store_dir(dumps_path):
+    return Path(dumps_path) / STORE_DIRNAME
+
+
+def _chunk_path(store, sha):
+    return Path(store) / sha[:2] / sha
+
+
+@contextmanager
+def _lock(store, exclusive):
+    """
+    Writers share the lock of the store, gc holds it exclusively: chunks
+    of a dump whose index is not written yet are not referenced.
+    """
+    Path(store).mkdir(parents=True, exist_ok=True)
+    with open(Path(store) / ".lock", "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def is_chunk_index(filepath):
+    filepath = Path(filepath)
+    if not filepath.is_file():
+        return False
+    with open(filepath, "rb") as file:
+        return file.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+
+
+def read_index(filepath):
+    with open(filepath, "rb") as file:
+        if file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise Exception(f"{filepath} is not a chunk index.")
+        return json.loads(file.read())
+
+
+def iter_chunks(stream):
+    """
+    Yields the chunks of the binary stream.
+    """
+    chunk = bytearray()
+    while True:
+        line = stream.readline(MAX_CHUNK_SIZE)
+        if not line:
+            break
+        chunk += line
+        if len(chunk) >= MAX_CHUNK_SIZE or (
+            len(chunk) >= MIN_CHUNK_SIZE
+            and not zlib.crc32(line) & BOUNDARY_MASK
+        ):
+            yield bytes(chunk)
+            chunk = bytearray()
+    if chunk:
+        yield bytes(chunk)
+
+
+def _store_chunk(store, data):
+    """
+    Returns (sha256, stored bytes - 0 if the chunk existed already).
+    """
+    sha = hashlib.sha256(data).hexdigest()
+    path = _chunk_path(store, sha)
+    if path.exists():
+        return sha, 0
+    compressed = zlib.compress(data, COMPRESSION_LEVEL)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.parent / f".{sha}.{uuid.uuid4().hex}"
+    tmp.write_bytes(compressed)
+    os.replace(tmp, path)
+    return sha, len(compressed)
+
+
+def write(stream, filepath, store, dump_type, workers=4):
+    """
+    Stores the stream in the chunk store and writes the index to filepath.
+    Returns the index.
+    """
+    with _lock(store, exclusive=False):
+        return _write(stream, filepath, store, dump_type, workers)
+
+
+def _write(stream, filepath, store, dump_type, workers):
+    chunks, stored = [], 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = []
+
+        def _collect(future, size):
+            nonlocal stored
+            sha, new_bytes = future.result()
+            chunks.append([sha, size])
+            stored += new_bytes
+
+        for data in iter_chunks(stream):
+            pending.append((executor.submit(_store_chunk, store, data), len(data)))
+            # bounded memory, order of the chunks is kept
+            while len(pending) > workers * 2:
+                _collect(*pending.pop(0))
+        for item in pending:
+            _collect(*item)
+
+    index = {
+        "version": INDEX_VERSION,
+        "dump_type": dump_type,
+        "size": sum(x[1] for x in chunks),
+        "stored": stored,
+        "chunks": chunks,
+    }
+    tmp = Path(filepath).parent / f".{Path(filepath).name}.tmp"
+    with open(tmp, "wb") as file:
+        file.write(INDEX_MAGIC)
+        file.write(json.dumps(index).encode("utf8"))
+    os.replace(tmp, filepath)
+    return index
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Readable stream of the dump of an index; the next chunks are read and
+    decompressed ahead in threads.
+    """
+
+    def __init__(self, store, index, workers=4):
+        self.store = store
+        self.shas = [x[0] for x in index["chunks"]]
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.ahead = workers * 2
+        self.futures = []
+        self.next_nr = 0
+        self.buffer = memoryview(b"")
+
+    def _load(self, sha):
+        data = zlib.decompress(_chunk_path(self.store, sha).read_bytes())
+        if hashlib.sha256(data).hexdigest() != sha:
+            raise Exception(f"Chunk {sha} is damaged.")
+        return data
+
+    def _fill(self):
+        while self.next_nr < len(self.shas) and len(self.futures) < self.ahead:
+            self.futures.append(
+                self.executor.submit(self._load, self.shas[self.next_nr])
+            )
+            self.next_nr += 1
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.buffer:
+            self._fill()
+            if not self.futures:
+                return 0
+            self.buffer = memoryview(self.futures.pop(0).result())
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        super().close()
+
+
+def open_dump(filepath, store, workers=4):
+    return io.BufferedReader(
+        ChunkReader(store, read_index(filepath), workers), 1024 * 1024
+    )
+
+
+def _iter_indexes(dumps_path):
+    for entry in os.scandir(dumps_path):
+        if entry.is_file() and is_chunk_index(entry.path):
+            yield entry.path
+
+
+def gc(dumps_path, dry_run=False):
+    """
+    Removes the chunks no index in dumps_path refers to.
+    Returns (count, bytes).
+    """
+    count, size = 0, 0
+    store = get_store_dir(dumps_path)
+    if not store.exists():
+        return count, size
+    with _lock(store, exclusive=True):
+        referenced = set()
+        for filepath in _iter_indexes(dumps_path):
+            referenced.update(x[0] for x in read_index(filepath)["chunks"])
+        for path in store.glob("*/*"):
+            if path.name in referenced or path.name.startswith("."):
+                continue
+            count += 1
+            size += path.stat().st_size
+            if not dry_run:
+                path.unlink()
+    return count, size
@@ -8,12 +8,13 @@ try:
 except ImportError:
     click = None
 from .click_config import Config
+from .command_index import COMMANDS
 from .click_global_commands import GlobalCommands
 
 Commands = GlobalCommands()
 pass_config = click.make_pass_decorator(Config, ensure=True)
 
-@click.group(cls=AliasedGroup)
+@click.group(cls=AliasedGroup, lazy_commands=COMMANDS)
 @click.option("-f", "--force", is_flag=True)
 @click.option("-v", "--verbose", is_flag=True)
 @click.option("--version", is_flag=True)
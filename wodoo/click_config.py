@@ -4,6 +4,9 @@ import sys
 from pathlib import Path
 import importlib
 
+# __commands.py of the images executed in this process
+_loaded_dynamic_modules = set()
+
 
 class Config(object):
     class Forced:
@@ -116,32 +119,18 @@ class Config(object):
             value = super(Config, self).__getattribute__(name)
             return value
         except AttributeError:
-            from .myconfigparser import MyConfigParser  # NOQA
+            from .myconfigparser import get_settings  # NOQA
 
             if "settings" not in self.files:
                 return None
-            myconfig = MyConfigParser(self.files["settings"])
+            settings = get_settings(self.files["settings"])
 
-            convert = None
             if name.endswith("_as_int"):
-                convert = "asint"
-                name = name[: -len("_as_int")]
+                return settings.get_int(name[: -len("_as_int")])
             elif name.endswith("_as_bool"):
-                convert = "asbool"
                 name = name[: -len("_as_bool")]
 
-            for tries in [name, name.lower(), name.upper()]:
-                value = ""
-                if tries not in myconfig.keys():
-                    continue
-
-                value = myconfig.get(tries, "")
-                break
-
-            if convert:
-                if convert == "asint":
-                    value = int(value or "0")
-
+            value = settings.get(name, "")
             if value == "1":
                 value = True
             elif value == "0":
@@ -162,16 +151,13 @@ class Config(object):
 
     @property
     def use_docker(self):
-        from .myconfigparser import MyConfigParser  # NOQA
+        from .myconfigparser import get_settings  # NOQA
 
         try:
-            myconfig = MyConfigParser(self.files["settings"])
+            settings = get_settings(self.files["settings"])
         except Exception:
-            USE_DOCKER = True
-        else:
-            USE_DOCKER = myconfig.get("USE_DOCKER", "1") == "1"
-
-        return USE_DOCKER
+            return True
+        return settings.get("USE_DOCKER", "1") == "1"
 
     def _setup_files_and_folders(self):
         from . import odoo_config  # NOQA
@@ -252,8 +238,9 @@ class Config(object):
     def load_dynamic_modules(self):
         parent_dir = self.dirs["images"]
         for module in parent_dir.glob("*/__commands.py"):
-            if module.is_dir():
+            if module.is_dir() or str(module) in _loaded_dynamic_modules:
                 continue
+            _loaded_dynamic_modules.add(str(module))
             spec = importlib.util.spec_from_file_location(
                 "dynamic_loaded_module",
                 str(module),
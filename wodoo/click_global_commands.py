@@ -10,6 +10,11 @@ class GlobalCommands(object):
         self.commands[name] = cmd
 
     def invoke(self, ctx, cmd, missing_ok=False, *args, **kwargs):
+        if cmd not in self.commands:
+            # the module of the command may not be imported yet
+            from .command_index import load_global_command
+
+            load_global_command(cmd)
         if cmd not in self.commands:
             if not missing_ok:
                 raise Exception("CMD not found: {}".format(cmd))
@@ -0,0 +1,131 @@
+"""
+Static index of the commands of the odoo cli.
+
+The cli imports a lib module only when one of its commands is resolved,
+so `odoo --help` and shell completion do not pay for docker, psycopg2,
+lxml and friends. COMMANDS maps the top level commands to their module,
+help and subcommands, GLOBAL_COMMANDS the names registered with
+Commands.register to their module.
+
+After adding or renaming commands regenerate command_index_data.py with:
+
+    python -c "from wodoo import command_index; command_index.write_index()"
+
+A command missing in the index is still found: on a miss all modules are
+loaded like before.
+"""
+import importlib
+import inspect
+
+# all modules with commands in the order they are loaded
+MODULES = [
+    "lib_composer",
+    "lib_backup",
+    "lib_control",
+    "lib_db",
+    "lib_db_snapshots",
+    "lib_lang",
+    "lib_module",
+    "lib_setup",
+    "lib_src",
+    "lib_docker_registry",
+    "lib_turnintodev",
+    "lib_talk",
+    "lib_files",
+    "lib_fleet",
+    "daddy_cleanup",
+]
+
+try:
+    from .command_index_data import COMMANDS, GLOBAL_COMMANDS
+except ImportError:
+    COMMANDS, GLOBAL_COMMANDS = {}, {}
+
+_loaded_all = False
+
+
+def load_module(module):
+    return importlib.import_module(f"{__package__}.{module}")
+
+
+def load_all():
+    """
+    Imports all modules with commands; returns False if that happened
+    already.
+    """
+    global _loaded_all
+    if _loaded_all:
+        return False
+    _loaded_all = True
+    for module in MODULES:
+        load_module(module)
+    return True
+
+
+def load_command(name):
+    """
+    Imports the module of the top level command name; returns False if it
+    is not in the index.
+    """
+    if name not in COMMANDS:
+        return False
+    load_module(COMMANDS[name]["module"])
+    return True
+
+
+def load_global_command(name):
+    """
+    Imports the module that registers name at Commands.
+    """
+    if name in GLOBAL_COMMANDS:
+        load_module(GLOBAL_COMMANDS[name])
+    else:
+        load_all()
+
+
+def _get_help(cmd):
+    if not cmd.help:
+        return None
+    return inspect.cleandoc(cmd.help).split("\n\n")[0]
+
+
+def build():
+    """
+    Loads all modules and collects the index from the registered commands.
+    """
+    from .cli import cli, Commands
+
+    builtin = set(cli.commands)
+    commands, global_commands = {}, {}
+    for module in MODULES:
+        before = set(cli.commands)
+        before_global = set(Commands.commands)
+        load_module(module)
+        for name in sorted(set(cli.commands) - before - builtin):
+            cmd = cli.commands[name]
+            commands[name] = {
+                "module": module,
+                "short_help": cmd.short_help,
+                "help": _get_help(cmd),
+                "hidden": cmd.hidden,
+                "subcommands": sorted(getattr(cmd, "commands", {})),
+            }
+        for name in sorted(set(Commands.commands) - before_global):
+            global_commands[name] = module
+    return commands, global_commands
+
+
+def write_index():
+    import pprint
+    from pathlib import Path
+
+    commands, global_commands = build()
+    path = Path(__file__).parent / "command_index_data.py"
+    path.write_text(
+        '"""\n'
+        "Generated by command_index.write_index - do not edit.\n"
+        '"""\n'
+        f"COMMANDS = {pprint.pformat(commands)}\n"
+        "\n"
+        f"GLOBAL_COMMANDS = {pprint.pformat(global_commands)}\n"
+    )
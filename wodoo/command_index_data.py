@@ -0,0 +1,236 @@
+"""
+Generated by command_index.write_index - do not edit.
+"""
+COMMANDS = {'backup': {'help': None,
+            'hidden': False,
+            'module': 'lib_backup',
+            'short_help': None,
+            'subcommands': ['all',
+                            'chunks-gc',
+                            'files',
+                            'odoo-db',
+                            'wal-archive',
+                            'wal-basebackup']},
+ 'composer': {'help': None,
+              'hidden': False,
+              'module': 'lib_composer',
+              'short_help': None,
+              'subcommands': ['config', 'reload', 'toggle-settings']},
+ 'daddy-cleanup': {'help': 'Deletes file matching the given glob in PATH and '
+                           'keeps youngest files of last weeks, months, '
+                           'quarters and years. By providing --doNt-touch '
+                           'files can be provided, that are never touched. ',
+                   'hidden': False,
+                   'module': 'daddy_cleanup',
+                   'short_help': None,
+                   'subcommands': []},
+ 'db': {'help': 'Database related actions.',
+        'hidden': False,
+        'module': 'lib_db',
+        'short_help': None,
+        'subcommands': ['anonymize',
+                        'cleardb',
+                        'db-health-check',
+                        'db-size',
+                        'drop-db',
+                        'excel',
+                        'pgactivity',
+                        'pgcli',
+                        'pghba-conf-wide-open',
+                        'psql',
+                        'reset-odoo-db',
+                        'setname',
+                        'show-table-sizes']},
+ 'dev-env': {'help': None,
+             'hidden': False,
+             'module': 'lib_turnintodev',
+             'short_help': None,
+             'subcommands': ['hash-password',
+                             'prolong',
+                             'remove-settings',
+                             'set-password-all-users',
+                             'turn-into-dev',
+                             'update-setting']},
+ 'docker': {'help': None,
+            'hidden': False,
+            'module': 'lib_control',
+            'short_help': None,
+            'subcommands': ['attach',
+                            'build',
+                            'debug',
+                            'dev',
+                            'down',
+                            'exec',
+                            'force-kill',
+                            'kill',
+                            'ps',
+                            'pull',
+                            'rebuild',
+                            'recreate',
+                            'restart',
+                            'rm',
+                            'shell',
+                            'show-volumes',
+                            'stop',
+                            'transfer-volume-content',
+                            'up',
+                            'wait-for-container-postgres',
+                            'wait-for-port']},
+ 'docker-registry': {'help': None,
+                     'hidden': False,
+                     'module': 'lib_docker_registry',
+                     'short_help': None,
+                     'subcommands': ['login',
+                                     'regpull',
+                                     'regpush',
+                                     'self-sign-hub-certificate']},
+ 'files': {'help': None,
+           'hidden': False,
+           'module': 'lib_files',
+           'short_help': None,
+           'subcommands': ['copy', 'dedup', 'gc', 'pool-gc', 'pool-stats']},
+ 'fleet': {'help': None,
+           'hidden': False,
+           'module': 'lib_fleet',
+           'short_help': None,
+           'subcommands': ['list', 'run']},
+ 'keep-last-file-of-day': {'help': None,
+                           'hidden': False,
+                           'module': 'daddy_cleanup',
+                           'short_help': None,
+                           'subcommands': []},
+ 'lang': {'help': None,
+          'hidden': False,
+          'module': 'lib_lang',
+          'short_help': None,
+          'subcommands': ['export', 'import', 'list']},
+ 'logs': {'help': None,
+          'hidden': False,
+          'module': 'lib_control',
+          'short_help': None,
+          'subcommands': []},
+ 'odoo-module': {'help': None,
+                 'hidden': False,
+                 'module': 'lib_module',
+                 'short_help': None,
+                 'subcommands': ['abort-upgrade',
+                                 'download-openupgrade',
+                                 'generate-update',
+                                 'list-changed-files',
+                                 'list-changed-modules',
+                                 'list-deps',
+                                 'list-modules',
+                                 'list-robot-test-files',
+                                 'list-unit-test-files',
+                                 'migrate',
+                                 'pretty-print-manifest',
+                                 'progress',
+                                 'recompute-parent-store',
+                                 'restore-web-icons',
+                                 'robotest',
+                                 'run-tests',
+                                 'set-ribbon',
+                                 'show-addons-paths',
+                                 'show-conflicting-modules',
+                                 'show-install-state',
+                                 'uninstall',
+                                 'unittest',
+                                 'update',
+                                 'update-i18n',
+                                 'update-module-file']},
+ 'restore': {'help': None,
+             'hidden': False,
+             'module': 'lib_backup',
+             'short_help': None,
+             'subcommands': ['clear-templates',
+                             'deferred-tables',
+                             'files',
+                             'list',
+                             'list-basebackups',
+                             'list-templates',
+                             'odoo-db',
+                             'pitr',
+                             'show-dump-type',
+                             'show-progress',
+                             'wodoobin-extract',
+                             'wodoobin-verify']},
+ 'run': {'help': None,
+         'hidden': False,
+         'module': 'lib_control',
+         'short_help': None,
+         'subcommands': []},
+ 'runbash': {'help': None,
+             'hidden': False,
+             'module': 'lib_control',
+             'short_help': None,
+             'subcommands': []},
+ 'setup': {'help': None,
+           'hidden': False,
+           'module': 'lib_setup',
+           'short_help': None,
+           'subcommands': ['produce-test-lines',
+                           'remove-web-assets',
+                           'show-effective-settings',
+                           'status',
+                           'upgrade']},
+ 'snapshot': {'help': None,
+              'hidden': False,
+              'module': 'lib_db_snapshots',
+              'short_help': None,
+              'subcommands': ['before-update',
+                              'clear',
+                              'export',
+                              'import',
+                              'list',
+                              'prune',
+                              'purge-inactive-subvolumes',
+                              'remove',
+                              'remove-postgres-volume',
+                              'restore',
+                              'save']},
+ 'src': {'help': None,
+         'hidden': False,
+         'module': 'lib_src',
+         'short_help': None,
+         'subcommands': ['clear-cache',
+                         'fetch-modules',
+                         'goto-inherited',
+                         'init',
+                         'make-module',
+                         'make-modules',
+                         'make-odoo-sh-compatible',
+                         'setup-venv',
+                         'show-addons-paths',
+                         'show-installed-modules',
+                         'update-ast']},
+ 'talk': {'help': None,
+          'hidden': False,
+          'module': 'lib_talk',
+          'short_help': None,
+          'subcommands': ['deactivate-field-in-views', 'xmlids']}}
+
+GLOBAL_COMMANDS = {'backup_db': 'lib_backup',
+ 'build': 'lib_control',
+ 'clear_cache': 'lib_src',
+ 'debug': 'lib_control',
+ 'down': 'lib_control',
+ 'kill': 'lib_control',
+ 'odoo-shell': 'lib_control',
+ 'pghba_conf_wide_open': 'lib_db',
+ 'progress': 'lib_module',
+ 'recreate': 'lib_control',
+ 'reload': 'lib_composer',
+ 'remove_postgres_volume': 'lib_db_snapshots',
+ 'reset-db': 'lib_db',
+ 'restart': 'lib_control',
+ 'restore_db': 'lib_backup',
+ 'rm': 'lib_control',
+ 'run': 'lib_control',
+ 'runbash': 'lib_control',
+ 'show_install_state': 'lib_module',
+ 'snapshot_before_update': 'lib_db_snapshots',
+ 'status': 'lib_setup',
+ 'stop': 'lib_control',
+ 'up': 'lib_control',
+ 'update': 'lib_module',
+ 'wait_for_container_postgres': 'lib_control'}
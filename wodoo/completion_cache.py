@@ -0,0 +1,134 @@
+"""
+Persistent cache for the shell completion callbacks.
+
+Every TAB starts a new odoo process, so without a cache the callbacks
+glob the customs tree or the odoo.sh repo again on every key press.
+Plain file name completion is not cached: listing one folder is cheap.
+
+The results are stored per project in ~/.cache/wodoo/completion/<project>/
+together with the mtimes of the folders (or files) they depend on; if the
+cache cannot be written the computed values are used as they are.
+
+If one of those mtimes changed the result is computed again. With
+background=True the cached result is returned at once and a forked
+process refreshes the entry; that happens as well if the entry is older
+than REFRESH_AFTER seconds, because new files deep in a tree do not
+change the mtime of a watched folder.
+"""
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+
+CACHE_VERSION = 1
+REFRESH_AFTER = 60
+# a refresh marker older than this belongs to a died refresh
+REFRESH_TIMEOUT = 600
+
+
+def _get_cache_file(root, key):
+    root = Path(root).absolute()
+    project = f"{root.name}-{hashlib.sha1(str(root).encode()).hexdigest()[:8]}"
+    name = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return (
+        Path(os.path.expanduser("~/.cache/wodoo"))
+        / "completion"
+        / project
+        / f"{name}.json"
+    )
+
+
+def _get_mtimes(paths):
+    result = {}
+    for path in paths:
+        try:
+            result[str(path)] = os.stat(path).st_mtime_ns
+        except OSError:
+            result[str(path)] = None
+    return result
+
+
+def _load(cache_file):
+    try:
+        entry = json.loads(cache_file.read_text())
+    except (OSError, ValueError):
+        return None
+    if entry.get("version") != CACHE_VERSION:
+        return None
+    return entry
+
+
+def _store(cache_file, values, watch):
+    entry = {
+        "version": CACHE_VERSION,
+        "created": time.time(),
+        "mtimes": _get_mtimes(watch),
+        "values": values,
+    }
+    tmp = cache_file.parent / f".{cache_file.name}.{os.getpid()}"
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps(entry))
+        os.replace(tmp, cache_file)
+    except OSError:
+        # e.g. read only ~/.cache - completion works without the cache
+        pass
+    return values
+
+
+def _refresh_in_background(cache_file, compute):
+    marker = cache_file.parent / f".{cache_file.name}.refreshing"
+    try:
+        if time.time() - marker.stat().st_mtime < REFRESH_TIMEOUT:
+            return
+        marker.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+    except OSError:
+        return
+
+    try:
+        pid = os.fork()
+    except OSError:
+        marker.unlink()
+        return
+    if pid:
+        return
+    # the shell waits until stdout of the completion is closed
+    try:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        _store(cache_file, *compute())
+    finally:
+        try:
+            marker.unlink()
+        finally:
+            os._exit(0)
+
+
+def get(root, key, compute, background=False):
+    """
+    Returns the cached values of key in project root.
+
+    compute() returns (values, watch): json serializable values and the
+    paths whose mtimes invalidate them.
+    """
+    cache_file = _get_cache_file(root, key)
+    entry = _load(cache_file)
+    if entry is None:
+        return _store(cache_file, *compute())
+
+    changed = _get_mtimes(entry["mtimes"]) != entry["mtimes"]
+    if not background:
+        if changed:
+            return _store(cache_file, *compute())
+        return entry["values"]
+
+    if changed or time.time() - entry["created"] > REFRESH_AFTER:
+        _refresh_in_background(cache_file, compute)
+    return entry["values"]
@@ -24,6 +24,7 @@ default_dirs = {
     'user_conf_dir': "~/.odoo",
     'cicd_delegator': '~/.odoo/cicd_delegator',
     'images': '~/.odoo/images',
+    'wal_archive': '~/.odoo/wal_archive/${project_name}',
 }
 
 default_files = {
@@ -1,14 +1,16 @@
 #!/usr/bin/env python3
 import os
+import json
+import bisect
+import shutil
+from array import array
 from glob import glob
 import arrow
 from pathlib import Path
 import calendar
 import humanize
 import argparse
-import pathlib
 import logging
-import datetime as dt
 import click
 from .cli import cli, pass_config, Commands
 from .tools import abort
@@ -19,51 +21,90 @@ DTF = "%Y-%m-%d %H:%M:%S"
 log = logging.getLogger()
 
 
-def _get_files_if_dir(path):
-    for path in glob(str(path)):
-        path = Path(path)
-        if not path.name:
+def _is_backup_set(path):
+    from .incremental_backup import is_backup_set
+
+    return is_backup_set(path)
+
+
+def _dir_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            size += os.lstat(os.path.join(root, name)).st_size
+    return size
+
+
+def _walk(folder):
+    """
+    Yields (path, stat, is_set) of the files below folder; incremental
+    backup sets are yielded as one entry and not entered.
+    """
+    with os.scandir(folder) as it:
+        entries = list(it)
+    for entry in entries:
+        if entry.name.startswith("."):
             continue
-        if path.is_dir():
-            for file in path.glob("*"):
-                if file.is_file():
-                    yield next(_get_files_if_dir(file))
-        elif path.is_file():
-            mtime = arrow.get(path.stat().st_mtime)
-            is_dir = path.is_dir()
-            is_file = path.is_file()
-            log.debug(f"{path}: mtime {mtime} dir? {is_dir} file? {is_file}")
-            yield (path, mtime)
-
-
-def genPathInfos(arg_paths):
-
-    for arg_path in arg_paths:
-        po = pathlib.Path(arg_path)
-        log.debug(po)
-        yield from _get_files_if_dir(arg_path)
-
-
-def rm(path_list, dry_run):
-    now = arrow.utcnow()
-    log.info("Starting deletion:")
-    for path in path_list:
-        if path.is_file():
-            if dry_run:
-                modified = arrow.get(path.stat().st_mtime)
-
-                click.secho(
-                    "dry run -- would delete:"
-                    f"{modified.strftime(DTF)}"
-                    f" {path} "
-                    f" {humanize.naturaldelta(now - modified)}"
-                )
+        if entry.is_dir(follow_symlinks=False):
+            if _is_backup_set(entry.path):
+                yield entry.path, entry.stat(follow_symlinks=False), True
             else:
-                path.unlink()
-                log.info(f"Deleted: {path}")
-
+                yield from _walk(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            yield entry.path, entry.stat(follow_symlinks=False), False
+
+
+class Files(object):
+    """
+    The files to judge, stat'ed once: paths and parallel arrays of mtime and
+    size, sorted by mtime. Sidecars (<dump>.meta.json) are not judged but
+    follow their dump.
+    """
+
+    def __init__(self, arg_paths):
+        from .dump_catalog import SIDECAR_SUFFIX
+
+        found = {}
+        for arg_path in arg_paths:
+            for path in glob(str(arg_path)):
+                path = os.path.abspath(path)
+                if os.path.isdir(path) and not _is_backup_set(path):
+                    items = _walk(path)
+                else:
+                    items = [(path, os.lstat(path), _is_backup_set(path))]
+                for filepath, stat, is_set in items:
+                    found[filepath] = (stat, is_set)
+
+        self.sidecars = {}
+        for filepath in list(found):
+            if filepath.endswith(SIDECAR_SUFFIX):
+                dump = filepath[: -len(SIDECAR_SUFFIX)]
+                if dump in found:
+                    self.sidecars[dump] = filepath
+                    del found[filepath]
+
+        order = sorted(found, key=lambda x: found[x][0].st_mtime)
+        self.paths = order
+        self.is_set = [found[x][1] for x in order]
+        self.mtimes = array("d", (found[x][0].st_mtime for x in order))
+        self.sizes = array(
+            "q",
+            (
+                _dir_size(x) if found[x][1] else found[x][0].st_size
+                for x in order
+            ),
+        )
+
+    def __len__(self):
+        return len(self.paths)
+
+
+def get_bin_families(now=None):
+    """
+    The time bins by family; the bins of one family do not overlap and are
+    sorted by start. Of every bin the newest file is kept.
+    """
 
-def get_bins():
     def _return(x, y):
         return _hour_0(x), _hour_235959(y)
 
@@ -73,8 +114,9 @@ def get_bins():
     def _hour_235959(d):
         return d.replace(hour=23, minute=59, second=59)
 
+    now = now or arrow.get()
     winning_weekday = 6  # sunday
-    start = arrow.get()
+    start = now
     while start.weekday() != winning_weekday:
         start = start.shift(days=-1)
 
@@ -109,68 +151,117 @@ def get_bins():
 
     def get_years():
         for i in range(20):
-            year_end = arrow.get().replace(year=arrow.get().year - i, month=12, day=31)
+            year_end = now.replace(year=now.year - i, month=12, day=31)
             yield _return(
                 year_end.replace(day=1, month=1),
                 year_end,
             )
 
-    yield _return(start, start)
-    yield from get_weeks()
-    yield from get_months()
-    yield from get_quarters()
-    yield from get_years()
-
-
-def get_to_delete_files(path_list, days_notouch):
-    now = dt.datetime.utcnow()
-    log.debug(f"Now: {now}")
-    bins = {}
-    for bin in set(get_bins()):
-        bins.setdefault(bin, [])
-
-    keep_safe = set()
-    to_delete = []
-    for path, mt in genPathInfos(path_list):
-        if (arrow.utcnow() - mt).days <= days_notouch:
-            print("Ignoring", path)
-            keep_safe.add(path)
-            continue
-
-        for key in bins:
-            if mt >= key[0] and mt <= key[1]:
-                bins[key].append(path)
-        else:
-            to_delete.append(path)
-
-    # sort arrays by date reverse; at position[0] is the file
-    # that will survive
-    for k in bins.keys():
-        bins[k] = sorted(bins[k], key=lambda x: x.stat().st_mtime, reverse=True)
-
-    # store pole positions in safe array
-    [keep_safe.add(x[0]) for x in bins.values() if x]
-
-    # collect all victims
-    for files in bins.values():
-        to_delete += files[1:]
-
-    click.secho("==========================")
-    click.secho("Kept:\n")
-    size = print_files(sorted(keep_safe))
-    click.secho(f"Keeping {humanize.naturalsize(size)}")
-    click.secho("==========================")
+    return {
+        "sunday": [_return(start, start)],
+        "week": sorted(get_weeks()),
+        "month": sorted(get_months()),
+        "quarter": sorted(get_quarters()),
+        "year": sorted(get_years()),
+    }
 
-    return list(set(to_delete) - keep_safe)
 
-
-def print_files(files):
-    size = 0
-    for path in list(set(files)):
-        size += path.stat().st_size
-        date = arrow.get(path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
-        click.secho(f"{path}: {date}")
-    return size
+def get_bins():
+    for bins in get_bin_families().values():
+        yield from bins
+
+
+def _ts(value):
+    return value.datetime.timestamp()
+
+
+def make_plan(files, days_notouch, now=None):
+    """
+    Decides for every file; returns a list of dicts with path, mtime, size,
+    action (keep/delete) and reason, oldest first.
+    """
+    now = now or arrow.get()
+    notouch_since = _ts(now) - (days_notouch + 1) * 86400
+    reasons = [None] * len(files)
+
+    for i, mtime in enumerate(files.mtimes):
+        if mtime > notouch_since:
+            reasons[i] = f"younger than {days_notouch} days"
+
+    for family, bins in get_bin_families(now).items():
+        starts = [_ts(x[0]) for x in bins]
+        ends = [_ts(x[1]) for x in bins]
+        newest = {}
+        # files are sorted by mtime, so the last one of a bin wins
+        for i, mtime in enumerate(files.mtimes):
+            if mtime > notouch_since:
+                continue
+            nr = bisect.bisect_right(starts, mtime) - 1
+            if nr >= 0 and mtime <= ends[nr]:
+                newest[nr] = i
+        for nr, i in newest.items():
+            if not reasons[i]:
+                reasons[i] = f"newest of {family} {bins[nr][0].strftime('%Y-%m-%d')}"
+
+    # incremental backup sets need the sets of their chain
+    from .incremental_backup import load_manifest
+
+    index = {path: i for i, path in enumerate(files.paths)}
+    for i, path in enumerate(files.paths):
+        if not files.is_set[i] or not reasons[i]:
+            continue
+        for name in load_manifest(path).get("chain", []):
+            j = index.get(os.path.join(os.path.dirname(path), name))
+            if j is not None and not reasons[j]:
+                reasons[j] = f"needed by backup set {os.path.basename(path)}"
+
+    return [
+        {
+            "path": path,
+            "mtime": arrow.get(files.mtimes[i]).strftime(DTF),
+            "size": files.sizes[i],
+            "action": "keep" if reasons[i] else "delete",
+            "reason": reasons[i] or "not the newest of any bin",
+            "sidecar": files.sidecars.get(path),
+        }
+        for i, path in enumerate(files.paths)
+    ]
+
+
+def print_plan(plan, as_json):
+    if as_json:
+        click.echo(json.dumps(plan, indent=4))
+        return
+    for action in ["keep", "delete"]:
+        items = [x for x in plan if x["action"] == action]
+        click.secho("==========================")
+        click.secho(f"{action.capitalize()}:\n")
+        for item in items:
+            click.secho(f"{item['mtime']} {item['path']}: {item['reason']}")
+        size = sum(x["size"] for x in items)
+        click.secho(f"{action.capitalize()} {len(items)}: {humanize.naturalsize(size)}")
+
+
+def execute_plan(plan, dry_run):
+    for item in plan:
+        if item["action"] != "delete":
+            continue
+        if dry_run:
+            continue
+        # a concurrent cleanup of the same folder may have been faster
+        try:
+            if os.path.isdir(item["path"]):
+                shutil.rmtree(item["path"])
+            else:
+                os.unlink(item["path"])
+        except FileNotFoundError:
+            continue
+        if item["sidecar"]:
+            try:
+                os.unlink(item["sidecar"])
+            except FileNotFoundError:
+                pass
+        log.info(f"Deleted: {item['path']}")
 
 
 @cli.command(
@@ -194,16 +285,15 @@ def print_files(files):
     default=1,
     help="Do not touch the last X days from today. Defaults to 1=yesterday",
 )
+@click.option("--json", "as_json", is_flag=True, help="Print the plan as json")
 @pass_config
-def daddy_cleanup(config, path, dry_run, dont_touch):
+def daddy_cleanup(config, path, dry_run, dont_touch, as_json):
     if config.verbose:
         log.setLevel(logging.DEBUG)
     path = [Path(os.getcwd()) / x for x in path]
-    deletion_candidates = list(sorted(set(get_to_delete_files(path, dont_touch))))
-    if deletion_candidates:
-        size = print_files(deletion_candidates)
-        print("Going to delete ", humanize.naturalsize(size))
-        rm(deletion_candidates, dry_run=dry_run)
+    plan = make_plan(Files(path), dont_touch)
+    print_plan(plan, as_json)
+    execute_plan(plan, dry_run=dry_run)
 
 
 @cli.command()
@@ -220,28 +310,26 @@ def daddy_cleanup(config, path, dry_run, dont_touch):
     default=1,
     help="Do not touch the last X days from today. Defaults to 1=yesterday",
 )
+@click.option("--json", "as_json", is_flag=True, help="Print the plan as json")
 @pass_config
-def keep_last_file_of_day(config, path, dry_run, dont_touch):
+def keep_last_file_of_day(config, path, dry_run, dont_touch, as_json):
     if config.verbose:
         log.setLevel(logging.DEBUG)
-    files = []
-    for path in path:
-        for file, mtime in _get_files_if_dir(path):
-            if (arrow.utcnow() - mtime).days <= dont_touch:
-                continue
-            files.append((file, mtime))
-    if not files:
+    files = Files(path)
+    notouch_since = _ts(arrow.get()) - (dont_touch + 1) * 86400
+    old = [i for i, mtime in enumerate(files.mtimes) if mtime <= notouch_since]
+    if not old:
         abort("No files matching")
-    size = 0
-    files = sorted(files, key=lambda x: x[1], reverse=False)
-    for file, mtime in files[:-1]:
-        size += file.stat().st_size
-        if dry_run:
-            click.secho(f"Would delete: {file}", fg="yellow")
-        else:
-            file.unlink()
-            click.secho(f"Deleted: {file}", fg="red")
-    click.secho(f"Keeping: {files[-1][0]}", fg="green")
-    click.secho(
-        f"{'Theoretically' if dry_run else ''} Deleted size: {humanize.naturalsize(size)}"
-    )
+    plan = [
+        {
+            "path": files.paths[i],
+            "mtime": arrow.get(files.mtimes[i]).strftime(DTF),
+            "size": files.sizes[i],
+            "action": "keep" if i == old[-1] else "delete",
+            "reason": "newest file" if i == old[-1] else "not the newest file",
+            "sidecar": files.sidecars.get(files.paths[i]),
+        }
+        for i in old
+    ]
+    print_plan(plan, as_json)
+    execute_plan(plan, dry_run=dry_run)
@@ -0,0 +1,264 @@
+"""
+Catalog of the dump files in a dumps directory.
+
+Every backup writes a sidecar <dumpfile>.meta.json with type, codec,
+postgres version, database name and row estimates of the tables.
+The directory index .wodoo_catalog.json keeps these records together with
+size and mtime of the dump; listing the dumps reads the index and one
+scandir instead of touching the files. Dumps without sidecar (copied from
+elsewhere, older backups) are added with the values that can be told from
+the first bytes; their type is filled in when it is needed for the first
+time. So is the sha256 of all dumps, as it means reading the whole file.
+"""
+import os
+import json
+import hashlib
+import arrow
+import click
+from pathlib import Path
+from .tools import _execute_sql
+from .tools import __concurrent_safe_write_file as _safe_write_file
+
+CATALOG_FILENAME = ".wodoo_catalog.json"
+SIDECAR_SUFFIX = ".meta.json"
+IGNORE_SUFFIXES = [SIDECAR_SUFFIX, ".tmp.safewritefile"]
+
+MAGIC_CODECS = [
+    (b"\x1f\x8b", "gzip"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+    (b"BZh", "bzip2"),
+    (b"\xfd7zXZ", "xz"),
+    (b"PK\x03\x04", "zip"),
+    (b"PGDMP", "pg_custom"),
+]
+
+
+def get_sidecar_path(filepath):
+    filepath = Path(filepath)
+    return filepath.parent / (filepath.name + SIDECAR_SUFFIX)
+
+
+def _get_catalog_file(directory):
+    return Path(directory) / CATALOG_FILENAME
+
+
+def _signature(stat):
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _is_dump(name):
+    if name.startswith("."):
+        return False
+    return not any(name.endswith(x) for x in IGNORE_SUFFIXES)
+
+
+def get_codec(filepath):
+    filepath = Path(filepath)
+    if filepath.is_dir():
+        return "directory"
+    with open(filepath, "rb") as file:
+        head = file.read(8)
+    for magic, codec in MAGIC_CODECS:
+        if head.startswith(magic):
+            return codec
+    return "none"
+
+
+def get_file_hash(filepath):
+    """
+    sha256 of the file; of directory dumps over names and content of all
+    files.
+    """
+    filepath = Path(filepath)
+    hash = hashlib.sha256()
+    if filepath.is_dir():
+        files = sorted(x for x in filepath.rglob("*") if x.is_file())
+    else:
+        files = [filepath]
+    for path in files:
+        if path != filepath:
+            hash.update(str(path.relative_to(filepath)).encode("utf8"))
+        with open(path, "rb") as file:
+            while True:
+                block = file.read(1024 * 1024)
+                if not block:
+                    break
+                hash.update(block)
+    return hash.hexdigest()
+
+
+def _read_json(path):
+    try:
+        return json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_catalog(directory, catalog):
+    try:
+        _safe_write_file(
+            _get_catalog_file(directory), json.dumps(catalog, indent=4)
+        )
+    except OSError as ex:
+        # read only dumps directories are fine; the catalog is just not kept
+        click.secho(f"Could not write dump catalog: {ex}", fg="yellow")
+
+
+def _heal_entry(path, stat):
+    """
+    Entry for a dump from its sidecar or - if missing or outdated - from
+    the first bytes of the file. Copies of a dump get another mtime, so
+    the sidecar is matched by size; the sha256 is only kept if the mtime
+    matches too, as a dump overwritten with one of the same size would
+    keep the hash of the old one.
+    """
+    sidecar = _read_json(get_sidecar_path(path))
+    if sidecar and sidecar.get("size") == stat.st_size:
+        entry = sidecar
+        if entry.get("signature") != _signature(stat):
+            entry.pop("sha256", None)
+    else:
+        entry = {"codec": get_codec(path)}
+    entry["signature"] = _signature(stat)
+    entry["ctime"] = stat.st_ctime
+    entry["mtime"] = stat.st_mtime
+    entry["size"] = stat.st_size
+    return entry
+
+
+def get_catalog(directory):
+    """
+    Returns {filename: entry} of all dumps in directory; the index is
+    updated for new, changed and removed files.
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return {}
+    catalog = _read_json(_get_catalog_file(directory))
+    changed = False
+    names = set()
+    with os.scandir(directory) as it:
+        for direntry in it:
+            if not _is_dump(direntry.name):
+                continue
+            try:
+                stat = direntry.stat()
+            except OSError:
+                continue
+            names.add(direntry.name)
+            entry = catalog.get(direntry.name)
+            if entry and entry.get("signature") == _signature(stat):
+                continue
+            catalog[direntry.name] = _heal_entry(Path(direntry.path), stat)
+            changed = True
+    for name in set(catalog) - names:
+        del catalog[name]
+        changed = True
+    if changed:
+        _write_catalog(directory, catalog)
+    return catalog
+
+
+def get_entry(filepath):
+    filepath = Path(filepath).absolute()
+    return get_catalog(filepath.parent).get(filepath.name)
+
+
+def update_entry(filepath, values, sidecar=False):
+    """
+    Stores values for the dump in the index; with sidecar also in the
+    sidecar file.
+    """
+    filepath = Path(filepath).absolute()
+    catalog = get_catalog(filepath.parent)
+    entry = catalog.setdefault(
+        filepath.name, _heal_entry(filepath, filepath.stat())
+    )
+    entry.update(values)
+    _write_catalog(filepath.parent, catalog)
+    if sidecar or get_sidecar_path(filepath).exists():
+        _write_sidecar(filepath, entry)
+    return entry
+
+
+def _write_sidecar(filepath, entry):
+    data = {k: v for k, v in entry.items() if k not in ["ctime", "mtime"]}
+    try:
+        _safe_write_file(get_sidecar_path(filepath), json.dumps(data, indent=4))
+    except OSError as ex:
+        click.secho(f"Could not write {get_sidecar_path(filepath)}: {ex}", fg="yellow")
+
+
+def get_sha256(filepath):
+    entry = get_entry(filepath) or {}
+    if entry.get("sha256"):
+        return entry["sha256"]
+    click.secho(f"Calculating hash of {filepath}", fg="yellow")
+    sha = get_file_hash(filepath)
+    update_entry(filepath, {"sha256": sha})
+    return sha
+
+
+def get_dump_type(filepath, detect):
+    """
+    :param detect: called with the filepath if the type is not known yet
+    """
+    entry = get_entry(filepath) or {}
+    if entry.get("type"):
+        return entry["type"]
+    dump_type = detect(filepath)
+    update_entry(filepath, {"type": dump_type})
+    return dump_type
+
+
+def get_row_estimates(conn):
+    """
+    Estimated rows per table, keyed by the schema qualified table name like
+    ProgressMonitor samples it.
+    """
+    rows = _execute_sql(
+        conn,
+        (
+            "select quote_ident(n.nspname) || '.' || quote_ident(c.relname), "
+            "c.reltuples::bigint "
+            "from pg_class c "
+            "join pg_namespace n on n.oid = c.relnamespace "
+            "where c.relkind in ('r', 'p') "
+            "and n.nspname not in ('pg_catalog', 'information_schema') "
+            "and n.nspname not like 'pg_toast%'"
+        ),
+        fetchall=True,
+    )
+    return {name: max(int(estimate), 0) for name, estimate in rows}
+
+
+def get_server_version(conn):
+    return _execute_sql(conn, "show server_version", fetchone=True)[0]
+
+
+def register_backup(filepath, dump_format, detect, conn=None):
+    """
+    Writes sidecar and catalog entry of a freshly created dump.
+
+    :param dump_format: format the dump was created with (custom, plain, ..)
+    :param detect: dump type detection, see get_dump_type
+    :param conn: connection to the dumped database; for version and row
+    estimates
+    """
+    filepath = Path(filepath).absolute()
+    values = {
+        "format": dump_format,
+        "type": detect(filepath),
+        "codec": get_codec(filepath),
+        "created": arrow.get().isoformat(),
+    }
+    if conn:
+        values["dbname"] = conn.dbname
+        try:
+            values["pg_version"] = get_server_version(conn)
+            values["table_row_estimates"] = get_row_estimates(conn)
+        except Exception as ex:
+            click.secho(f"Could not collect dump meta data: {ex}", fg="yellow")
+    # the sha256 is calculated by get_sha256 when it is needed - hashing
+    # here would read every dump a second time
+    return update_entry(filepath, values, sidecar=True)
@@ -0,0 +1,107 @@
+"""
+Shared pool of filestore files per host.
+
+Odoo names filestore files after the sha1 of their content
+(<2 chars>/<sha1>) and never changes them in place, so equal files of
+different databases can be one inode. The pool (odoo_data_dir/pool)
+holds one link of every file; the filestores hold further hardlinks. The
+link count is the reference count: a pool file with a single link is not
+used by any filestore anymore.
+
+Pool and filestores must be on the same filesystem.
+"""
+import os
+import uuid
+from pathlib import Path
+import click
+
+
+def get_pool_dir(config):
+    return config.dirs["odoo_data_dir"] / "pool"
+
+
+def _iter_files(folder):
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            yield Path(root) / name
+
+
+def _replace_with_link(source, path):
+    tmp = path.parent / f".{path.name}.{uuid.uuid4().hex}"
+    os.link(source, tmp)
+    os.replace(tmp, path)
+
+
+def dedup(folder, pool):
+    """
+    Turns the files of folder into hardlinks of the pool; files not in the
+    pool yet are added. Returns (files linked, bytes saved).
+    """
+    folder, pool = Path(folder), Path(pool)
+    linked, saved = 0, 0
+    for path in _iter_files(folder):
+        relpath = path.relative_to(folder)
+        if relpath.name.startswith(".") or relpath.parts[0] == "checklist":
+            continue
+        pool_path = pool / relpath
+        stat = path.stat()
+        if not pool_path.exists():
+            pool_path.parent.mkdir(parents=True, exist_ok=True)
+            os.link(path, pool_path)
+            continue
+        pool_stat = pool_path.stat()
+        if pool_stat.st_ino == stat.st_ino:
+            continue
+        if pool_stat.st_size != stat.st_size:
+            click.secho(f"Size differs from pool, not linked: {relpath}", fg="red")
+            continue
+        _replace_with_link(pool_path, path)
+        linked += 1
+        if stat.st_nlink == 1:
+            saved += stat.st_size
+    return linked, saved
+
+
+def link_tree(source, dest):
+    """
+    Copies the filestore source to dest as hardlinks (no data is copied).
+    """
+    source, dest = Path(source), Path(dest)
+    for root, dirs, files in os.walk(source):
+        target_dir = dest / Path(root).relative_to(source)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for name in files:
+            target = target_dir / name
+            if target.exists():
+                target.unlink()
+            os.link(Path(root) / name, target)
+
+
+def gc(pool, dry_run=False):
+    """
+    Removes pool files without other links. Returns (count, bytes).
+    """
+    count, size = 0, 0
+    for path in _iter_files(pool):
+        stat = path.stat()
+        if stat.st_nlink > 1:
+            continue
+        count += 1
+        size += stat.st_size
+        if not dry_run:
+            path.unlink()
+    return count, size
+
+
+def stats(pool):
+    """
+    Returns (files, bytes in pool, bytes the filestores would need without
+    the pool).
+    """
+    count, size, logical = 0, 0, 0
+    for path in _iter_files(pool):
+        stat = path.stat()
+        count += 1
+        size += stat.st_size
+        logical += stat.st_size * max(stat.st_nlink - 1, 0)
+    return count, size, logical
@@ -0,0 +1,121 @@
+"""
+Snapshots of the filestore that belong to a database snapshot.
+
+Stored in odoo_data_dir/filestore_snapshots/<dbname>/<snapshot name>. If
+the filestore is a btrfs subvolume, a readonly btrfs snapshot is taken;
+otherwise the snapshot is a hardlink farm (filestore files are write-once,
+so sharing inodes with the live filestore is safe and costs no space).
+
+A restore is prepared next to the filestore first and swapped in by
+rename only after the database snapshot was restored.
+"""
+import os
+import shutil
+import subprocess
+from pathlib import Path
+import click
+from .tools import search_env_path
+from .tools import get_filesystem_of_folder
+from .tools import _get_filestore_folder
+from . import filestore_pool
+
+# inode number of the root of every btrfs subvolume
+BTRFS_SUBVOLUME_INODE = 256
+
+
+def get_snapshot_root(config):
+    return config.dirs["odoo_data_dir"] / "filestore_snapshots" / config.dbname
+
+
+def get_snapshot_path(config, name):
+    return get_snapshot_root(config) / name
+
+
+def exists(config, name):
+    return get_snapshot_path(config, name).exists()
+
+
+def _is_btrfs_subvolume(path):
+    path = Path(path)
+    return (
+        path.exists()
+        and path.stat().st_ino == BTRFS_SUBVOLUME_INODE
+        and get_filesystem_of_folder(path) == "btrfs"
+    )
+
+
+def _btrfs_subvolume(*args):
+    subprocess.check_call(
+        ["sudo", search_env_path("btrfs"), "subvolume"] + [str(x) for x in args]
+    )
+
+
+def _remove(path):
+    path = Path(path)
+    if not path.exists():
+        return
+    if _is_btrfs_subvolume(path):
+        _btrfs_subvolume("delete", path)
+    else:
+        shutil.rmtree(path)
+
+
+def _copy(source, dest, readonly=False):
+    if _is_btrfs_subvolume(source):
+        _btrfs_subvolume("snapshot", *(["-r"] if readonly else []), source, dest)
+    else:
+        filestore_pool.link_tree(source, dest)
+
+
+def save(config, name):
+    """
+    Returns False if there is no filestore to snapshot.
+    """
+    source = _get_filestore_folder(config)
+    if not source.exists():
+        return False
+    dest = get_snapshot_path(config, name)
+    _remove(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    _copy(source, dest, readonly=True)
+    return True
+
+
+def prepare_restore(config, name):
+    """
+    Materializes the snapshot beside the filestore; returns the path for
+    commit_restore/abort_restore.
+    """
+    filestore = _get_filestore_folder(config)
+    prepared = filestore.parent / f".{filestore.name}.restoring"
+    _remove(prepared)
+    prepared.parent.mkdir(parents=True, exist_ok=True)
+    _copy(get_snapshot_path(config, name), prepared)
+    return prepared
+
+
+def commit_restore(config, prepared):
+    filestore = _get_filestore_folder(config)
+    old = filestore.parent / f".{filestore.name}.old"
+    _remove(old)
+    if filestore.exists():
+        os.rename(filestore, old)
+    os.rename(prepared, filestore)
+    _remove(old)
+    click.secho(f"Filestore {filestore} restored.", fg="green")
+
+
+def abort_restore(config, prepared):
+    _remove(prepared)
+
+
+def remove(config, name):
+    _remove(get_snapshot_path(config, name))
+
+
+def clear_all(config):
+    root = get_snapshot_root(config)
+    if not root.exists():
+        return
+    for path in root.iterdir():
+        _remove(path)
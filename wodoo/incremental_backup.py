@@ -0,0 +1,308 @@
+"""
+Incremental logical backups.
+
+A backup set is a directory in the dumps folder with
+- schema.dump: pg_dump --schema-only of the whole database (custom format)
+- data/: pg_dump --data-only of the tables that changed since the previous
+  set (directory format)
+- wodoo_incremental.json: the manifest; lists every table with the set
+  that holds its data, the change indicators of the table and the values
+  of the sequences
+
+A table is dumped again if its insert/update/delete counters
+(pg_stat_user_tables), the size of its main fork, its relfilenode
+(truncate, vacuum full) or its columns changed. The indicators stored in
+the manifest are read before the snapshot the data is dumped in is
+exported, the ones that decide what to dump STATS_SETTLE_SECONDS after
+it.
+
+This is a best-effort heuristic, not a guarantee: the counters are not
+transactional and backends flush them with a delay that can exceed
+STATS_SETTLE_SECONDS on busy servers. A change committed before the
+snapshot whose counters are not flushed yet and that does not grow the
+table (updates within existing pages, deletes) is missed - the set then
+refers to the older set for that table. Once the counters arrive they
+differ from the stored ones, so the next set dumps the table. Use a full
+backup (or a short chain) where every set must be exact.
+
+Restoring a set restores schema.dump, the data of every table from the
+set named in the manifest, the sequences and finally the post-data part
+(indexes, constraints) of schema.dump.
+"""
+import json
+import time
+import arrow
+import click
+from pathlib import Path
+from .tools import _execute_sql
+from . import restore_engine
+
+MANIFEST_FILENAME = "wodoo_incremental.json"
+MANIFEST_VERSION = 1
+SCHEMA_FILENAME = "schema.dump"
+DATA_DIRNAME = "data"
+# pg_stat counters are flushed by idle backends after up to 10 seconds
+STATS_SETTLE_SECONDS = 11
+
+
+def is_backup_set(path):
+    return (Path(path) / MANIFEST_FILENAME).exists()
+
+
+def load_manifest(path):
+    return json.loads((Path(path) / MANIFEST_FILENAME).read_text())
+
+
+def _get_identity(conn):
+    """
+    A set can only build on a previous set of the same database; recreated
+    databases and resetted statistics start a new chain.
+    """
+    system_identifier, oid, stats_reset = _execute_sql(
+        conn,
+        (
+            "select (select system_identifier from pg_control_system()), "
+            "d.oid, s.stats_reset "
+            "from pg_database d "
+            "left join pg_stat_database s on s.datid = d.oid "
+            "where d.datname = current_database()"
+        ),
+        fetchone=True,
+    )
+    return {
+        "system_identifier": str(system_identifier),
+        "database_oid": oid,
+        "stats_reset": stats_reset.isoformat() if stats_reset else None,
+    }
+
+
+def _get_table_states(conn):
+    rows = _execute_sql(
+        conn,
+        (
+            "select n.nspname || '.' || c.relname, c.relfilenode, "
+            "pg_relation_size(c.oid), "
+            "coalesce(s.n_tup_ins, 0), coalesce(s.n_tup_upd, 0), "
+            "coalesce(s.n_tup_del, 0), "
+            "md5(string_agg(a.attname || ':' || a.atttypid::text, ',' "
+            "order by a.attnum)) "
+            "from pg_class c "
+            "join pg_namespace n on n.oid = c.relnamespace "
+            "join pg_attribute a on a.attrelid = c.oid "
+            "and a.attnum > 0 and not a.attisdropped "
+            "left join pg_stat_user_tables s on s.relid = c.oid "
+            "where c.relkind = 'r' "
+            "and n.nspname not in ('pg_catalog', 'information_schema') "
+            "and n.nspname not like 'pg_toast%' "
+            "group by 1, 2, 3, 4, 5, 6"
+        ),
+        fetchall=True,
+    )
+    return {
+        name: {
+            "relfilenode": relfilenode,
+            "size": size,
+            "counters": [inserted, updated, deleted],
+            "columns": columns,
+        }
+        for name, relfilenode, size, inserted, updated, deleted, columns in rows
+    }
+
+
+def _get_sequences(cr):
+    cr.execute(
+        "select schemaname || '.' || sequencename, last_value from pg_sequences"
+    )
+    return {
+        name: [last_value, True] if last_value is not None else [1, False]
+        for name, last_value in cr.fetchall()
+    }
+
+
+def _is_unchanged(state, previous_state):
+    if not previous_state:
+        return False
+    return all(
+        state[key] == previous_state.get(key)
+        for key in ["relfilenode", "size", "counters", "columns"]
+        # manifests of older versions have no size
+        if key in previous_state
+    )
+
+
+def find_previous(dumps_path, identity, max_chain):
+    """
+    Newest set in dumps_path of the same database, if its chain is shorter
+    than max_chain.
+    """
+    candidates = []
+    for path in Path(dumps_path).iterdir():
+        if not path.is_dir() or not is_backup_set(path):
+            continue
+        manifest = load_manifest(path)
+        if manifest.get("identity") != identity:
+            continue
+        candidates.append((manifest["created"], path.name, manifest))
+    if not candidates:
+        return None, None
+    created, name, manifest = sorted(candidates)[-1]
+    if len(manifest["chain"]) >= max_chain:
+        click.secho(
+            f"Chain of {name} has {len(manifest['chain'])} sets - "
+            "starting a new one.",
+            fg="yellow",
+        )
+        return None, None
+    if not all((Path(dumps_path) / x).is_dir() for x in manifest["chain"]):
+        click.secho(f"Chain of {name} is incomplete - starting a new one.", fg="yellow")
+        return None, None
+    return name, manifest
+
+
+def backup(runner, conn, set_name, workers=1, exclude_tables=None, max_chain=7):
+    """
+    Creates the backup set set_name in the dumps path of the runner.
+
+    :param conn: DBConnection to the database to back up
+    """
+    exclude_tables = exclude_tables or []
+    set_path = runner.dumps_path / set_name
+    set_path.mkdir(parents=True)
+    identity = _get_identity(conn)
+    previous_name, previous = find_previous(runner.dumps_path, identity, max_chain)
+    if previous_name:
+        click.secho(f"Building on backup set {previous_name}", fg="yellow")
+
+    states_before = _get_table_states(conn)
+    snapshot_conn = conn.get_psyco_connection()
+    snapshot_conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    try:
+        cr = snapshot_conn.cursor()
+        cr.execute("select pg_export_snapshot()")
+        snapshot = cr.fetchone()[0]
+        sequences = _get_sequences(cr)
+        time.sleep(STATS_SETTLE_SECONDS)
+        states = _get_table_states(conn)
+
+        tables, changed = {}, []
+        for name, state in states.items():
+            if name.split(".", 1)[1] in exclude_tables:
+                continue
+            previous_table = (previous or {}).get("tables", {}).get(name)
+            # new tables since states_before are dumped, but not recorded
+            # as known; so they are dumped next time again
+            stored = states_before.get(name, dict(state, counters=None))
+            if _is_unchanged(state, previous_table):
+                tables[name] = dict(stored, set=previous_table["set"])
+            else:
+                tables[name] = dict(stored, set=set_name)
+                changed.append(name)
+        click.secho(
+            f"{len(changed)} of {len(tables)} tables changed.", fg="yellow"
+        )
+
+        runner.dump(
+            [
+                "--snapshot",
+                snapshot,
+                "--schema-only",
+                "-Fc",
+                "-f",
+                runner.path(f"{set_name}/{SCHEMA_FILENAME}"),
+            ]
+        )
+        if changed:
+            args = [
+                "--snapshot",
+                snapshot,
+                "--data-only",
+                "-Fd",
+                "-j",
+                str(workers),
+                "-f",
+                runner.path(f"{set_name}/{DATA_DIRNAME}"),
+            ]
+            for name in changed:
+                args += ["-t", name]
+            runner.dump(args)
+    finally:
+        snapshot_conn.rollback()
+        snapshot_conn.close()
+
+    chain = sorted(set(x["set"] for x in tables.values()) | {set_name})
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "created": arrow.get().isoformat(),
+        "dbname": conn.dbname,
+        "identity": identity,
+        "previous": previous_name,
+        "chain": chain,
+        "tables": tables,
+        "sequences": sequences,
+    }
+    (set_path / MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=4))
+    return manifest
+
+
+def restore(runner, conn, set_name, workers=1, exclude_tables=None, ignore_errors=False):
+    """
+    Restores the backup set set_name (with the sets it refers to) into
+    conn.dbname.
+    """
+    exclude_tables = exclude_tables or []
+    manifest = load_manifest(runner.dumps_path / set_name)
+    missing = [x for x in manifest["chain"] if not (runner.dumps_path / x).is_dir()]
+    if missing:
+        raise Exception(f"Backup sets missing for {set_name}: {', '.join(missing)}")
+
+    schema_file = f"{set_name}/{SCHEMA_FILENAME}"
+    toc = restore_engine.read_toc(runner, schema_file)
+    click.secho(f"Restoring schema of {set_name}", fg="yellow")
+    runner.restore(
+        schema_file,
+        [x for x in toc if x.section == "pre-data"],
+        ignore_errors=ignore_errors,
+    )
+
+    entries = []
+    for data_set in manifest["chain"]:
+        tables = [
+            name
+            for name, table in manifest["tables"].items()
+            if table["set"] == data_set
+        ]
+        if not tables:
+            continue
+        data_dir = f"{data_set}/{DATA_DIRNAME}"
+        entries += [
+            (data_dir, x)
+            for x in restore_engine.read_toc(runner, data_dir, exclude_tables)
+            if x.desc == "TABLE DATA" and f"{x.schema}.{x.tag}" in tables
+        ]
+    click.secho(
+        f"Restoring data of {len(entries)} tables from "
+        f"{len(manifest['chain'])} sets",
+        fg="yellow",
+    )
+    failed = restore_engine._parallel(
+        entries,
+        lambda x: runner.restore(x[0], [x[1]], ignore_errors=ignore_errors),
+        workers,
+    )
+    if failed:
+        raise Exception(
+            "Restore of tables failed: " + ", ".join(x[1].tag for x in failed)
+        )
+
+    for name, (value, is_called) in manifest["sequences"].items():
+        _execute_sql(
+            conn, "select setval(%s, %s, %s)", params=(name, value, is_called)
+        )
+
+    click.secho(f"Creating indexes and constraints of {set_name}", fg="yellow")
+    runner.restore(
+        schema_file,
+        [x for x in toc if x.section == "post-data"],
+        ignore_errors=ignore_errors,
+        workers=workers,
+    )
@@ -18,21 +18,32 @@ import inquirer
 import os
 import click
 from pathlib import Path
-from .tools import put_appendix_into_file
 from .tools import _dropdb
 from .tools import remove_webassets
 from .tools import __dc
+from .tools import __dcrun
+from .tools import __dc_popen
+from .tools import exec_file_in_path
 from .tools import _execute_sql
+from .tools import _exists_db
 from .tools import __rename_db_drop_target
 from .tools import _remove_postgres_connections
 from .tools import _get_dump_files
-from .tools import _binary_zip
 from .tools import autocleanpaper
 from .tools import _shell_complete_file
 from .cli import cli, pass_config, Commands
 from .lib_clickhelpers import AliasedGroup
 from .tools import ensure_project_name
 from .tools import _get_filestore_folder
+from . import restore_templates
+from . import restore_engine
+from . import dump_catalog
+from . import incremental_backup
+from . import wal_archive
+from . import wodoobin
+from . import filestore_pool
+from . import chunk_store
+from . import s3_target
 
 import inspect
 import os
@@ -47,6 +58,23 @@ try:
 except ImportError:
     click.echo("Failed to import python package: tabulate")
 
+# applied to the temporary RUN_POSTGRES container while restoring with --fast;
+# wal_level=minimal requires max_wal_senders=0 and archive_mode=off
+RESTORE_PROFILE = {
+    "fsync": "off",
+    "synchronous_commit": "off",
+    "full_page_writes": "off",
+    "wal_level": "minimal",
+    "max_wal_senders": "0",
+    "archive_mode": "off",
+    "autovacuum": "off",
+    "maintenance_work_mem": "1GB",
+    "max_wal_size": "16GB",
+}
+# dump types that pg_dump can write to stdout
+STREAM_DUMPTYPES = ["custom", "plain"]
+CHUNKED_DUMPTYPES = ["custom", "plain"]
+
 
 @cli.group(cls=AliasedGroup)
 @pass_config
@@ -133,6 +161,22 @@ def backup_all(ctx, config, filename):
     default=5,
 )
 @click.option("-j", "--worker", default=1)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help=(
+        "Backup set that dumps only the tables changed since the last set; "
+        "see BACKUP_INCREMENTAL_MAX_CHAIN"
+    ),
+)
+@click.option(
+    "--chunked/--not-chunked",
+    default=None,
+    help=(
+        "Custom/plain: store the dump deduplicated in the chunk store of the "
+        "dumps folder; default: BACKUP_CHUNKED"
+    ),
+)
 def backup_db(
     ctx,
     config,
@@ -144,20 +188,72 @@ def backup_db(
     pigz,
     compression,
     worker,
+    incremental,
+    chunked,
 ):
+    """
+    FILENAME - writes the dump to stdout; s3://bucket/key uploads it.
+    """
+    if s3_target.is_s3_url(filename):
+        if dumptype not in STREAM_DUMPTYPES:
+            abort(f"Only {', '.join(STREAM_DUMPTYPES)} dumps can be uploaded.")
+        if filename.endswith("/"):
+            filename += f"{config.project_name}.{config.dbname}.odoo.dump"
+        _backup_s3(
+            config,
+            filename,
+            dbname or config.DBNAME,
+            dumptype,
+            compression,
+            column_inserts,
+            exclude,
+            worker,
+        )
+        return filename
+
+    if filename == "-":
+        if dumptype not in STREAM_DUMPTYPES:
+            abort(f"Only {', '.join(STREAM_DUMPTYPES)} dumps can be streamed.")
+        _backup_stream(
+            config,
+            dbname or config.DBNAME,
+            dumptype,
+            compression,
+            column_inserts,
+            exclude,
+        )
+        return
+
+    if incremental:
+        filename = filename or arrow.get().strftime(
+            f"{config.project_name}.{config.dbname}.odoo.incr.%Y%m%d%H%M%S"
+        )
+    if chunked is None:
+        chunked = config.backup_chunked and dumptype in CHUNKED_DUMPTYPES
+    if chunked:
+        if dumptype not in CHUNKED_DUMPTYPES or incremental:
+            abort(f"Only {', '.join(CHUNKED_DUMPTYPES)} dumps can be chunked.")
+        filename = filename or f"{config.project_name}.{config.dbname}.odoo.chunks"
     filename = Path(
         filename or f"{config.project_name}.{config.dbname}.odoo" + ".dump.gz"
     )
     if len(filename.parts) == 1:
         filename = Path(config.dumps_path) / filename
 
-    if dumptype == "wodoobin":
+    dbname = dbname or config.DBNAME
+    if incremental:
+        _backup_incremental(config, filename, dbname, worker, exclude)
+        dumptype = "incremental"
+    elif chunked:
+        _backup_chunked(config, filename, dbname, dumptype, column_inserts, exclude)
+        dumptype = "wodoo_chunks"
+    elif dumptype == "wodoobin":
         _backup_wodoobin(ctx, config, filename)
     else:
         _backup_pgdump(
             config,
             filename,
-            dbname or config.DBNAME,
+            dbname,
             config.DB_HOST,
             config.DB_PORT,
             config.DB_USER,
@@ -169,9 +265,32 @@ def backup_db(
             pigz,
             exclude,
         )
+    dump_catalog.register_backup(
+        filename,
+        dumptype,
+        lambda path: _detect_dump_type(config, path),
+        conn=config.get_odoo_conn().clone(dbname=dbname),
+    )
     return filename
 
 
+@backup.command(name="chunks-gc")
+@click.option("-n", "--dry-run", is_flag=True)
+@pass_config
+def backup_chunks_gc(config, dry_run):
+    """
+    Removes the chunks of the chunk store no chunked dump refers to anymore.
+    """
+    import humanize
+
+    count, size = chunk_store.gc(config.dumps_path, dry_run)
+    click.secho(
+        f"{count} chunks {'found' if dry_run else 'removed'}: "
+        f"{humanize.naturalsize(size)}",
+        fg="green",
+    )
+
+
 @backup.command(name="files")
 @click.argument("filename", required=False, default="")
 @pass_config
@@ -201,15 +320,313 @@ def __get_default_backup_filename(config):
 @click.argument("filename")
 @pass_config
 def get_dump_type(config, filename):
-    dump_type = _add_cronjob_scripts(config)["postgres"].__get_dump_type(filename)
-    click.echo(dump_type)
+    filename = Path(filename)
+    if len(filename.parts) == 1:
+        filename = Path(config.dumps_path) / filename
+    click.echo(_get_dump_type(config, filename))
 
 
 @restore.command(name="list")
+@click.option(
+    "--remote",
+    is_flag=False,
+    flag_value="",
+    default=None,
+    help="Lists s3://bucket/prefix; without value S3_BACKUP_URL",
+)
+@pass_config
+def list_dumps(config, remote):
+    from tabulate import tabulate
+
+    if remote == "":
+        remote = config.s3_backup_url
+        if not remote:
+            abort("Please set S3_BACKUP_URL.")
+    if remote:
+        import humanize
+
+        rows = [
+            (
+                i + 1,
+                x["name"],
+                humanize.naturaltime(arrow.get() - arrow.get(x["mtime"])),
+                humanize.naturalsize(x["size"]),
+                x["type"],
+            )
+            for i, x in enumerate(s3_target.list_dumps(config, remote))
+        ]
+    else:
+        rows = _get_dump_files(Path(config.dumps_path))
+    click.echo(tabulate(rows, ["Nr", "Filename", "Age", "Size", "Type"]))
+
+
+def _detect_dump_type(config, filepath):
+    if incremental_backup.is_backup_set(filepath):
+        return "wodoo_incremental"
+    if chunk_store.is_chunk_index(filepath):
+        return "wodoo_chunks"
+    return _add_cronjob_scripts(config)["postgres"].__get_dump_type(filepath)
+
+
+def _get_dump_type(config, filepath):
+    return dump_catalog.get_dump_type(
+        filepath, lambda path: _detect_dump_type(config, path)
+    )
+
+
+@backup.command(name="wal-archive")
+@click.option("--disable", is_flag=True)
+@pass_config
+@click.pass_context
+def backup_wal_archive(ctx, config, disable):
+    """
+    Turns continuous WAL archiving of RUN_POSTGRES on (or off).
+    """
+    wal_archive.ensure_enabled(config)
+    Commands.invoke(ctx, "wait_for_container_postgres")
+    if not disable:
+        wal_archive.prepare_archive_dir(config)
+    wal_archive.set_archiving(config.get_odoo_conn(), not disable)
+    Commands.invoke(ctx, "restart", machines=["postgres"])
+    Commands.invoke(ctx, "wait_for_container_postgres")
+    click.secho(
+        f"WAL archiving {'disabled' if disable else 'enabled'}: "
+        f"{wal_archive.get_archive_dir(config)}",
+        fg="green",
+    )
+
+
+@backup.command(name="wal-basebackup")
+@click.option(
+    "--keep",
+    type=int,
+    help="Default from POSTGRES_WAL_ARCHIVE_KEEP; older base backups and WAL are removed",
+)
+@pass_config
+def backup_wal_basebackup(config, keep):
+    """
+    Base backup of the running postgres for point in time restores.
+    """
+    wal_archive.ensure_enabled(config)
+    name = wal_archive.basebackup(config, config.get_odoo_conn())
+    if keep is None:
+        keep = config.postgres_wal_archive_keep_as_int
+    wal_archive.prune(config, keep)
+    click.secho(f"Base backup {name} done.", fg="green")
+
+
+@restore.command(name="list-basebackups")
 @pass_config
-def list_dumps(config):
-    rows = _get_dump_files()
-    click.echo(tabulate(rows, ["Nr", "Filename", "Age", "Size"]))
+def list_basebackups(config):
+    from tabulate import tabulate
+
+    rows = [
+        (x["name"], x["start"], x["end"], x["wal_file"])
+        for x in wal_archive.list_basebackups(config)
+    ]
+    click.echo(tabulate(rows, ["Name", "Start", "End", "First WAL"]))
+
+
+@restore.command(name="pitr")
+@click.argument("timestamp")
+@click.option("--volume", help="Name of the new postgres volume")
+@click.option(
+    "--activate",
+    is_flag=True,
+    help="Set NAMED_ODOO_POSTGRES_VOLUME to the new volume",
+)
+@pass_config
+def restore_pitr(config, timestamp, volume, activate):
+    """
+    Point in time restore of RUN_POSTGRES into a new volume.
+
+    TIMESTAMP e.g. "2024-03-01 14:30:00+01:00"; the current volume is not
+    touched.
+    """
+    wal_archive.ensure_enabled(config)
+    target_time = arrow.get(timestamp)
+    backup = wal_archive.find_basebackup(config, target_time)
+    if not backup:
+        abort(f"No base backup finished before {target_time}")
+    volume = volume or f"{config.project_name}_pitr_{target_time.strftime('%Y%m%d%H%M%S')}"
+    wal_archive.restore_to_volume(
+        config, config.get_odoo_conn(), backup, target_time, volume
+    )
+    if activate:
+        from .myconfigparser import MyConfigParser
+
+        settings = MyConfigParser(config.files["project_settings"])
+        settings["NAMED_ODOO_POSTGRES_VOLUME"] = volume
+        settings.write()
+        click.secho(
+            "Please run 'odoo reload' and 'odoo up -d'; postgres replays the "
+            f"archived WAL up to {target_time} at its first start.",
+            fg="green",
+        )
+    else:
+        click.secho(
+            f"Volume {volume} is ready; set NAMED_ODOO_POSTGRES_VOLUME={volume} "
+            "and reload to use it.",
+            fg="green",
+        )
+
+
+@restore.command(name="wodoobin-verify")
+@click.argument("filename", shell_complete=_shell_complete_file)
+@click.option("--deep", is_flag=True, help="Decompresses the chunks as well")
+@click.option("-j", "--workers", default=4)
+@pass_config
+def wodoobin_verify(config, filename, deep, workers):
+    filepath = _get_dump_path(config, filename)
+    if not wodoobin.is_chunked(filepath):
+        abort("Only the chunked wodoobin format has checksums.")
+    broken = wodoobin.verify(filepath, workers=workers, deep=deep)
+    if broken:
+        abort(f"Broken chunks: {', '.join(map(str, broken))}")
+    click.secho(
+        f"{filepath.name} is ok (postgres {wodoobin.read_header(filepath)}).",
+        fg="green",
+    )
+
+
+@restore.command(name="wodoobin-extract")
+@click.argument("filename", shell_complete=_shell_complete_file)
+@click.argument("dest")
+@click.argument("paths", nargs=-1)
+@click.option("-j", "--workers", default=4)
+@pass_config
+def wodoobin_extract(config, filename, dest, paths, workers):
+    """
+    Extracts the postgres volume or single files of it (e.g.
+    base/16384/2619) to DEST for inspection.
+    """
+    filepath = _get_dump_path(config, filename)
+    if not wodoobin.is_chunked(filepath):
+        abort("Only the chunked wodoobin format supports extracting files.")
+    wodoobin.extract(filepath, dest, workers=workers, paths=paths or None)
+    click.secho(f"Extracted to {dest}", fg="green")
+
+
+def _get_dump_path(config, filename):
+    filepath = Path(filename)
+    if len(filepath.parts) == 1:
+        filepath = Path(config.dumps_path) / filepath
+    return filepath
+
+
+@restore.command(name="deferred-tables")
+@click.option("-j", "--workers", default=5)
+@click.option("--ignore-errors", is_flag=True)
+@click.option(
+    "--foreground", is_flag=True, help="Do not detach; used by the background job"
+)
+@pass_config
+def restore_deferred_tables(config, workers, ignore_errors, foreground):
+    """
+    Loads the cold tables left out by restore odoo-db --hot-first
+    """
+    deferred_file = restore_engine.get_deferred_file(config, config.dbname)
+    if not deferred_file.exists():
+        abort(f"Nothing deferred for {config.dbname}")
+    if not foreground:
+        _start_deferred_restore(config)
+        return
+
+    deferred = restore_engine.read_deferred(deferred_file)
+    conn = config.get_odoo_conn()
+    checkpoint = restore_engine.Checkpoint(
+        _get_deferred_checkpoint_file(config, config.dbname),
+        deferred["dump"],
+        config.dbname,
+    )
+    if not checkpoint.load():
+        checkpoint.reset()
+    runner = restore_engine.PgRestoreRunner(
+        config,
+        config.DB_HOST,
+        config.DB_PORT,
+        config.DB_USER,
+        config.DB_PWD,
+        config.dbname,
+        deferred["dumps_path"],
+    )
+    monitor = restore_engine.ProgressMonitor(
+        conn, restore_engine.get_progress_file(config, config.dbname)
+    )
+    with runner:
+        restore_engine.restore_deferred(
+            runner,
+            conn,
+            checkpoint,
+            monitor,
+            deferred["filename"],
+            deferred["entries"],
+            workers,
+            ignore_errors,
+        )
+    _remove_deferred_restore(config, config.dbname)
+    click.secho(f"Cold tables of {config.dbname} are loaded.", fg="green")
+
+
+@restore.command(name="show-progress")
+@click.option("--dbname", help="Defaults to the currently restoring database")
+@pass_config
+def show_progress(config, dbname):
+    from tabulate import tabulate
+
+    progress_file = restore_engine.get_progress_file(
+        config, dbname or config.dbname + "_restoring"
+    )
+    if not progress_file.exists():
+        abort(f"No progress file found: {progress_file}")
+    progress = json.loads(progress_file.read_text())
+    click.secho(
+        f"{progress['database']}: {progress['phase']} "
+        f"(started {progress['started']}, updated {progress['updated']})",
+        fg="yellow",
+    )
+    rows = [
+        (
+            table,
+            info.get("state"),
+            info.get("rows"),
+            info.get("rows_per_sec"),
+            info.get("mb_per_sec"),
+            info.get("eta"),
+        )
+        for table, info in progress["tables"].items()
+    ]
+    click.echo(tabulate(rows, ["Table", "State", "Rows", "Rows/s", "MB/s", "ETA"]))
+
+
+@restore.command(name="list-templates")
+@pass_config
+def list_templates(config):
+    import humanize
+    from tabulate import tabulate
+
+    conn = config.get_odoo_conn()
+    rows = [
+        (
+            x["name"],
+            x.get("filename", ""),
+            x.get("dev", ""),
+            x["last_used"],
+            humanize.naturalsize(x["size"]),
+        )
+        for x in restore_templates.get_templates(conn)
+    ]
+    click.echo(tabulate(rows, ["Template", "Dump", "Dev", "Last used", "Size"]))
+
+
+@restore.command(name="clear-templates")
+@click.option(
+    "-k", "--keep", default=0, help="Keep the most recently used templates"
+)
+@pass_config
+def clear_templates(config, keep):
+    conn = config.get_odoo_conn()
+    restore_templates.prune_templates(conn, keep)
 
 
 @restore.command(name="files")
@@ -268,6 +685,14 @@ def _restore_wodoo_bin(ctx, config, filepath, verify):
     )
     mountpoint = volume[0]["Mountpoint"]
     click.secho(f"Identified mountpoint {mountpoint}", fg="yellow")
+    if wodoobin.is_chunked(filepath):
+        # module is called, so that it can run with sudo
+        extract = (
+            f"'{sys.executable}' -m wodoo.wodoobin extract '{filepath}' "
+            f"'{mountpoint}' -j {os.cpu_count() or 1}\n"
+        )
+    else:
+        extract = f"tail '{filepath}' -c +{cutoff + 1} | pigz -dc | tar x\n"
     with autocleanpaper() as scriptfile:
         scriptfile.write_text(
             (
@@ -276,8 +701,7 @@ def _restore_wodoo_bin(ctx, config, filepath, verify):
                 f"rm -Rf '{mountpoint}'\n"
                 f"mkdir '{mountpoint}'\n"
                 f"cd '{mountpoint}'\n"
-                f"tail '{filepath}' -c +{cutoff + 1} | "
-                f"pigz -dc | tar x\n"
+                f"{extract}"
             )
         )
         for mode in ["", "sudo"]:
@@ -360,6 +784,32 @@ def _after_restore(ctx, conn, config, no_dev_scripts, no_remove_webassets):
     is_flag=True,
     help="Example if some extensions are missing (replication)",
 )
+@click.option(
+    "--resumable",
+    is_flag=True,
+    help=(
+        "Custom/directory dumps: restore table by table with a checkpoint; "
+        "a failed restore continues where it stopped when called again."
+    ),
+)
+@click.option(
+    "--hot-first",
+    is_flag=True,
+    help=(
+        "Custom/directory dumps: leave out the data of RESTORE_COLD_TABLES, "
+        "so that the database can be used early; the cold tables are "
+        "loaded in the background afterwards."
+    ),
+)
+@click.option(
+    "--fast",
+    is_flag=True,
+    help=(
+        "RUN_POSTGRES only: restore into the temporary postgres with fsync, "
+        "full page writes and autovacuum turned off; vacuum analyze afterwards. "
+        "Default from setting RESTORE_FAST_PROFILE."
+    ),
+)
 @pass_config
 @click.pass_context
 def restore_db(
@@ -373,7 +823,24 @@ def restore_db(
     exclude_tables,
     verbose,
     ignore_errors,
+    fast,
+    resumable,
+    hot_first,
 ):
+    """
+    FILENAME - reads a custom or plain dump from stdin; s3://bucket/key
+    downloads it.
+    """
+    stream = filename == "-" or s3_target.is_s3_url(filename)
+    if stream and (resumable or hot_first):
+        abort("--resumable and --hot-first require a dump file.")
+    if stream and exclude_tables:
+        # the stream goes through pg_restore/psql as a whole
+        abort("--exclude-tables requires a dump file.")
+    source = None
+    if s3_target.is_s3_url(filename):
+        source = s3_target.open_dump(config, filename, workers)
+        filename = "-"
     if not filename:
         filename = _inquirer_dump_file(
             config, "Choose filename to restore", config.dbname
@@ -388,7 +855,7 @@ def restore_db(
     filename_absolute = (BACKUPDIR / filename).absolute()
     del filename
 
-    if not config.force:
+    if not config.force and not stream:
         __restore_check(filename_absolute, config)
 
     params = {
@@ -399,11 +866,17 @@ def restore_db(
         "exclude_tables": exclude_tables,
         "verbose": verbose,
         "ignore_errors": ignore_errors,
+        "fast": fast,
+        "resumable": resumable,
+        "hot_first": hot_first,
     }
 
-    dump_type = _add_cronjob_scripts(config)["postgres"].__get_dump_type(
-        filename_absolute
-    )
+    dump_type = "stream" if stream else _get_dump_type(config, filename_absolute)
+    if dump_type == "wodoo_chunks" and (resumable or hot_first or exclude_tables):
+        abort(
+            "--resumable, --hot-first and --exclude-tables do not work with "
+            "chunked dumps."
+        )
     if dump_type == "odoosh":
         _odoo_sh(ctx, config, filename=filename_absolute, params=params)
         return
@@ -433,9 +906,16 @@ def restore_db(
         _restore_wodoo_bin(ctx, config, filename_absolute, verify)
         conn = config.get_odoo_conn()
         _after_restore(ctx, conn, config, no_dev_scripts, no_remove_webassets)
+        fast = False
 
     else:
-        _restore_dump(ctx, config, filename, dumps_path, **params)
+        try:
+            fast = _restore_dump(
+                ctx, config, filename, dumps_path, source=source, **params
+            )
+        finally:
+            if source:
+                source.close()
 
     if config.run_postgres:
         __dc(config, ["up", "-d", "postgres"])
@@ -443,6 +923,20 @@ def restore_db(
         if config.devmode:
             Commands.invoke(ctx, "pghba_conf_wide_open")
 
+    if fast:
+        _vacuum_analyze(config, workers)
+
+    if config.run_postgres and config.postgres_wal_archive:
+        click.secho(
+            "WAL archiving is on: please take a new base backup with "
+            "'odoo backup wal-basebackup' - older ones do not contain the "
+            "restored database.",
+            fg="yellow",
+        )
+
+    if hot_first and restore_engine.get_deferred_file(config, config.dbname).exists():
+        _start_deferred_restore(config)
+
 
 def _restore_dump(
     ctx,
@@ -456,8 +950,23 @@ def _restore_dump(
     verbose,
     verify,
     ignore_errors,
+    fast,
+    resumable,
+    hot_first,
+    source=None,
 ):
+    """
+    Returns True if the restore ran with the fast restore profile.
+    """
     DBNAME_RESTORING = config.dbname + "_restoring"
+    stream = filename == "-"
+    fast = fast or config.restore_fast_profile
+    if fast and not config.run_postgres:
+        click.secho(
+            "Fast restore profile is only applied to RUN_POSTGRES - ignoring.",
+            fg="yellow",
+        )
+        fast = False
     if config.run_postgres:
         postgres_name = f"{config.PROJECT_NAME}_run_postgres"
         client = docker.from_env()
@@ -475,48 +984,145 @@ def _restore_dump(
     dest_db = conn.dbname
 
     conn = conn.clone(dbname=DBNAME_RESTORING)
-    with config.forced() as config:
-        _dropdb(config, conn)
-
-    _execute_sql(
-        conn.clone(dbname="postgres"),
-        (
-            f"create database {DBNAME_RESTORING} "
-            # "ENCODING 'unicode' "
-            # "LC_COLLATE 'C' "
-            # "TEMPLATE template0 "
-            ";"
-        ),
-        notransaction=True,
-    )
+    checkpoint, resuming = None, False
+    if resumable or hot_first:
+        checkpoint = _get_restore_checkpoint(config, Path(dumps_path) / filename)
+    cold_tables = _get_cold_tables(config) if hot_first and checkpoint else []
+    # deferred data of a former restore does not fit the new database
+    _remove_deferred_restore(config, config.dbname)
+    if checkpoint:
+        resuming = checkpoint.load() and _exists_db(conn)
+    if resuming:
+        click.secho(
+            f"Resuming restore of {DBNAME_RESTORING}: "
+            f"{len(checkpoint.done)} steps done before.",
+            fg="green",
+        )
+    else:
+        with config.forced() as config:
+            _dropdb(config, conn)
+
+    dev_scripts = config.devmode and not no_dev_scripts
+    template, template_keys = None, []
+    if restore_templates.get_keep_count(config) and not resuming and not stream:
+        dump_hash = restore_templates.get_dump_hash(
+            config, Path(dumps_path) / filename
+        )
+        template_keys = [
+            restore_templates.get_template_key(dump_hash, exclude_tables),
+        ]
+        if dev_scripts and config.restore_template_after_dev:
+            template_keys.insert(
+                0,
+                restore_templates.get_template_key(
+                    dump_hash, exclude_tables, dev_project=config.project_name
+                ),
+            )
+        template = restore_templates.find_template(conn, template_keys)
+
+    if template:
+        restore_templates.clone_template(conn, template, DBNAME_RESTORING)
+        fast = False
+        cold_tables = []
+    elif cold_tables:
+        # a template without the cold tables is of no use
+        template_keys = []
+    elif not resuming:
+        if checkpoint:
+            checkpoint.reset()
+        _execute_sql(
+            conn.clone(dbname="postgres"),
+            (
+                f"create database {DBNAME_RESTORING} "
+                # "ENCODING 'unicode' "
+                # "LC_COLLATE 'C' "
+                # "TEMPLATE template0 "
+                ";"
+            ),
+            notransaction=True,
+        )
     effective_host_name = config.DB_HOST
+    run_postgres_started = False
+    profile_set = False
 
-    if config.devmode and not no_dev_scripts:
+    if dev_scripts:
         click.echo("Option devmode is set, so cleanup-scripts are run afterwards")
     try:
-        if config.use_docker:
+        # if postgres docker is used, then make a temporary config to restart docker container
+        # with external directory mapped; after that remove config
+        if config.use_docker and config.run_postgres and not template:
+            if fast:
+                # set before, so that a partly applied profile is reset too
+                profile_set = True
+                _set_restore_profile(config, conn, True)
+            __dc(config, ["kill", "postgres"])
+            __dc(
+                config,
+                [
+                    "run",
+                    "-d",
+                    "--name",
+                    f"{postgres_name}",
+                    "--rm",
+                    "--service-ports",
+                    "-v",
+                    f"{dumps_path}:/host/dumps2",
+                    "postgres",
+                ],
+            )
+            run_postgres_started = True
+            Commands.invoke(ctx, "wait_for_container_postgres", missing_ok=True)
+            effective_host_name = postgres_name
 
-            # if postgres docker is used, then make a temporary config to restart docker container
-            # with external directory mapped; after that remove config
-            if config.run_postgres:
-                __dc(config, ["kill", "postgres"])
-                __dc(
+        deferred = []
+        if template:
+            pass
+        elif stream:
+            _restore_stream(
+                config,
+                effective_host_name,
+                DBNAME_RESTORING,
+                ignore_errors,
+                source=source,
+            )
+        elif chunk_store.is_chunk_index(Path(dumps_path) / filename):
+            with chunk_store.open_dump(
+                Path(dumps_path) / filename,
+                chunk_store.get_store_dir(dumps_path),
+                workers,
+            ) as source:
+                _restore_stream(
                     config,
-                    [
-                        "run",
-                        "-d",
-                        "--name",
-                        f"{postgres_name}",
-                        "--rm",
-                        "--service-ports",
-                        "-v",
-                        f"{dumps_path}:/host/dumps2",
-                        "postgres",
-                    ],
+                    effective_host_name,
+                    DBNAME_RESTORING,
+                    ignore_errors,
+                    source=source,
                 )
-                Commands.invoke(ctx, "wait_for_container_postgres", missing_ok=True)
-                effective_host_name = postgres_name
-
+        elif incremental_backup.is_backup_set(Path(dumps_path) / filename):
+            _restore_incremental(
+                config,
+                conn,
+                effective_host_name,
+                filename,
+                dumps_path,
+                workers,
+                exclude_tables,
+                ignore_errors,
+            )
+        elif checkpoint:
+            deferred = _restore_resumable(
+                config,
+                conn,
+                checkpoint,
+                effective_host_name,
+                filename,
+                dumps_path,
+                workers,
+                exclude_tables,
+                ignore_errors,
+                cold_tables,
+            )
+        elif config.use_docker:
             cmd = [
                 "run",
                 "--rm",
@@ -561,14 +1167,44 @@ def _restore_dump(
                 Path(config.dumps_path) / filename,
             )
 
-        _after_restore(ctx, conn, config, no_dev_scripts, no_remove_webassets)
+        if not template or template.get("dev") != config.project_name:
+            if len(template_keys) == 1 and not template:
+                _store_restore_template(
+                    config, conn, template_keys[0], filename, dev_project=None
+                )
+            _after_restore(ctx, conn, config, no_dev_scripts, no_remove_webassets)
+            if len(template_keys) > 1:
+                _store_restore_template(
+                    config,
+                    conn,
+                    template_keys[0],
+                    filename,
+                    dev_project=config.project_name,
+                )
         __rename_db_drop_target(
             conn.clone(dbname="postgres"), DBNAME_RESTORING, config.dbname
         )
         _remove_postgres_connections(conn.clone(dbname=dest_db))
+        if checkpoint:
+            checkpoint.remove()
+        if deferred:
+            restore_engine.write_deferred(
+                restore_engine.get_deferred_file(config, config.dbname),
+                Path(dumps_path) / filename,
+                filename,
+                dumps_path,
+                deferred,
+            )
 
     finally:
-        if config.run_postgres:
+        if profile_set:
+            if not run_postgres_started:
+                # the profile is in postgresql.auto.conf of the regular
+                # cluster; it must not stay there if kill/run failed
+                __dc(config, ["up", "-d", "postgres"])
+                Commands.invoke(ctx, "wait_for_container_postgres", missing_ok=True)
+            _set_restore_profile(config, conn, False)
+        if run_postgres_started:
             # stop the run started postgres container; softly
             subprocess.check_output(["docker", "stop", postgres_name])
             try:
@@ -577,6 +1213,307 @@ def _restore_dump(
                 # ignore - stopped before
                 pass
             subprocess.check_output(["docker", "rm", "-f", postgres_name])
+    return fast
+
+
+def _get_stream_cmd(config, executable, args):
+    """
+    Command line of a postgres client tool that reads from stdin or writes
+    to stdout; inside cronjobshell if docker is used.
+    """
+    if config.use_docker:
+        return [
+            "run",
+            "--rm",
+            "-T",
+            "-e",
+            f"PGPASSWORD={config.DB_PWD}",
+            "--entrypoint",
+            executable,
+            "cronjobshell",
+        ] + args
+    return [str(exec_file_in_path(executable))] + args
+
+
+def _get_stream_env(config):
+    env = dict(os.environ)
+    env["PGPASSWORD"] = config.DB_PWD
+    return env
+
+
+def _restore_stream(config, host, dbname, ignore_errors, source=None):
+    """
+    Restores the dump on stdin (or source); custom format goes to
+    pg_restore, plain sql to psql. The first bytes are read to tell them
+    apart and then passed on together with the rest.
+    """
+    stdin = source or sys.stdin.buffer
+    head = stdin.read(5)
+    conn_args = ["-h", host, "-p", str(config.DB_PORT), "-U", config.DB_USER]
+    if head == b"PGDMP":
+        executable = "pg_restore"
+        args = conn_args + ["-d", dbname, "--no-owner", "--no-privileges"]
+        if not ignore_errors:
+            args += ["--exit-on-error"]
+    elif head[:2] == b"\x1f\x8b":
+        abort("Compressed plain dumps cannot be restored from stdin.")
+    else:
+        executable = "psql"
+        args = conn_args + ["-d", dbname, "-q"]
+        if not ignore_errors:
+            args += ["-v", "ON_ERROR_STOP=1"]
+    cmd = _get_stream_cmd(config, executable, args)
+    click.secho(
+        f"Restoring {dbname} from {'stdin' if not source else 'stream'} "
+        f"with {executable}",
+        fg="yellow",
+    )
+    if config.use_docker:
+        process = __dc_popen(config, cmd, stdin=subprocess.PIPE)
+    else:
+        process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, env=_get_stream_env(config)
+        )
+    try:
+        process.stdin.write(head)
+        shutil.copyfileobj(stdin, process.stdin, 1024 * 1024)
+    except BrokenPipeError:
+        pass
+    finally:
+        process.stdin.close()
+    if process.wait():
+        raise Exception(f"{executable} failed with exit code {process.returncode}")
+
+
+def _get_runner(config, host, dbname, dumps_path):
+    return restore_engine.PgRestoreRunner(
+        config,
+        host,
+        config.DB_PORT,
+        config.DB_USER,
+        config.DB_PWD,
+        dbname,
+        dumps_path,
+    )
+
+
+def _restore_incremental(
+    config, conn, host, filename, dumps_path, workers, exclude_tables, ignore_errors
+):
+    with _get_runner(config, host, conn.dbname, dumps_path) as runner:
+        incremental_backup.restore(
+            runner,
+            conn,
+            filename,
+            workers=workers,
+            exclude_tables=exclude_tables,
+            ignore_errors=ignore_errors,
+        )
+
+
+def _backup_incremental(config, filepath, dbname, workers, exclude):
+    filepath = Path(filepath)
+    click.secho(f"Backup set will be stored there: {filepath}")
+    with _get_runner(config, config.DB_HOST, dbname, filepath.parent) as runner:
+        manifest = incremental_backup.backup(
+            runner,
+            config.get_odoo_conn().clone(dbname=dbname),
+            filepath.name,
+            workers=workers,
+            exclude_tables=exclude,
+            max_chain=config.backup_incremental_max_chain_as_int or 1,
+        )
+    __apply_dump_permissions(filepath)
+    click.secho(
+        f"Backup set {filepath.name} done; data of "
+        f"{len(manifest['chain'])} sets is needed to restore it.",
+        fg="green",
+    )
+
+
+def _get_restore_checkpoint(config, filepath):
+    if not restore_engine.is_pg_restore_archive(filepath):
+        click.secho(
+            "Resumable restore requires a custom or directory dump - "
+            "restoring at once.",
+            fg="yellow",
+        )
+        return None
+    dbname = config.dbname + "_restoring"
+    return restore_engine.Checkpoint(
+        restore_engine.get_checkpoint_file(config, dbname), filepath, dbname
+    )
+
+
+def _restore_resumable(
+    config,
+    conn,
+    checkpoint,
+    host,
+    filename,
+    dumps_path,
+    workers,
+    exclude_tables,
+    ignore_errors,
+    cold_tables,
+):
+    """
+    Returns the toc entries that were left out because of the cold tables.
+    """
+    runner = restore_engine.PgRestoreRunner(
+        config,
+        host,
+        config.DB_PORT,
+        config.DB_USER,
+        config.DB_PWD,
+        conn.dbname,
+        dumps_path,
+    )
+    entry = dump_catalog.get_entry(Path(dumps_path) / filename) or {}
+    monitor = restore_engine.ProgressMonitor(
+        conn,
+        restore_engine.get_progress_file(config, conn.dbname),
+        row_estimates=entry.get("table_row_estimates"),
+    )
+    with runner:
+        return restore_engine.restore(
+            runner,
+            conn,
+            checkpoint,
+            monitor,
+            filename,
+            workers=workers,
+            exclude_tables=exclude_tables,
+            ignore_errors=ignore_errors,
+            cold_tables=cold_tables,
+        )
+
+
+def _get_cold_tables(config):
+    return [x.strip() for x in (config.restore_cold_tables or "").split(",") if x.strip()]
+
+
+def _get_deferred_checkpoint_file(config, dbname):
+    return restore_engine.get_checkpoint_file(config, dbname + "_deferred")
+
+
+def _remove_deferred_restore(config, dbname):
+    for path in [
+        restore_engine.get_deferred_file(config, dbname),
+        _get_deferred_checkpoint_file(config, dbname),
+    ]:
+        if path.exists():
+            path.unlink()
+
+
+def _start_deferred_restore(config):
+    """
+    Loads the cold tables in a detached odoo process; output goes to
+    ${run}/restore/<db>.deferred.log
+    """
+    log_file = config.dirs["run/restore"] / f"{config.dbname}.deferred.log"
+    cmd = [
+        sys.argv[0],
+        "-p",
+        config.project_name,
+        "restore",
+        "deferred-tables",
+        "--foreground",
+    ]
+    with open(log_file, "w") as log:
+        subprocess.Popen(
+            cmd,
+            cwd=os.getcwd(),
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    click.secho(
+        "Database is usable now; cold tables are loaded in the background.\n"
+        f"Log: {log_file}\n"
+        f"Progress: odoo restore show-progress --dbname {config.dbname}",
+        fg="green",
+    )
+
+
+def _store_restore_template(config, conn, key, filename, dev_project):
+    restore_templates.store_template(
+        conn, conn.dbname, key, filename, dev_project=dev_project
+    )
+    restore_templates.prune_templates(
+        conn, restore_templates.get_keep_count(config)
+    )
+
+
+def _get_restore_profile(config):
+    if not config.postgres_wal_archive:
+        return RESTORE_PROFILE
+    # resetting them would also remove the archive settings
+    return {
+        k: v
+        for k, v in RESTORE_PROFILE.items()
+        if k not in wal_archive.CONFLICTING_RESTORE_SETTINGS
+    }
+
+
+def _set_restore_profile(config, conn, active):
+    """
+    Writes (or resets) the restore profile via ALTER SYSTEM. The settings
+    are picked up by the temporary postgres container; on reset the
+    configuration is reloaded and a checkpoint is forced, so everything
+    written with fsync=off is on disk before the container stops.
+    """
+    conn = conn.clone(dbname="postgres")
+    for key, value in _get_restore_profile(config).items():
+        if active:
+            sql = f"alter system set {key} = '{value}'"
+        else:
+            sql = f"alter system reset {key}"
+        try:
+            _execute_sql(conn, sql, notransaction=True)
+        except Exception:
+            if active:
+                raise
+            click.secho(
+                f"Could not reset {key} - please check postgresql.auto.conf",
+                fg="red",
+            )
+    if not active:
+        try:
+            _execute_sql(conn, "select pg_reload_conf()", notransaction=True)
+            _execute_sql(conn, "checkpoint", notransaction=True)
+        except Exception:
+            click.secho("Could not reload postgres configuration.", fg="red")
+    click.secho(
+        f"Restore profile {'applied' if active else 'removed'}.", fg="yellow"
+    )
+
+
+def _vacuum_analyze(config, workers):
+    conn = config.get_odoo_conn(inside_container=True)
+    click.secho(f"Vacuum analyze {conn.dbname} with {workers} jobs", fg="yellow")
+    __dcrun(
+        config,
+        [
+            "pgtools",
+            "vacuumdb",
+            "-h",
+            str(conn.host),
+            "-p",
+            str(conn.port),
+            "-U",
+            conn.user,
+            "-j",
+            str(workers),
+            "--analyze",
+            conn.dbname,
+        ],
+        env={
+            "PGPASSWORD": conn.pwd,
+        },
+        interactive=True,
+    )
 
 
 def _add_cronjob_scripts(config):
@@ -624,6 +1561,8 @@ def __do_restore_files(config, filepath):
         cwd=files_dir,
     )
     click.secho(f"Files restored from {filepath} to {files_dir}", fg="green")
+    if config.filestore_pool:
+        filestore_pool.dedup(files_dir, filestore_pool.get_pool_dir(config))
 
 
 def __restore_check(filepath, config):
@@ -663,14 +1602,129 @@ def _backup_wodoobin(ctx, config, filename):
         )
     )[0]["Mountpoint"]
 
-    with autocleanpaper() as tempfile_zip:
-        _binary_zip(path, tempfile_zip)
-
-        put_appendix_into_file(f"WODOO_BIN\n{version}\n", tempfile_zip, filename)
+    click.secho(f"Packing {path} to {filename}", fg="yellow")
+    wodoobin.pack(path, filename, version, workers=os.cpu_count() or 1)
 
     Commands.invoke(ctx, "up", daemon=True, machines=["postgres"])
 
 
+def _get_pg_dump_stream_args(
+    config, dbname, dumptype, compression, column_inserts, exclude
+):
+    args = [
+        "-h",
+        config.DB_HOST,
+        "-p",
+        str(config.DB_PORT),
+        "-U",
+        config.DB_USER,
+        "--format",
+        dumptype,
+    ]
+    if dumptype == "custom":
+        args += ["-Z", str(compression)]
+    for exclude in exclude:
+        args += ["--exclude-table-data", exclude]
+    if column_inserts:
+        args += ["--column-inserts"]
+    return args + [dbname]
+
+
+def _backup_stream(config, dbname, dumptype, compression, column_inserts, exclude):
+    """
+    pg_dump to stdout; messages go to stderr, so that the dump can be
+    piped.
+    """
+    args = _get_pg_dump_stream_args(
+        config, dbname, dumptype, compression, column_inserts, exclude
+    )
+    click.secho(f"Streaming {dbname} to stdout", fg="yellow", err=True)
+    cmd = _get_stream_cmd(config, "pg_dump", args)
+    if config.use_docker:
+        res = __dc(config, cmd)
+    else:
+        res = subprocess.call(cmd, env=_get_stream_env(config))
+    if res:
+        raise Exception("Backup failed!")
+
+
+def _backup_s3(
+    config, url, dbname, dumptype, compression, column_inserts, exclude, workers
+):
+    """
+    pg_dump straight into a multipart upload.
+    """
+    import humanize
+
+    args = _get_pg_dump_stream_args(
+        config, dbname, dumptype, compression, column_inserts, exclude
+    )
+    cmd = _get_stream_cmd(config, "pg_dump", args)
+    click.secho(f"Uploading dump of {dbname} to {url}", fg="yellow")
+    if config.use_docker:
+        process = __dc_popen(config, cmd, stdout=subprocess.PIPE)
+    else:
+        process = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, env=_get_stream_env(config)
+        )
+
+    def _check():
+        if process.wait():
+            raise Exception("Backup failed - upload aborted!")
+
+    try:
+        size = s3_target.upload(
+            config,
+            process.stdout,
+            url,
+            dumptype,
+            workers=max(workers, 4),
+            check=_check,
+        )
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+    click.secho(f"Uploaded {humanize.naturalsize(size)} to {url}", fg="green")
+
+
+def _backup_chunked(config, filepath, dbname, dumptype, column_inserts, exclude):
+    """
+    Uncompressed pg_dump into the chunk store of the dumps folder; the
+    chunks are compressed one by one.
+    """
+    args = _get_pg_dump_stream_args(config, dbname, dumptype, 0, column_inserts, exclude)
+    cmd = _get_stream_cmd(config, "pg_dump", args)
+    click.secho(f"Dumping {dbname} into the chunk store", fg="yellow")
+    if config.use_docker:
+        process = __dc_popen(config, cmd, stdout=subprocess.PIPE)
+    else:
+        process = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, env=_get_stream_env(config)
+        )
+    try:
+        index = chunk_store.write(
+            process.stdout,
+            filepath,
+            chunk_store.get_store_dir(Path(filepath).parent),
+            dumptype,
+        )
+    finally:
+        process.stdout.close()
+    if process.wait():
+        if Path(filepath).exists():
+            Path(filepath).unlink()
+        raise Exception("Backup failed!")
+    import humanize
+
+    click.secho(
+        f"{humanize.naturalsize(index['size'])} dumped, "
+        f"{humanize.naturalsize(index['stored'])} new in the chunk store",
+        fg="green",
+    )
+
+
 def _backup_pgdump(
     config,
     filename,
@@ -5,54 +5,136 @@ if click:
     class AliasedGroup(click.Group):
         """
         Uses startswith to match command
+
+        The root group gets the lazy_commands of command_index: their
+        modules are imported not before the command is resolved.
         """
 
-        def get_command(self, ctx, cmd_name):
+        def __init__(self, *args, lazy_commands=None, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.lazy_commands = lazy_commands or {}
+            self._name_index = None
+
+        def list_commands(self, ctx):
+            return sorted(set(self.commands) | set(self.lazy_commands))
+
+        def _get_command(self, ctx, cmd_name):
             rv = click.Group.get_command(self, ctx, cmd_name)
+            if rv is None and cmd_name in self.lazy_commands:
+                from .command_index import load_module
+
+                load_module(self.lazy_commands[cmd_name]["module"])
+                rv = click.Group.get_command(self, ctx, cmd_name)
+            return rv
+
+        def _get_listed_command(self, cmd_name):
+            """
+            The command or for not loaded lazy commands a placeholder with
+            the help of the index, good for listings.
+            """
+            if cmd_name in self.commands:
+                return self.commands[cmd_name]
+            info = self.lazy_commands[cmd_name]
+            return click.Command(
+                cmd_name,
+                help=info["help"],
+                short_help=info["short_help"],
+                hidden=info["hidden"],
+            )
+
+        def _get_name_index(self, ctx):
+            """
+            (name, group) of the commands and of the subcommands of the
+            subgroups; group is None for own commands.
+            """
+            key = tuple(
+                (name, len(getattr(cmd, "commands", ())))
+                for name, cmd in self.commands.items()
+            )
+            if self._name_index and self._name_index[0] == key:
+                return self._name_index[1]
+
+            index = []
+            for name in self.list_commands(ctx):
+                index.append((name, None))
+                cmd = self.commands.get(name)
+                if cmd is None:
+                    subcommands = self.lazy_commands[name]["subcommands"]
+                elif type(cmd) == type(self):
+                    subcommands = cmd.list_commands(ctx)
+                else:
+                    subcommands = []
+                index += [(x, name) for x in subcommands]
+            self._name_index = key, index
+            return index
+
+        def _resolve(self, ctx, cmd_name, group):
+            if not group:
+                return self._get_command(ctx, cmd_name)
+            cmd = self._get_command(ctx, group)
+            return cmd.get_command(ctx, cmd_name) if cmd else None
+
+        def get_command(self, ctx, cmd_name):
+            rv = self._get_command(ctx, cmd_name)
             if rv is not None:
                 return rv
-            matches = list(
-                filter(
-                    lambda x: x[1].startswith(cmd_name),
-                    map(
-                        lambda y: (click.Group.get_command(self, ctx, y), y),
-                        self.list_commands(ctx),
-                    ),
-                )
-            )
-            # search recursivley
-            for _cmd_name in self.list_commands(ctx):
-                cmd = click.Group.get_command(self, ctx, _cmd_name)
-                if type(cmd) == type(self):
-                    filtered = filter(
-                        lambda cmd: cmd.startswith(cmd_name), cmd.list_commands(ctx)
-                    )
-                    matches += list(
-                        map(
-                            lambda cmd_name: (
-                                cmd.get_command(ctx, cmd_name),
-                                _cmd_name,
-                            ),
-                            filtered,
-                        )
-                    )
+
+            def _match():
+                return [
+                    x for x in self._get_name_index(ctx) if x[0].startswith(cmd_name)
+                ]
+
+            matches = _match()
+            if not matches and self.lazy_commands:
+                # not in the index - try with all modules loaded
+                from .command_index import load_all
+
+                if load_all():
+                    matches = _match()
 
             if len(matches) > 1:
                 # try to reduce to exact match
-                try_matches = list(
-                    filter(lambda match: match[0].name == cmd_name, matches)
-                )
+                try_matches = [x for x in matches if x[0] == cmd_name]
                 if try_matches:
                     matches = try_matches
 
             if len(matches) == 1:
-                cmd = matches[0][0]
-                # print("Using command: {}.{}".format(self.name, cmd.name))
-                return matches[0][0]
+                return self._resolve(ctx, *matches[0])
             elif len(matches) > 1:
                 click.echo(
                     "Not unique command: {}\n\n".format(
-                        "\n\t".join(x[1] + "/" + x[0].name for x in matches)
+                        "\n\t".join((x[1] or x[0]) + "/" + x[0] for x in matches)
                     )
                 )
             return None
+
+        def format_commands(self, ctx, formatter):
+            if not self.lazy_commands:
+                return super().format_commands(ctx, formatter)
+            commands = [
+                (name, self._get_listed_command(name))
+                for name in self.list_commands(ctx)
+            ]
+            commands = [x for x in commands if not x[1].hidden]
+            if not commands:
+                return
+            limit = formatter.width - 6 - max(len(x[0]) for x in commands)
+            with formatter.section("Commands"):
+                formatter.write_dl(
+                    [(name, cmd.get_short_help_str(limit)) for name, cmd in commands]
+                )
+
+        def shell_complete(self, ctx, incomplete):
+            if not self.lazy_commands:
+                return super().shell_complete(ctx, incomplete)
+            from click.shell_completion import CompletionItem
+
+            results = []
+            for name in self.list_commands(ctx):
+                if not name.startswith(incomplete):
+                    continue
+                cmd = self._get_listed_command(name)
+                if not cmd.hidden:
+                    results.append(CompletionItem(name, help=cmd.get_short_help_str()))
+            results.extend(click.Command.shell_complete(self, ctx, incomplete))
+            return results
@@ -620,6 +620,19 @@ def post_process_complete_yaml_config(config, yml):
                 service.setdefault("labels", {})
                 service["labels"][label_name] = label_value
 
+    # continuous archiving - see wal_archive
+    if config.run_postgres and config.postgres_wal_archive:
+        if "postgres" in yml["services"]:
+            config.dirs["wal_archive"].mkdir(parents=True, exist_ok=True)
+            yml["services"]["postgres"].setdefault("volumes", [])
+            yml["services"]["postgres"]["volumes"].append(
+                {
+                    "type": "bind",
+                    "source": str(config.dirs["wal_archive"]),
+                    "target": "/wal_archive",
+                }
+            )
+
     if config.REGISTRY:
         from .lib_docker_registry import _rewrite_compose_with_tags
 
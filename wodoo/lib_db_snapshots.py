@@ -1,5 +1,8 @@
 import arrow
 import sys
+import json
+import shutil
+import subprocess
 import click
 import inquirer
 from .tools import remove_webassets
@@ -10,6 +13,14 @@ from .lib_clickhelpers import AliasedGroup
 from .tools import __hash_odoo_password
 from .tools import _remove_postgres_connections, _execute_sql
 from .tools import get_filesystem_of_folder
+from .tools import abort
+from . import filestore_snapshots
+from . import snapshot_retention
+
+# filesystems that may support cp --reflink (xfs only if made with reflink=1)
+REFLINK_FILESYSTEMS = ["xfs", "bcachefs"]
+# snapshots of odoo update; only these are pruned automatically
+PRE_UPDATE_PREFIX = "pre-update-"
 
 
 def _decide_snapshots_possible(config):
@@ -18,6 +29,11 @@ def _decide_snapshots_possible(config):
     ttype = get_filesystem_of_folder("/var/lib/docker")
     if ttype in ["zfs", "btrfs"]:
         return ttype
+    if ttype in REFLINK_FILESYSTEMS:
+        from .lib_db_snapshots_docker_reflink import reflink_supported
+
+        if reflink_supported():
+            return "reflink"
 
 
 def _setup_manager(config):
@@ -26,6 +42,8 @@ def _setup_manager(config):
         from . import lib_db_snapshots_docker_zfs as snapshot_manager
     elif ttype == "btrfs":
         from . import lib_db_snapshots_docker_btrfs as snapshot_manager
+    elif ttype == "reflink":
+        from . import lib_db_snapshots_docker_reflink as snapshot_manager
     else:
         from . import lib_db_snapshots_plain_postgres as snapshot_manager
     config.__choose_snapshot = __choose_snapshot
@@ -61,23 +79,50 @@ def do_list(config):
     snapshots = list(config.snapshot_manager.__get_snapshots(config))
     from tabulate import tabulate
 
-    rows = [(x["name"], x["date"], x["path"]) for x in snapshots]
-    click.echo(tabulate(rows, ["Name", "Date", "Path"]))
+    import humanize
+
+    rows = [
+        (
+            x["name"],
+            x["date"],
+            x["path"],
+            humanize.naturalsize(x["size"]) if x.get("size") is not None else "",
+            "yes" if filestore_snapshots.exists(config, x["name"]) else "",
+        )
+        for x in snapshots
+    ]
+    click.echo(tabulate(rows, ["Name", "Date", "Path", "Size", "Files"]))
 
 
 @snapshot.command(name="save")
 @click.argument("name", required=False)
+@click.option(
+    "--with-files/--no-files",
+    default=None,
+    help="Snapshot the filestore too; default: SNAPSHOT_FILESTORE",
+)
 @pass_config
 @click.pass_context
-def snapshot_make(ctx, config, name):
+def snapshot_make(ctx, config, name, with_files):
 
     config.snapshot_manager.assert_environment(config)
     if not name:
         name = arrow.get().strftime("%Y%m%d")
         click.secho(f"Using {name} as snapshot name")
+    if with_files is None:
+        with_files = config.snapshot_filestore
 
     # remove existing snaps
     snapshot = config.snapshot_manager.make_snapshot(ctx, config, name)
+    # files after the database: files without attachment are harmless,
+    # attachments without files are not
+    if with_files:
+        try:
+            if not filestore_snapshots.save(config, snapshot):
+                click.secho("No filestore found - skipped.", fg="yellow")
+        except Exception:
+            config.snapshot_manager.remove(config, snapshot)
+            raise
     click.secho("Made snapshot: {}".format(snapshot), fg="green")
 
 
@@ -90,7 +135,17 @@ def snapshot_restore(ctx, config, name):
     name = __choose_snapshot(config, take=name)
     if not name:
         return
-    config.snapshot_manager.restore(config, name)
+    if not filestore_snapshots.exists(config, name):
+        config.snapshot_manager.restore(config, name)
+        return
+
+    prepared = filestore_snapshots.prepare_restore(config, name)
+    try:
+        config.snapshot_manager.restore(config, name)
+    except Exception:
+        filestore_snapshots.abort_restore(config, prepared)
+        raise
+    filestore_snapshots.commit_restore(config, prepared)
 
 
 @snapshot.command(name="remove")
@@ -104,6 +159,7 @@ def snapshot_remove(ctx, config, name):
     if not snapshot:
         return
     config.snapshot_manager.remove(config, snapshot)
+    filestore_snapshots.remove(config, snapshot)
 
 
 @snapshot.command(name="clear", help="Removes all snapshots")
@@ -114,12 +170,273 @@ def snapshot_clear_all(ctx, config):
 
     snapshots = config.snapshot_manager.__get_snapshots(config)
     if snapshots:
-        for snap in snapshots:
-            config.snapshot_manager.remove(config, snap)
+        _remove_snapshots(config, snapshots)
     config.snapshot_manager.clear_all(config)
+    filestore_snapshots.clear_all(config)
     ctx.invoke(do_list)
 
 
+def _remove_snapshots(config, snapshots, keep_clones=False):
+    """
+    :param keep_clones: do not destroy datasets cloned from the snapshots
+                        (zfs); used by prune
+    """
+    if keep_clones and hasattr(config.snapshot_manager, "get_clones"):
+        for snap in snapshots:
+            config.snapshot_manager.remove(config, snap, recursive=False)
+    elif hasattr(config.snapshot_manager, "remove_many"):
+        config.snapshot_manager.remove_many(config, snapshots)
+    else:
+        for snap in snapshots:
+            config.snapshot_manager.remove(config, snap)
+    for snap in snapshots:
+        filestore_snapshots.remove(config, snap["name"])
+
+
+def _prune(
+    config, dry_run, keep_last, keep_daily, keep_weekly, max_size_gb, prefix=None
+):
+    """
+    :param prefix: only snapshots with names starting with it are pruned
+    """
+    import humanize
+    from tabulate import tabulate
+
+    snapshots = list(config.snapshot_manager.__get_snapshots(config))
+    if prefix:
+        snapshots = [x for x in snapshots if x["name"].startswith(prefix)]
+    keep, remove = snapshot_retention.select(
+        snapshots,
+        keep_last=keep_last,
+        keep_daily=keep_daily,
+        keep_weekly=keep_weekly,
+        max_size=max_size_gb * 1024**3,
+    )
+    if hasattr(config.snapshot_manager, "get_clones"):
+        for snap in list(remove):
+            clones = config.snapshot_manager.get_clones(config, snap)
+            if clones:
+                click.secho(
+                    f"{snap['name']} is the origin of {', '.join(clones)} - kept.",
+                    fg="yellow",
+                )
+                remove.remove(snap)
+                keep.append(snap)
+    if max_size_gb and not snapshot_retention.has_sizes(snapshots):
+        click.secho(
+            "Sizes of snapshots unknown - space budget not applied "
+            "(btrfs: enable quotas).",
+            fg="yellow",
+        )
+    if not remove:
+        click.secho("Nothing to prune.", fg="green")
+        return
+    click.echo(
+        tabulate(
+            [
+                (
+                    x["name"],
+                    x["date"],
+                    humanize.naturalsize(x["size"]) if x.get("size") is not None else "",
+                )
+                for x in remove
+            ],
+            ["Remove", "Date", "Size"],
+        )
+    )
+    freed = "unknown"
+    if snapshot_retention.has_sizes(remove):
+        freed = humanize.naturalsize(snapshot_retention.get_size(remove))
+    click.secho(
+        f"{len(remove)} snapshots to remove, {len(keep)} kept; frees {freed}",
+        fg="yellow",
+    )
+    if dry_run:
+        return
+    if not config.force:
+        click.confirm("Remove them?", abort=True)
+    _remove_snapshots(config, remove, keep_clones=True)
+
+
+@snapshot.command(name="prune")
+@click.option("-n", "--dry-run", is_flag=True)
+@click.option("--keep-last", type=int, help="Default: SNAPSHOT_KEEP_LAST")
+@click.option("--keep-daily", type=int, help="Default: SNAPSHOT_KEEP_DAILY")
+@click.option("--keep-weekly", type=int, help="Default: SNAPSHOT_KEEP_WEEKLY")
+@click.option("--max-size", type=int, help="GB; default: SNAPSHOT_MAX_SIZE_GB")
+@pass_config
+def snapshot_prune(config, dry_run, keep_last, keep_daily, keep_weekly, max_size):
+    """
+    Removes the snapshots not kept by the retention rules.
+    """
+    config.snapshot_manager.assert_environment(config)
+
+    def _default(value, setting):
+        return value if value is not None else getattr(config, setting + "_as_int")
+
+    _prune(
+        config,
+        dry_run,
+        _default(keep_last, "snapshot_keep_last"),
+        _default(keep_daily, "snapshot_keep_daily"),
+        _default(keep_weekly, "snapshot_keep_weekly"),
+        _default(max_size, "snapshot_max_size_gb"),
+    )
+
+
+@snapshot.command(name="before-update")
+@pass_config
+@click.pass_context
+def snapshot_before_update(ctx, config):
+    """
+    Called by odoo update if SNAPSHOT_BEFORE_UPDATE is set: snapshot
+    pre-update-<timestamp>, then prune the pre-update snapshots by the
+    retention settings; other snapshots are left alone.
+    """
+    _setup_manager(config)
+    config.snapshot_manager.assert_environment(config)
+    name = PRE_UPDATE_PREFIX + arrow.get().strftime("%Y%m%d%H%M%S")
+    ctx.invoke(snapshot_make, name=name, with_files=None)
+    force = config.force
+    config.force = True
+    try:
+        _prune(
+            config,
+            False,
+            config.snapshot_keep_last_as_int,
+            config.snapshot_keep_daily_as_int,
+            config.snapshot_keep_weekly_as_int,
+            config.snapshot_max_size_gb_as_int,
+            prefix=PRE_UPDATE_PREFIX,
+        )
+    finally:
+        config.force = force
+
+
+Commands.register(snapshot_before_update)
+
+
+STREAM_MAGIC = b"WODOO_SNAPSHOT\n"
+
+
+def _assert_streams_supported(config):
+    if not hasattr(config.snapshot_manager, "get_send_cmd"):
+        abort(
+            "Snapshot streams need the zfs or btrfs backend; "
+            "use odoo backup/restore instead."
+        )
+
+
+def _open_stream(path, mode):
+    if path == "-":
+        return sys.stdout.buffer if "w" in mode else sys.stdin.buffer
+    return open(path, mode)
+
+
+def _send(cmd, out, compress):
+    send = subprocess.Popen(cmd, stdout=subprocess.PIPE if compress else out)
+    processes = [send]
+    if compress:
+        processes.append(subprocess.Popen(["pigz", "-c"], stdin=send.stdout, stdout=out))
+        send.stdout.close()
+    for process in reversed(processes):
+        if process.wait():
+            raise Exception(f"{process.args[0]} failed with {process.returncode}")
+
+
+def _receive(cmd, source, compressed):
+    """
+    Feeds source into cmd, through pigz if the stream is compressed.
+    """
+    receive = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    processes = [receive]
+    feed = receive.stdin
+    if compressed:
+        unpack = subprocess.Popen(
+            ["pigz", "-dc"], stdin=subprocess.PIPE, stdout=receive.stdin
+        )
+        receive.stdin.close()
+        processes.append(unpack)
+        feed = unpack.stdin
+    try:
+        shutil.copyfileobj(source, feed, 1024 * 1024)
+    except BrokenPipeError:
+        pass
+    finally:
+        feed.close()
+    for process in reversed(processes):
+        if process.wait():
+            raise Exception(f"{process.args[0]} failed with {process.returncode}")
+
+
+@snapshot.command(name="export")
+@click.argument("name")
+@click.argument("dest")
+@click.option(
+    "-b",
+    "--base",
+    help="Incremental: only the changes since this snapshot, "
+    "which the receiver must have already",
+)
+@click.option("--no-compress", is_flag=True)
+@pass_config
+def snapshot_export(config, name, dest, base, no_compress):
+    """
+    Writes the snapshot as zfs/btrfs send stream to DEST ('-' for stdout).
+    """
+    config.snapshot_manager.assert_environment(config)
+    _assert_streams_supported(config)
+    cmd = config.snapshot_manager.get_send_cmd(config, name, base)
+    header = {
+        "backend": config.snapshot_manager.BACKEND,
+        "name": name,
+        "base": base,
+        "compressed": not no_compress,
+    }
+    click.secho(f"Exporting snapshot {name}", fg="yellow", err=True)
+    out = _open_stream(dest, "wb")
+    try:
+        out.write(STREAM_MAGIC + json.dumps(header).encode("utf8") + b"\n")
+        out.flush()
+        _send(cmd, out, not no_compress)
+    finally:
+        if dest != "-":
+            out.close()
+
+
+@snapshot.command(name="import")
+@click.argument("name")
+@click.argument("source")
+@pass_config
+def snapshot_import(config, name, source):
+    """
+    Receives a stream of snapshot export from SOURCE ('-' for stdin) as
+    snapshot NAME and restores it.
+    """
+    config.snapshot_manager.assert_environment(config)
+    _assert_streams_supported(config)
+    stream = _open_stream(source, "rb")
+    try:
+        if stream.read(len(STREAM_MAGIC)) != STREAM_MAGIC:
+            abort("Not a stream of odoo snapshot export.")
+        header = json.loads(stream.readline())
+        if header["backend"] != config.snapshot_manager.BACKEND:
+            abort(
+                f"Stream of {header['backend']} cannot be imported into "
+                f"{config.snapshot_manager.BACKEND}."
+            )
+        config.snapshot_manager.import_snapshot(
+            config,
+            name,
+            header["base"],
+            lambda cmd: _receive(cmd, stream, header["compressed"]),
+        )
+    finally:
+        if source != "-":
+            stream.close()
+    click.secho(f"Imported and restored snapshot {name}", fg="green")
+
+
 @snapshot.command(
     name="purge-inactive-subvolumes",
     help=(
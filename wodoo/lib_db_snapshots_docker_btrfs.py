@@ -1,4 +1,5 @@
 from operator import itemgetter
+import re
 import subprocess
 import arrow
 import sys
@@ -13,6 +14,9 @@ from pathlib import Path
 
 DOCKER_VOLUMES = Path("/var/lib/docker/volumes")
 SNAPSHOT_DIR = Path("/var/lib/docker/subvolumes")
+BACKEND = "btrfs"
+
+_cache = {}
 
 
 def __get_postgres_volume_name(config):
@@ -42,33 +46,67 @@ def _get_subvolume_dir(config):
     return subvolume_dir
 
 
-def _get_btrfs_infos(path):
-    info = {}
-    for line in (
-        subprocess.check_output(
-            ["sudo", search_env_path("btrfs"), "subvol", "show", str(path)]
+def _get_btrfs_snapshot_infos(path):
+    """
+    Creation times and subvolume ids of the snapshots below path from one
+    'btrfs subvolume list' call: {name: (date, id)}
+    """
+    output = subprocess.check_output(
+        _get_cmd_butter_volume() + ["list", "-o", "-s", str(path)],
+        encoding="utf8",
+    )
+    infos = {}
+    for line in output.splitlines():
+        match = re.search(r"^ID (\d+) .*otime (\S+ \S+) path (.*)$", line)
+        if not match:
+            continue
+        subvolume_id, otime, subvolume = match.groups()
+        subvolume = Path(subvolume)
+        if subvolume.parent.name != path.name:
+            continue
+        infos[subvolume.name] = (arrow.get(otime).datetime, subvolume_id)
+    return infos
+
+
+def _get_exclusive_sizes(path):
+    """
+    Exclusive bytes per subvolume id from the qgroups; empty if quotas are
+    not enabled (btrfs quota enable <mountpoint>).
+    """
+    try:
+        output = subprocess.check_output(
+            ["sudo", search_env_path("btrfs"), "qgroup", "show", "--raw", str(path)],
+            encoding="utf8",
+            stderr=subprocess.DEVNULL,
         )
-        .decode("utf-8")
-        .split("\n")
-    ):
-        if "Creation time:" in line:
-            line = line.split(":", 1)[1].strip()
-            line = " ".join(line.split(" ")[:2])
-            info["date"] = arrow.get(line).datetime
-    return info
+    except subprocess.CalledProcessError:
+        return {}
+    sizes = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and parts[0].startswith("0/") and parts[2].isdigit():
+            sizes[parts[0][2:]] = int(parts[2])
+    return sizes
 
 
 def __get_snapshots(config):
-    files = list(_get_subvolume_dir(config).glob("*"))
-    snapshots = list(
-        {
-            "path": str(x),
-            "name": x.name,
-            "date": _get_btrfs_infos(x)["date"],
-        }
-        for x in reversed(files)
-    )
-    return snapshots
+    """
+    Cached for the run of the command.
+    """
+    if "snapshots" not in _cache:
+        path = _get_subvolume_dir(config)
+        infos = _get_btrfs_snapshot_infos(path)
+        sizes = _get_exclusive_sizes(path)
+        _cache["snapshots"] = list(
+            {
+                "path": str(x),
+                "name": x.name,
+                "date": infos.get(x.name, (None, None))[0],
+                "size": sizes.get(infos.get(x.name, (None, None))[1]),
+            }
+            for x in reversed(list(path.glob("*")))
+        )
+    return _cache["snapshots"]
 
 
 def assert_environment(config):
@@ -141,6 +179,7 @@ def make_snapshot(ctx, config, name):
             str(dest_path),
         ]
     ).decode("utf-8").strip()
+    _cache.clear()
     __dc(config, ["up", "-d"] + ["postgres"])
     return name
 
@@ -175,6 +214,52 @@ def restore(config, name):
     __dc(config, ["up", "-d"] + ["postgres"])
 
 
+def _get_snapshot_path(config, name):
+    path = _get_subvolume_dir(config) / name
+    if not path.exists():
+        click.secho(f"Snapshot {name} not found!", fg="red")
+        sys.exit(-1)
+    return path
+
+
+def get_send_cmd(config, name, base):
+    cmd = ["sudo", search_env_path("btrfs"), "send"]
+    if base:
+        cmd += ["-p", str(_get_snapshot_path(config, base))]
+    return cmd + [str(_get_snapshot_path(config, name))]
+
+
+def import_snapshot(config, name, base, receive):
+    """
+    Receives the stream as snapshot name and restores it; an incremental
+    stream needs the received base snapshot.
+    """
+    path = _get_subvolume_dir(config)
+    if base:
+        _get_snapshot_path(config, base)
+    if (path / name).exists():
+        if not config.force:
+            click.secho(f"Snapshot {name} already exists.", fg="red")
+            sys.exit(-1)
+        remove(config, name)
+    tmp = path / ".import"
+    subprocess.check_call(["sudo", "rm", "-Rf", tmp])
+    subprocess.check_call(["sudo", "mkdir", tmp])
+    try:
+        receive(["sudo", search_env_path("btrfs"), "receive", str(tmp)])
+        received = list(tmp.iterdir())
+        if len(received) != 1:
+            raise Exception(f"Expected one received subvolume in {tmp}")
+        subprocess.check_call(["sudo", "mv", received[0], path / name])
+    finally:
+        # a broken receive leaves a subvolume behind
+        for leftover in tmp.glob("*"):
+            subprocess.call(_get_cmd_butter_volume() + ["delete", str(leftover)])
+        subprocess.check_call(["sudo", "rm", "-Rf", tmp])
+    _cache.clear()
+    restore(config, name)
+
+
 def remove(config, snapshot):
     snapshots = __get_snapshots(config)
     if isinstance(snapshot, str):
@@ -191,6 +276,7 @@ def remove(config, snapshot):
                 str(snapshot["path"]),
             ]
         )
+        _cache.clear()
 
 
 def purge_inactive(config):
@@ -0,0 +1,162 @@
+"""
+Snapshots of the stopped postgres volume as reflink copies
+(cp --reflink=always) for filesystems with shared extents but without
+subvolumes, e.g. XFS formatted with reflink=1. A snapshot shares all
+blocks with the volume until postgres changes them.
+
+Snapshots are stored in /var/lib/docker/reflink_snapshots/<volume>/<name>;
+the mtime of the snapshot folder is the creation time.
+"""
+from operator import itemgetter
+import subprocess
+import arrow
+import sys
+import click
+from .tools import __dc
+from .tools import search_env_path
+from pathlib import Path
+
+DOCKER_VOLUMES = Path("/var/lib/docker/volumes")
+SNAPSHOT_DIR = Path("/var/lib/docker/reflink_snapshots")
+BACKEND = "reflink"
+
+_reflink_supported = {}
+
+
+def __get_postgres_volume_name(config):
+    return f"{config.project_name}_odoo_postgres_volume"
+
+
+def _sudo(*cmd):
+    subprocess.check_call(["sudo"] + [str(x) for x in cmd])
+
+
+def _reflink_copy(source, dest):
+    _sudo(search_env_path("cp"), "-a", "--reflink=always", source, dest)
+
+
+def reflink_supported(path=DOCKER_VOLUMES):
+    """
+    Tries a reflink copy of an empty file in path; the result is kept per
+    process, as every snapshot command asks for it.
+    """
+    path = str(path)
+    if path not in _reflink_supported:
+        _reflink_supported[path] = _probe_reflink(path)
+    return _reflink_supported[path]
+
+
+def _probe_reflink(path):
+    probe = Path(path) / ".wodoo_reflink_probe"
+    try:
+        _sudo("touch", probe)
+        res = subprocess.call(
+            ["sudo", "cp", "--reflink=always", str(probe), f"{probe}.copy"],
+            stderr=subprocess.DEVNULL,
+        )
+        return not res
+    except (subprocess.CalledProcessError, OSError):
+        return False
+    finally:
+        try:
+            subprocess.call(
+                ["sudo", "rm", "-f", str(probe), f"{probe}.copy"],
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError:
+            pass
+
+
+def _get_snapshot_dir(config):
+    path = SNAPSHOT_DIR / __get_postgres_volume_name(config)
+    if not path.exists():
+        _sudo("mkdir", "-p", path)
+    return path
+
+
+def __get_snapshots(config):
+    snapshots = [
+        {
+            "path": str(x),
+            "name": x.name,
+            "date": arrow.get(x.stat().st_mtime).datetime,
+        }
+        for x in _get_snapshot_dir(config).glob("*")
+        if not x.name.startswith(".")
+    ]
+    return sorted(snapshots, key=lambda x: x["date"], reverse=True)
+
+
+def assert_environment(config):
+    if config.NAMED_ODOO_POSTGRES_VOLUME:
+        click.secho("Not compatible with NAMED_ODOO_POSTGRES_VOLUME.", fg="red")
+        sys.exit(-1)
+
+
+def make_snapshot(ctx, config, name):
+    volume_path = DOCKER_VOLUMES / __get_postgres_volume_name(config)
+    dest_path = _get_snapshot_dir(config) / name
+    if dest_path.exists():
+        if config.force:
+            remove(config, name)
+        else:
+            click.secho(f"Path {dest_path} already exists.", fg="red")
+            sys.exit(-1)
+
+    __dc(config, ["stop", "-t 1"] + ["postgres"])
+    try:
+        _reflink_copy(volume_path, dest_path)
+        # creation time of the snapshot
+        _sudo("touch", dest_path)
+    finally:
+        __dc(config, ["up", "-d"] + ["postgres"])
+    return name
+
+
+def restore(config, name):
+    if not name:
+        return
+    snapshot_path = _get_snapshot_dir(config) / name
+    if not snapshot_path.exists():
+        click.secho(f"Path {snapshot_path} does not exist.", fg="red")
+        sys.exit(-1)
+
+    volume_path = DOCKER_VOLUMES / __get_postgres_volume_name(config)
+    tmp_path = volume_path.parent / f".{volume_path.name}.restoring"
+    old_path = volume_path.parent / f".{volume_path.name}.old"
+    _sudo("rm", "-Rf", tmp_path, old_path)
+    _reflink_copy(snapshot_path, tmp_path)
+
+    __dc(config, ["stop", "-t 1"] + ["postgres"])
+    if volume_path.exists():
+        _sudo("mv", volume_path, old_path)
+    _sudo("mv", tmp_path, volume_path)
+    _sudo("rm", "-Rf", old_path)
+    __dc(config, ["rm", "-f"] + ["postgres"])
+    __dc(config, ["up", "-d"] + ["postgres"])
+
+
+def remove(config, snapshot):
+    snapshots = __get_snapshots(config)
+    if isinstance(snapshot, str):
+        snapshots = [x for x in snapshots if x["name"] == snapshot]
+        if not snapshots:
+            click.secho(f"Snapshot {snapshot} not found!", fg="red")
+            sys.exit(-1)
+        snapshot = snapshots[0]
+    if snapshot["path"] in map(itemgetter("path"), snapshots):
+        _sudo("rm", "-Rf", snapshot["path"])
+
+
+def clear_all(config):
+    _sudo("rm", "-Rf", _get_snapshot_dir(config))
+
+
+def purge_inactive(config):
+    if not SNAPSHOT_DIR.exists():
+        return
+    for vol in SNAPSHOT_DIR.glob("*"):
+        if not vol.is_dir() or (DOCKER_VOLUMES / vol.name).exists():
+            continue
+        click.secho(f"Deleting snapshots of {vol.name}", fg="red")
+        _sudo("rm", "-Rf", vol)
@@ -37,6 +37,7 @@ systemctl start docker
 """
 
 DOCKER_VOLUMES = Path("/var/lib/docker/volumes")
+BACKEND = "zfs"
 
 try:
     zfs = search_env_path("zfs")
@@ -113,36 +114,45 @@ def __get_snapshots(config):
 
 
 def _get_snapshots(config):
-    def _get_snaps():
-        for path in _get_possible_snapshot_paths(config):
-            for line in (
-                subprocess.check_output(
-                    ["sudo", zfs, "list", "-t", "snapshot", str(path)],
-                    encoding="utf8",
-                    stderr=subprocess.DEVNULL,  # ignore output of 'no datasets available'
-                )
-                .strip()
-                .splitlines()[1:]
-            ):
-                snapshotname = unify(line.split(" "))[0]
-                creation = unify(
-                    subprocess.check_output(
-                        ["sudo", zfs, "get", "-p", "creation", snapshotname],
-                        encoding="utf8",
-                    )
-                    .strip()
-                    .splitlines()[1]
-                )
-                _, _, timestamp, _ = creation.split(" ")
-                timestamp = arrow.get(int(timestamp)).datetime
-                info = {}
-                info["date"] = timestamp
-                info["fullpath"] = snapshotname
-                info["name"] = snapshotname.split("@")[1]
-                info["path"] = snapshotname.split("/")[-1]
-                yield info
-
-    yield from sorted(_get_snaps(), key=lambda x: x["date"], reverse=True)
+    """
+    All snapshots of the volume and its renamed predecessors (see restore)
+    from one zfs list call; cached for the run of the command.
+    """
+    if "snapshots" not in _cache:
+        zfs_path = _get_zfs_path(config)
+        output = subprocess.check_output(
+            [
+                "sudo",
+                zfs,
+                "list",
+                "-H",
+                "-p",
+                "-r",
+                "-t",
+                "snapshot",
+                "-o",
+                "name,creation,used",
+                config.ZFS_PATH_VOLUMES,
+            ],
+            encoding="utf8",
+        )
+        snapshots = []
+        for line in output.splitlines():
+            snapshotname, creation, used = line.split("\t")
+            dataset = snapshotname.split("@")[0]
+            if dataset != zfs_path and not dataset.startswith(zfs_path + "."):
+                continue
+            snapshots.append(
+                {
+                    "date": arrow.get(int(creation)).datetime,
+                    "fullpath": snapshotname,
+                    "name": snapshotname.split("@")[1],
+                    "path": snapshotname.split("/")[-1],
+                    "size": int(used),
+                }
+            )
+        _cache["snapshots"] = sorted(snapshots, key=lambda x: x["date"], reverse=True)
+    return _cache["snapshots"]
 
 
 _cache = {}
@@ -159,6 +169,10 @@ def _get_all_zfs():
     return _cache["folders"]
 
 
+def _clear_cache():
+    _cache.clear()
+
+
 def __is_zfs_fs(path_zfs):
     path_zfs = str(path_zfs)
     assert " " not in path_zfs
@@ -193,6 +207,7 @@ def _turn_into_subvolume(config):
     shutil.move(fullpath, filename)
     try:
         subprocess.check_output(["sudo", zfs, "create", fullpath_zfs])
+        _clear_cache()
         click.secho(
             f"Writing back the files to original position: from {filename}/ to {fullpath}/"
         )
@@ -227,14 +242,65 @@ def make_snapshot(ctx, config, name):
             if not answer["continue"]:
                 sys.exit(-1)
         subprocess.check_call(["sudo", zfs, "destroy", snapshot[0]["fullpath"]])
+        _clear_cache()
 
     assert " " not in name
     fullpath = _get_zfs_path(config) + "@" + name
     subprocess.check_call(["sudo", zfs, "snapshot", fullpath])
+    _clear_cache()
     __dc(config, ["up", "-d"] + ["postgres"])
     return name
 
 
+def _get_snapshot(config, name):
+    snapshot = [x for x in _get_snapshots(config) if x["name"] == name]
+    if not snapshot:
+        abort(f"Snapshot {name} does not exist.")
+    return snapshot[0]
+
+
+def get_send_cmd(config, name, base):
+    cmd = ["sudo", zfs, "send", "-c"]
+    if base:
+        cmd += ["-i", _get_snapshot(config, base)["fullpath"]]
+    return cmd + [_get_snapshot(config, name)["fullpath"]]
+
+
+def import_snapshot(config, name, base, receive):
+    """
+    Receives the stream into the volume: an incremental stream on top of
+    base, which must be the newest snapshot of the volume; a full stream
+    into a new filesystem, the current one is kept renamed like at
+    restore.
+    """
+    assert " " not in name and "@" not in name and "/" not in name
+    zfs_full_path = _get_zfs_path(config)
+    if base:
+        snapshots = [
+            x
+            for x in _get_snapshots(config)
+            if x["fullpath"].split("@")[0] == zfs_full_path
+        ]
+        if not snapshots or snapshots[0]["name"] != base:
+            abort(
+                f"The incremental stream needs {base} as newest snapshot of "
+                f"{zfs_full_path}; restore it first."
+            )
+    __dc(config, ["stop", "-t 1"] + ["postgres"])
+    if base:
+        receive(["sudo", zfs, "receive", "-F", f"{zfs_full_path}@{name}"])
+    else:
+        if __is_zfs_fs(zfs_full_path):
+            _try_umount(config)
+            subprocess.check_call(
+                ["sudo", zfs, "rename", zfs_full_path, _get_next_snapshotpath(config)]
+            )
+        receive(["sudo", zfs, "receive", f"{zfs_full_path}@{name}"])
+    _clear_cache()
+    __dc(config, ["rm", "-f"] + ["postgres"])
+    __dc(config, ["up", "-d"] + ["postgres"])
+
+
 def _try_umount(config):
     zfs_full_path = _get_zfs_path(config)
     umount = search_env_path("umount")
@@ -287,11 +353,27 @@ def restore(config, name):
                 zfs_full_path,
             ]
         )
+        _clear_cache()
     __dc(config, ["rm", "-f"] + ["postgres"])
     __dc(config, ["up", "-d"] + ["postgres"])
 
 
-def remove(config, snapshot):
+def get_clones(config, snapshot):
+    """
+    Datasets cloned from the snapshot - after restoring an older snapshot
+    the live volume is one of them.
+    """
+    output = subprocess.check_output(
+        ["sudo", zfs, "get", "-H", "-o", "value", "clones", snapshot["fullpath"]],
+        encoding="utf8",
+    ).strip()
+    return [x for x in output.split(",") if x and x != "-"]
+
+
+def remove(config, snapshot, recursive=True):
+    """
+    :param recursive: destroys the clones of the snapshot too (zfs -R)
+    """
     zfs = search_env_path("zfs")
     snapshots = __get_snapshots(config)
     if isinstance(snapshot, str):
@@ -302,7 +384,12 @@ def remove(config, snapshot):
         snapshot = snapshots[0]
     if snapshot["fullpath"] in map(itemgetter("fullpath"), snapshots):
         _try_umount(config)
-        subprocess.check_call(["sudo", zfs, "destroy", "-R", snapshot["fullpath"]])
+        subprocess.check_call(
+            ["sudo", zfs, "destroy"]
+            + (["-R"] if recursive else [])
+            + [snapshot["fullpath"]]
+        )
+        _clear_cache()
 
 
 def remove_volume(config):
@@ -316,6 +403,7 @@ def remove_volume(config):
             pass
         subprocess.check_call(["sudo", zfs, "destroy", "-R", path])
         click.secho(f"Removed: {path}", fg="yellow")
+    _clear_cache()
     clear_all(config)
 
 def _get_pool_mountpoint(poolname):
@@ -335,4 +423,5 @@ def clear_all(config):
     _try_umount(config)
     diskpath = translate_poolPath_to_fullPath(zfs_full_path)
     if __is_zfs_fs(diskpath):
-        subprocess.check_call(["sudo", zfs, "destroy", "-r", zfs_full_path])
\ No newline at end of file
+        subprocess.check_call(["sudo", zfs, "destroy", "-r", zfs_full_path])
+        _clear_cache()
\ No newline at end of file
@@ -1,68 +1,155 @@
-import subprocess
-import yaml
-import arrow
-import json
-import pipes
-import re
-import traceback
+"""
+Snapshots as template copies inside the postgres server:
+CREATE DATABASE <db>_snapshot_<name> TEMPLATE <db> (STRATEGY FILE_COPY on
+postgres 15+). Works with every postgres, no host tools needed.
+
+Name and date are kept in the comment of the snapshot database; the
+snapshot databases do not allow connections, so odoo does not list them.
+"""
 import sys
-import shutil
-import hashlib
-import os
-import tempfile
+import json
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import arrow
 import click
-import inquirer
-from datetime import datetime
 from .tools import measure_time
-from .tools import exec_file_in_path
-from .tools import remove_webassets
-from .tools import _askcontinue
-from .tools import get_volume_names
-from .cli import cli, pass_config, Commands
-from .lib_clickhelpers import AliasedGroup
-from .tools import __hash_odoo_password
-from .tools import _remove_postgres_connections, _execute_sql
+
+# parallel drop database statements of remove_many
+DROP_WORKERS = 4
+
+
+def _get_prefix(config):
+    return f"{config.dbname}_snapshot_"
+
+
+def _get_dbname(config, name):
+    return _get_prefix(config) + name
+
+
+@contextmanager
+def _cursor(config):
+    conn = config.get_odoo_conn().clone(dbname="postgres").get_psyco_connection()
+    conn.autocommit = True
+    cr = conn.cursor()
+    try:
+        yield cr
+    finally:
+        cr.close()
+        conn.close()
+
+
+def _terminate_backends(cr, dbnames):
+    cr.execute(
+        "select pg_terminate_backend(pid) from pg_stat_activity "
+        "where datname = any(%s) and pid <> pg_backend_pid()",
+        (list(dbnames),),
+    )
+
+
+def _get_strategy(cr):
+    cr.execute("show server_version_num")
+    if int(cr.fetchone()[0]) >= 150000:
+        return " STRATEGY FILE_COPY"
+    return ""
+
 
 def __get_snapshots(config):
-    conn = config.get_odoo_conn().clone(dbname='postgres')
-    snapshots = [x[0] for x in _execute_sql(
-        conn,
-        "select datname from pg_database where datname like '{}_%_snapshot_%'".format(
-            config.dbname,
-        ),
-        notransaction=True,
-        fetchall=True,
-    )]
-    return snapshots
+    prefix = _get_prefix(config)
+    with _cursor(config) as cr:
+        cr.execute(
+            "select datname, pg_database_size(oid), "
+            "shobj_description(oid, 'pg_database') "
+            "from pg_database where left(datname, %s) = %s order by datname",
+            (len(prefix), prefix),
+        )
+        rows = cr.fetchall()
+    snapshots = []
+    for datname, size, comment in rows:
+        try:
+            info = json.loads(comment or "{}")
+        except ValueError:
+            info = {}
+        snapshots.append(
+            {
+                "name": info.get("name", datname[len(prefix) :]),
+                "date": info.get("date", ""),
+                "path": datname,
+                "size": size,
+            }
+        )
+    return sorted(snapshots, key=lambda x: x["date"])
+
 
 def assert_environment(config):
-    exec_file_in_path('createdb')
-    exec_file_in_path('psql')
-    exec_file_in_path('dropdb')
-
-def restore(config, snap):
-    _remove_postgres_connections(config.get_odoo_conn())
-    subprocess.call([
-        exec_file_in_path('dropdb'),
-        config.dbname,
-    ])
-    subprocess.call([
-        exec_file_in_path('createdb'),
-        '-T',
-        snap,
-        config.dbname,
-    ])
+    pass
+
+
+def _exists(cr, dbname):
+    cr.execute("select 1 from pg_database where datname = %s", (dbname,))
+    return bool(cr.fetchone())
+
 
 @measure_time
-@click.pass_context
 def make_snapshot(ctx, config, name):
-    now = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-    snapshot_name = f"{config.dbname}_{name}_snapshot_{now}"
-    Commands.invoke(ctx, "backup", snapshot_name)
-    return snapshot_name
+    dbname = _get_dbname(config, name)
+    with _cursor(config) as cr:
+        if _exists(cr, dbname):
+            if not config.force:
+                click.secho(f"Snapshot {name} already exists.", fg="red")
+                sys.exit(-1)
+            cr.execute(f'drop database "{dbname}"')
+        strategy = _get_strategy(cr)
+        _terminate_backends(cr, [config.dbname])
+        cr.execute(
+            f'create database "{dbname}" template "{config.dbname}"{strategy}'
+        )
+        comment = json.dumps({"name": name, "date": arrow.get().isoformat()})
+        cr.execute(f"comment on database \"{dbname}\" is %s", (comment,))
+        cr.execute(f'alter database "{dbname}" allow_connections false')
+    return name
+
+
+def restore(config, name):
+    """
+    Copies the snapshot to a temporary database first; the current
+    database is dropped only when the copy exists.
+    """
+    dbname = _get_dbname(config, name)
+    tmp_dbname = f"{config.dbname}_restoring_snapshot"
+    with _cursor(config) as cr:
+        if not _exists(cr, dbname):
+            click.secho(f"Snapshot {name} not found!", fg="red")
+            sys.exit(-1)
+        strategy = _get_strategy(cr)
+        cr.execute(f'drop database if exists "{tmp_dbname}"')
+        cr.execute(f'create database "{tmp_dbname}" template "{dbname}"{strategy}')
+        _terminate_backends(cr, [config.dbname])
+        cr.execute(f'drop database if exists "{config.dbname}"')
+        cr.execute(f'alter database "{tmp_dbname}" rename to "{config.dbname}"')
+    click.secho(f"Restored snapshot {name}", fg="green")
+
+
+def _drop(config, dbname):
+    with _cursor(config) as cr:
+        cr.execute(f'drop database if exists "{dbname}"')
+
+
+def remove_many(config, snapshots):
+    """
+    Drops the snapshot databases in parallel.
+    """
+    dbnames = [
+        x["path"] if isinstance(x, dict) else _get_dbname(config, x) for x in snapshots
+    ]
+    if not dbnames:
+        return
+    with ThreadPoolExecutor(max_workers=DROP_WORKERS) as executor:
+        list(executor.map(lambda dbname: _drop(config, dbname), dbnames))
+
 
 def remove(config, snapshot):
-    subprocess.call([
-        exec_file_in_path('dropdb'),
-        snapshot,
-    ])
+    remove_many(config, [snapshot])
+
+
+def clear_all(config):
+    remove_many(config, __get_snapshots(config))
@@ -0,0 +1,208 @@
+import os
+import shutil
+import time
+import click
+from pathlib import Path
+from .tools import abort
+from .tools import _get_filestore_folder
+from .cli import cli, pass_config
+from .lib_clickhelpers import AliasedGroup
+from . import filestore_pool
+
+# used by odoo's own garbage collector
+SKIP_DIRS = ["checklist"]
+
+
+@cli.group(cls=AliasedGroup)
+@pass_config
+def files(config):
+    pass
+
+
+def _walk_sorted(folder, prefix=""):
+    """
+    Yields the relative paths of all files below folder in the byte order
+    of the path strings (like 'order by ... collate "C"'); directories sort
+    with their trailing slash.
+    """
+    with os.scandir(folder) as it:
+        entries = list(it)
+    entries = sorted(
+        entries, key=lambda x: x.name + ("/" if x.is_dir(follow_symlinks=False) else "")
+    )
+    for entry in entries:
+        relpath = prefix + entry.name
+        if entry.is_dir(follow_symlinks=False):
+            if not prefix and entry.name in SKIP_DIRS:
+                continue
+            yield from _walk_sorted(entry.path, relpath + "/")
+        elif entry.is_file(follow_symlinks=False):
+            yield relpath, entry
+
+
+def _iter_store_fnames(conn, itersize=10000):
+    """
+    store_fname values in the same order as _walk_sorted; read with a
+    server side cursor.
+    """
+    connection = conn.get_psyco_connection()
+    try:
+        cr = connection.cursor(name="wodoo_files_gc")
+        cr.itersize = itersize
+        cr.execute(
+            "select distinct store_fname collate \"C\" from ir_attachment "
+            "where store_fname is not null order by 1"
+        )
+        for (store_fname,) in cr:
+            yield store_fname
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+def _find_orphans(files, store_fnames):
+    """
+    Merge join of the two sorted streams; yields the files without
+    store_fname.
+    """
+    store_fname = next(store_fnames, None)
+    for relpath, entry in files:
+        while store_fname is not None and store_fname < relpath:
+            store_fname = next(store_fnames, None)
+        if store_fname != relpath:
+            yield relpath, entry
+
+
+@files.command()
+@click.option("-n", "--dry-run", is_flag=True)
+@click.option(
+    "-q",
+    "--quarantine",
+    type=click.Path(file_okay=False),
+    help="Move the files there instead of deleting them",
+)
+@click.option(
+    "--min-age",
+    default=24,
+    help="Hours; newer files may belong to attachments not committed yet",
+)
+@pass_config
+def gc(config, dry_run, quarantine, min_age):
+    """
+    Removes files of the filestore no attachment refers to.
+    """
+    import humanize
+
+    folder = _get_filestore_folder(config)
+    if not folder.exists():
+        abort(f"Filestore not found: {folder}")
+    if not dry_run and not quarantine and not config.force:
+        click.confirm(
+            f"Unreferenced files in {folder} are deleted. Continue?", abort=True
+        )
+    conn = config.get_odoo_conn()
+    max_mtime = time.time() - min_age * 3600
+
+    count, size, skipped = 0, 0, 0
+    for relpath, entry in _find_orphans(
+        _walk_sorted(folder), _iter_store_fnames(conn)
+    ):
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime > max_mtime:
+            skipped += 1
+            continue
+        count += 1
+        size += stat.st_size
+        if dry_run:
+            if config.verbose:
+                click.echo(relpath)
+            continue
+        if quarantine:
+            dest = Path(quarantine) / relpath
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(entry.path, dest)
+        else:
+            os.unlink(entry.path)
+
+    action = "found" if dry_run else ("moved" if quarantine else "removed")
+    click.secho(
+        f"{count} unreferenced files {action}: {humanize.naturalsize(size)}",
+        fg="green",
+    )
+    if skipped:
+        click.secho(
+            f"{skipped} unreferenced files younger than {min_age}h kept.",
+            fg="yellow",
+        )
+
+
+@files.command()
+@click.option("--all", "all_dbs", is_flag=True, help="All filestores of this host")
+@pass_config
+def dedup(config, all_dbs):
+    """
+    Turns the filestore into hardlinks of the shared pool.
+    """
+    import humanize
+
+    if all_dbs:
+        folders = [
+            x for x in (config.dirs["odoo_data_dir"] / "filestore").iterdir() if x.is_dir()
+        ]
+    else:
+        folders = [_get_filestore_folder(config)]
+    pool = filestore_pool.get_pool_dir(config)
+    for folder in folders:
+        linked, saved = filestore_pool.dedup(folder, pool)
+        click.secho(
+            f"{folder.name}: {linked} files linked, {humanize.naturalsize(saved)} freed",
+            fg="green",
+        )
+
+
+@files.command()
+@click.argument("source_db")
+@pass_config
+def copy(config, source_db):
+    """
+    Replaces the filestore by hardlinks of the filestore of SOURCE_DB.
+    """
+    source = config.dirs["odoo_data_dir"] / "filestore" / source_db
+    if not source.exists():
+        abort(f"Filestore not found: {source}")
+    dest = _get_filestore_folder(config)
+    if dest.exists():
+        if not config.force:
+            click.confirm(f"Filestore {dest} is replaced. Continue?", abort=True)
+        shutil.rmtree(dest)
+    filestore_pool.link_tree(source, dest)
+    click.secho(f"Linked {source} to {dest}", fg="green")
+
+
+@files.command(name="pool-gc")
+@click.option("-n", "--dry-run", is_flag=True)
+@pass_config
+def pool_gc(config, dry_run):
+    """
+    Removes files of the shared pool no filestore links to.
+    """
+    import humanize
+
+    count, size = filestore_pool.gc(filestore_pool.get_pool_dir(config), dry_run)
+    click.secho(
+        f"{count} pool files {'found' if dry_run else 'removed'}: "
+        f"{humanize.naturalsize(size)}",
+        fg="green",
+    )
+
+
+@files.command(name="pool-stats")
+@pass_config
+def pool_stats(config):
+    import humanize
+
+    count, size, logical = filestore_pool.stats(filestore_pool.get_pool_dir(config))
+    click.echo(
+        f"{count} files, {humanize.naturalsize(size)} on disk, "
+        f"{humanize.naturalsize(logical)} referenced by filestores"
+    )
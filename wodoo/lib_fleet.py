@@ -0,0 +1,248 @@
+"""
+Runs an odoo command for many projects of this host in parallel.
+
+Projects are the folders ~/.odoo/run/<project> (their settings name the
+source folder in CUSTOMS_DIR) or the lines of a list file. Every run is
+a separate odoo process with its own log; at most --jobs run at once,
+I/O heavy operations at most FLEET_IO_JOBS and operations on the same
+postgres server (not RUN_POSTGRES) at most FLEET_JOBS_PER_POSTGRES.
+New runs wait while the load average exceeds the number of cpus.
+"""
+import os
+import sys
+import time
+import threading
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import arrow
+import click
+from .tools import abort
+from .cli import cli, pass_config
+from .lib_clickhelpers import AliasedGroup
+
+# arguments of the odoo command and whether it is I/O heavy
+OPERATIONS = {
+    "backup": (["backup", "all"], True),
+    "update": (["update", "--non-interactive"], False),
+    "snapshot": (["snapshot", "save"], True),
+    "snapshot-prune": (["snapshot", "prune"], False),
+    "daddy-cleanup": (["daddy-cleanup", "${DUMPS_PATH}/*"], True),
+}
+
+
+class Project(object):
+    def __init__(self, name, customs_dir, settings):
+        self.name = name
+        self.customs_dir = customs_dir
+        self.settings = settings
+
+    @property
+    def postgres_key(self):
+        """
+        Projects with the same key share a postgres server.
+        """
+        if self.settings.get("RUN_POSTGRES") == "1":
+            return None
+        return (self.settings.get("DB_HOST"), self.settings.get("DB_PORT"))
+
+
+def _load_project(name):
+    from .myconfigparser import MyConfigParser
+
+    settings_file = Path(os.environ["HOME"]) / ".odoo" / "run" / name / "settings"
+    if not settings_file.exists():
+        return None
+    settings = MyConfigParser(settings_file)
+    settings = {k: settings[k] for k in settings.keys()}
+    return Project(name, settings.get("CUSTOMS_DIR"), settings)
+
+
+def discover(list_file=None):
+    if list_file:
+        names = [
+            x.strip()
+            for x in Path(list_file).read_text().splitlines()
+            if x.strip() and not x.strip().startswith("#")
+        ]
+    else:
+        run_dir = Path(os.environ["HOME"]) / ".odoo" / "run"
+        names = sorted(x.name for x in run_dir.iterdir()) if run_dir.exists() else []
+    projects = []
+    for name in names:
+        project = _load_project(name)
+        if not project or not project.customs_dir:
+            click.secho(f"{name}: no settings / CUSTOMS_DIR - skipped", fg="yellow")
+            continue
+        projects.append(project)
+    return projects
+
+
+def _get_args(project, operation, extra_args, dumps_paths):
+    """
+    (args, io_heavy, skip) of operation for project; skip is the reason
+    why the project is not run.
+
+    dumps_paths maps the dumps folders already handled to their project:
+    the cleanup of a folder shared by many projects runs once.
+    """
+    args, io_heavy = OPERATIONS[operation]
+    if any("${DUMPS_PATH}" in x for x in args):
+        # an empty DUMPS_PATH would turn ${DUMPS_PATH}/* into /*
+        dumps_path = project.settings.get("DUMPS_PATH", "")
+        if not dumps_path or not Path(dumps_path).expanduser().is_dir():
+            return None, io_heavy, f"DUMPS_PATH '{dumps_path}' is not a directory"
+        resolved = str(Path(dumps_path).expanduser().resolve())
+        if resolved in dumps_paths:
+            return None, io_heavy, f"DUMPS_PATH shared with {dumps_paths[resolved]}"
+        dumps_paths[resolved] = project.name
+        args = [x.replace("${DUMPS_PATH}", resolved) for x in args]
+    return args + list(extra_args), io_heavy, None
+
+
+class Limits(object):
+    def __init__(self, io_jobs, jobs_per_postgres):
+        self.io = threading.Semaphore(io_jobs)
+        self.jobs_per_postgres = jobs_per_postgres
+        self.postgres = {}
+        self.lock = threading.Lock()
+        self.running = 0
+
+    def _postgres(self, key):
+        with self.lock:
+            if key not in self.postgres:
+                self.postgres[key] = threading.Semaphore(self.jobs_per_postgres)
+            return self.postgres[key]
+
+    def _wait_for_cpu(self):
+        # a single run always may start
+        while self.running and os.getloadavg()[0] > (os.cpu_count() or 1):
+            time.sleep(5)
+
+    def acquire(self, project, io_heavy):
+        acquired = []
+        if io_heavy:
+            self.io.acquire()
+            acquired.append(self.io)
+        if project.postgres_key:
+            semaphore = self._postgres(project.postgres_key)
+            semaphore.acquire()
+            acquired.append(semaphore)
+        self._wait_for_cpu()
+        with self.lock:
+            self.running += 1
+        return acquired
+
+    def release(self, acquired):
+        with self.lock:
+            self.running -= 1
+        for semaphore in reversed(acquired):
+            semaphore.release()
+
+
+def _run(project, args, io_heavy, limits, log_dir):
+    acquired = limits.acquire(project, io_heavy)
+    log_file = log_dir / f"{project.name}.log"
+    started = time.time()
+    try:
+        cmd = [sys.argv[0], "-f", "--chdir", project.customs_dir, "-p", project.name]
+        click.secho(f"{project.name}: {' '.join(args)}", fg="yellow")
+        with open(log_file, "w") as log:
+            rc = subprocess.call(
+                cmd + args,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+            )
+    except Exception as ex:
+        rc = str(ex)
+    finally:
+        limits.release(acquired)
+    duration = time.time() - started
+    click.secho(
+        f"{project.name}: {'ok' if not rc else 'failed'} after {int(duration)}s",
+        fg="green" if not rc else "red",
+    )
+    return project.name, rc, duration, log_file
+
+
+@cli.group(cls=AliasedGroup)
+@pass_config
+def fleet(config):
+    pass
+
+
+@fleet.command(name="list")
+@click.option("-l", "--list-file", help="File with one project name per line")
+def do_list(list_file):
+    from tabulate import tabulate
+
+    rows = []
+    for project in discover(list_file):
+        postgres = "RUN_POSTGRES"
+        if project.postgres_key:
+            postgres = ":".join(map(str, project.postgres_key))
+        rows.append((project.name, project.customs_dir, postgres))
+    click.echo(tabulate(rows, ["Project", "Source", "Postgres"]))
+
+
+@fleet.command(name="run")
+@click.argument("operation", type=click.Choice(sorted(OPERATIONS)))
+@click.argument("extra_args", nargs=-1)
+@click.option("-l", "--list-file", help="File with one project name per line")
+@click.option("-P", "--project", multiple=True, help="Only these projects")
+@click.option("-j", "--jobs", type=int, help="Default: FLEET_JOBS or cpus / 2")
+@pass_config
+def fleet_run(config, operation, extra_args, list_file, project, jobs):
+    """
+    Runs OPERATION for all projects; EXTRA_ARGS are appended to the odoo
+    command.
+    """
+    from tabulate import tabulate
+
+    projects = discover(list_file)
+    if project:
+        projects = [x for x in projects if x.name in project]
+    if not projects:
+        abort("No projects found.")
+    jobs = jobs or config.fleet_jobs_as_int or max(1, (os.cpu_count() or 2) // 2)
+    limits = Limits(
+        config.fleet_io_jobs_as_int or 2,
+        config.fleet_jobs_per_postgres_as_int or 2,
+    )
+    log_dir = (
+        Path(os.environ["HOME"])
+        / ".odoo"
+        / "fleet"
+        / arrow.get().strftime(f"%Y%m%d%H%M%S-{operation}")
+    )
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures, skipped, dumps_paths = [], [], {}
+        for x in projects:
+            args, io_heavy, skip = _get_args(x, operation, extra_args, dumps_paths)
+            if skip:
+                click.secho(f"{x.name}: {skip} - skipped", fg="yellow")
+                skipped.append((x.name, skip))
+                continue
+            futures.append(executor.submit(_run, x, args, io_heavy, limits, log_dir))
+        results = [x.result() for x in futures]
+
+    rows = [
+        (name, "ok" if not rc else f"failed ({rc})", f"{int(duration)}s", log_file)
+        for name, rc, duration, log_file in sorted(
+            results, key=lambda x: x[2], reverse=True
+        )
+    ]
+    rows += [(name, f"skipped ({reason})", "", "") for name, reason in skipped]
+    click.echo(tabulate(rows, ["Project", "Status", "Duration", "Log"]))
+    failed = [x for x in results if x[1]]
+    click.secho(
+        f"{len(results) - len(failed)} ok, {len(failed)} failed, "
+        f"{len(skipped)} skipped in {int(time.time() - started)}s",
+        fg="red" if failed else "green",
+    )
+    if failed:
+        sys.exit(1)
@@ -316,15 +316,19 @@ def restore_web_icons(ctx, config):
 
 
 def _get_available_modules(ctx, param, incomplete):
-    from .odoo_config import MANIFEST
+    from .odoo_config import MANIFEST, MANIFEST_FILE
+    from . import completion_cache
 
-    try:
+    def _compute():
         manifest = MANIFEST()
         if not manifest:
             raise Exception("no manifest")
+        return manifest["install"], [manifest.path]
+
+    try:
+        modules = completion_cache.get(MANIFEST_FILE().parent, "modules", _compute)
     except:
         return []
-    modules = manifest["install"]
     if incomplete:
         modules = [x for x in modules if incomplete in x]
     return sorted(modules)
@@ -662,6 +666,9 @@ def update(
                 config.odoo_update_start_notification_touch_file_in_container
             ).write_text("0")
 
+    if config.snapshot_before_update:
+        Commands.invoke(ctx, "snapshot_before_update")
+
     if not uninstall:
         _perform_install(module)
 
@@ -966,10 +973,19 @@ def _exec_update(config, params, non_interactive=False):
 def _get_available_robottests(ctx, param, incomplete):
     from .robo_helpers import _get_all_robottest_files
     from .odoo_config import customs_dir
+    from . import completion_cache
+
+    root = customs_dir() or Path(os.getcwd())
+    path = root / (Path(os.getcwd()).relative_to(root))
 
-    path = customs_dir() or Path(os.getcwd())
-    path = path / (Path(os.getcwd()).relative_to(path))
-    testfiles = list(map(str, _get_all_robottest_files(path))) or []
+    def _compute():
+        testfiles = _get_all_robottest_files(path)
+        folders = set([path]) | set((path / x).parent for x in testfiles)
+        return list(map(str, testfiles)), sorted(map(str, folders))
+
+    testfiles = completion_cache.get(
+        root, f"robottests:{path}", _compute, background=True
+    )
     if incomplete:
         if "/" in incomplete:
             testfiles = list(filter(lambda x: str(x).startswith(incomplete), testfiles))
@@ -282,9 +282,23 @@ class OdooShRepo(object):
 
 
 def _get_available_oca_modules(ctx, param, incomplete):
+    from . import completion_cache
+
     sh = OdooShRepo(current_version())
-    modules = sh.find_module(incomplete, exact_match=False)
-    matches = [str(x) for x in sorted(set([x.name for x in modules]))]
+
+    def _compute():
+        modules = [
+            x.parent
+            for x in sh.ocapath.rglob("__manifest__.py")
+            if x.parent.parent.name == sh.version
+        ]
+        folders = set([sh.ocapath]) | set(x.parent for x in modules)
+        return sorted(set(x.name for x in modules)), sorted(map(str, folders))
+
+    modules = completion_cache.get(
+        sh.root, f"oca-modules:{sh.version}", _compute, background=True
+    )
+    matches = [x for x in modules if incomplete in x]
     if incomplete:
         matches = matches[:10]
     return matches
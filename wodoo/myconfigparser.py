@@ -1,7 +1,11 @@
 # used to read and write to settings
+import os
 import sys
 from pathlib import Path
 
+# path -> (stat signature, Settings)
+_settings_cache = {}
+
 def _get_ignore_case_item(d, k):
     try:
         return d[k]
@@ -69,6 +73,7 @@ class MyConfigParser:
             if not self.fileName.is_file():
                 self.fileName.parent.mkdir(exist_ok=True, parents=True)
                 self.fileName.write_text("")
+            _settings_cache.pop(str(self.fileName.absolute()), None)
             with self.fileName.open("r+") as file:
                 lines = file.readlines()
                 # Truncate file so we don't need to close it and open it again
@@ -127,3 +132,61 @@ class MyConfigParser:
             return self[key]
         except Exception:
             return default_value
+
+
+class Settings(object):
+    """
+    Read only view of a settings file with typed accessors; keys are case
+    insensitive. Use get_settings to get the cached instance.
+    """
+
+    def __init__(self, values):
+        self._values = {k.upper(): v for k, v in values.items()}
+
+    def keys(self):
+        return self._values.keys()
+
+    def __contains__(self, key):
+        return key.upper() in self._values
+
+    def __getitem__(self, key):
+        return self._values[key.upper()]
+
+    def get(self, key, default_value=""):
+        return self._values.get(key.upper(), default_value)
+
+    def get_bool(self, key, default_value=False):
+        value = self.get(key, None)
+        if value is None or value == "":
+            return default_value
+        return value == "1"
+
+    def get_int(self, key, default_value=0):
+        return int(self.get(key, "") or default_value)
+
+    def get_path(self, key, default_value=None):
+        value = self.get(key, "")
+        if not value:
+            return default_value
+        return Path(os.path.expanduser(value))
+
+
+def get_settings(fileName):
+    """
+    Parses the settings file once per process; it is parsed again if its
+    modification time or size changed.
+    """
+    path = Path(fileName).absolute()
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        signature = None
+    else:
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    cached = _settings_cache.get(str(path))
+    if cached and cached[0] == signature:
+        return cached[1]
+    values = MyConfigParser(path).configOptions if signature else {}
+    settings = Settings(values)
+    _settings_cache[str(path)] = (signature, settings)
+    return settings
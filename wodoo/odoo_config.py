@@ -1,4 +1,6 @@
 from contextlib import contextmanager
+import ast
+import copy
 import shutil
 import tempfile
 from datetime import datetime
@@ -98,6 +100,34 @@ def MANIFEST_FILE():
     return _customs_dir.resolve().absolute() / "MANIFEST"
 
 
+# path -> (stat signature, parsed MANIFEST); shared by all MANIFEST_CLASS
+_manifest_cache = {}
+
+
+def _parse_manifest(text):
+    text = text or "{}"
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        # written by _update as json (true/false/null)
+        return json.loads(text)
+
+
+def _read_manifest(path):
+    """
+    Parsed content of the MANIFEST; read again only if it changed.
+    Callers must not modify the result.
+    """
+    stat = path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    cached = _manifest_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    data = OrderedDict(_parse_manifest(path.read_text()))
+    _manifest_cache[path] = (signature, data)
+    return data
+
+
 class MANIFEST_CLASS(object):
     def __init__(self):
         self.path = MANIFEST_FILE()
@@ -105,8 +135,7 @@ class MANIFEST_CLASS(object):
         self._apply_defaults()
 
     def _apply_defaults(self):
-        d = self._get_data()
-        d.setdefault("modules", [])
+        d = _read_manifest(self.path)
         # patches ?
 
         self.patch_dir = customs_dir() / "patches"
@@ -115,14 +144,16 @@ class MANIFEST_CLASS(object):
             self["version"] = float(d["version"])
 
     def _get_data(self):
-        return OrderedDict(eval(self.path.read_text() or "{}"))
+        return copy.deepcopy(_read_manifest(self.path))
 
     def __getitem__(self, key):
-        data = self._get_data()
-        return data[key]
+        return copy.deepcopy(_read_manifest(self.path)[key])
 
     def get(self, key, default):
-        return self._get_data().get(key, default)
+        data = _read_manifest(self.path)
+        if key not in data:
+            return default
+        return copy.deepcopy(data[key])
 
     def __setitem__(self, key, value):
         data = self._get_data()
@@ -135,6 +166,8 @@ class MANIFEST_CLASS(object):
         tfile = Path(tempfile.mktemp(suffix=".MANIFEST"))
         tfile.write_text(s)
         shutil.move(tfile, MANIFEST_FILE())
+        _manifest_cache.pop(self.path, None)
+        _read_manifest(self.path)
 
     def rewrite(self):
         self._update(self._get_data())
@@ -171,7 +204,7 @@ def get_settings():
     Can run outside of host and inside host. Returns all values from
     composed settings file.
     """
-    from .myconfigparser import MyConfigParser  # NOQA
+    from .myconfigparser import get_settings as get_cached_settings  # NOQA
 
     if os.getenv("DOCKER_MACHINE") == "1":
         settings_path = Path("/tmp/settings")
@@ -181,8 +214,7 @@ def get_settings():
         settings_path.write_text(content)
     else:
         settings_path = Path(os.environ["HOST_RUN_DIR"]) / "settings"
-    myconfig = MyConfigParser(settings_path)
-    return myconfig
+    return get_cached_settings(settings_path)
 
 
 def get_conn(db=None, host=None):
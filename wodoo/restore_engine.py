@@ -0,0 +1,784 @@
+"""
+Table wise, resumable restore of pg_restore archives (custom and directory
+format).
+
+The archive is restored in steps: pre-data, the data of each table, the
+remaining data entries (sequences, blobs) and post-data (indexes and
+constraints first, then foreign keys and triggers). Every finished step
+is recorded in a checkpoint file in ${run}/restore, so a failed
+restore continues with the first unfinished step. A monitor thread
+samples pg_stat_progress_copy (postgres 14+) and writes the throughput to
+the console and to a progress file.
+
+With cold tables the data of these tables and the foreign keys that
+cannot be created without it are left out; they are written to a deferred
+file and loaded into the live database later (restore_deferred).
+"""
+import os
+import re
+import json
+import time
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import arrow
+import click
+from .tools import _execute_sql
+from .tools import _get_server_version_num
+from .tools import exec_file_in_path
+from .tools import __dc as _dc
+from .tools import __concurrent_safe_write_file as _safe_write_file
+
+DATA_TYPES = ["TABLE DATA", "SEQUENCE SET", "BLOBS", "BLOB DATA", "LARGE OBJECT DATA"]
+POST_DATA_TYPES = [
+    "CONSTRAINT",
+    "INDEX",
+    "FK CONSTRAINT",
+    "INDEX ATTACH",
+    "TRIGGER",
+    "EVENT TRIGGER",
+    "RULE",
+    "POLICY",
+    "ROW SECURITY",
+    "STATISTICS",
+    "MATERIALIZED VIEW DATA",
+    "PUBLICATION TABLE",
+    "PUBLICATION TABLES IN SCHEMA",
+    "CHECK CONSTRAINT",
+]
+# built in parallel without dependencies between each other
+POST_DATA_FIRST_WAVE = ["CONSTRAINT", "INDEX"]
+# belong to the section of the object they follow in the toc
+INHERIT_SECTION_TYPES = ["COMMENT", "SECURITY LABEL", "ACL"]
+SKIP_TYPES = ["DATABASE", "DATABASE PROPERTIES"]
+
+# longest first, so that "TABLE DATA" is not taken for "TABLE"
+KNOWN_TYPES = sorted(
+    set(
+        DATA_TYPES
+        + POST_DATA_TYPES
+        + [
+            "TABLE",
+            "TABLE ATTACH",
+            "SEQUENCE",
+            "SEQUENCE OWNED BY",
+            "DEFAULT",
+            "VIEW",
+            "MATERIALIZED VIEW",
+            "FUNCTION",
+            "PROCEDURE",
+            "AGGREGATE",
+            "TYPE",
+            "DOMAIN",
+            "EXTENSION",
+            "SCHEMA",
+            "DEFAULT ACL",
+            "TEXT SEARCH CONFIGURATION",
+            "TEXT SEARCH DICTIONARY",
+            "FOREIGN TABLE",
+            "LARGE OBJECT",
+        ]
+        + INHERIT_SECTION_TYPES
+        + SKIP_TYPES
+    ),
+    key=len,
+    reverse=True,
+)
+
+MONITOR_INTERVAL = 5
+
+
+class TocEntry(object):
+    def __init__(self, line, id, desc, schema, tag, owner):
+        self.line = line
+        self.id = id
+        self.desc = desc
+        self.schema = schema
+        self.tag = tag
+        self.owner = owner
+        self.section = None
+        self.inherits_section = desc in INHERIT_SECTION_TYPES
+
+    @property
+    def table(self):
+        """
+        Table the entry belongs to, if it can be told from the toc line.
+        """
+        if self.desc in ["TABLE DATA", "TABLE"]:
+            return self.tag
+        if self.desc in ["CONSTRAINT", "FK CONSTRAINT", "TRIGGER", "POLICY", "RULE"]:
+            return self.tag.split(" ")[0]
+        return None
+
+    @property
+    def key(self):
+        if self.desc == "TABLE DATA":
+            return f"data:{self.schema}.{self.tag}"
+        return f"{self.id}"
+
+
+def parse_toc(lines):
+    """
+    Parses the output of pg_restore -l
+    Line format: <id>; <tableoid> <oid> <DESC> <schema> <tag> <owner>
+    """
+    section = "pre-data"
+    for entry in _parse_toc_lines(lines):
+        if entry.desc in DATA_TYPES:
+            section = "data"
+        elif entry.desc in POST_DATA_TYPES:
+            section = "post-data"
+        elif not entry.inherits_section:
+            section = "pre-data"
+        entry.section = section
+        yield entry
+
+
+def _parse_toc_lines(lines):
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(";"):
+            continue
+        id, rest = line.split(";", 1)
+        rest = rest.strip().split(" ", 2)[2]
+        desc = next((x for x in KNOWN_TYPES if rest.startswith(x + " ")), None)
+        if not desc:
+            desc = rest.split(" ")[0]
+        tokens = rest[len(desc) :].strip().split(" ")
+        yield TocEntry(
+            line=line,
+            id=int(id),
+            desc=desc,
+            schema=tokens[0],
+            tag=" ".join(tokens[1:-1]),
+            owner=tokens[-1],
+        )
+
+
+def is_pg_restore_archive(path):
+    path = Path(path)
+    if path.is_dir():
+        return (path / "toc.dat").exists()
+    if not path.is_file():
+        return False
+    with open(path, "rb") as file:
+        return file.read(5) == b"PGDMP"
+
+
+class PgRestoreRunner(object):
+    """
+    Executes pg_restore (and pg_dump) either inside a long running helper container of the
+    cronjobshell service (where the dump is mounted) or on the host.
+    """
+
+    def __init__(self, config, host, port, user, password, dbname, dumps_path):
+        self.config = config
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.dbname = dbname
+        self.dumps_path = Path(dumps_path)
+        self.container_name = None
+
+    def __enter__(self):
+        if self.config.use_docker:
+            self.container_name = f"{self.config.PROJECT_NAME}_restore_worker"
+            subprocess.call(
+                ["docker", "rm", "-f", self.container_name],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            _dc(
+                self.config,
+                [
+                    "run",
+                    "-d",
+                    "--rm",
+                    "--name",
+                    self.container_name,
+                    "--entrypoint",
+                    "sleep infinity",
+                    "-v",
+                    f"{self.dumps_path}:/host/dumps2",
+                    "cronjobshell",
+                ],
+            )
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if self.container_name:
+            subprocess.call(
+                ["docker", "rm", "-f", self.container_name],
+                stdout=subprocess.DEVNULL,
+            )
+
+    def path(self, filename):
+        """
+        Path of a file in the dumps folder as seen by pg_restore.
+        """
+        if self.container_name:
+            return f"/host/dumps2/{filename}"
+        return str(self.dumps_path / filename)
+
+    def _cmd(self, executable):
+        if self.container_name:
+            return [
+                "docker",
+                "exec",
+                "-i",
+                "-e",
+                f"PGPASSWORD={self.password}",
+                self.container_name,
+                executable,
+            ]
+        return [str(exec_file_in_path(executable))]
+
+    def list(self, filename):
+        return subprocess.check_output(
+            self._cmd("pg_restore") + ["-l", self.path(filename)],
+            encoding="utf8",
+            env=self._env(),
+        ).splitlines()
+
+    def dump(self, args):
+        """
+        Runs pg_dump for the database; paths in args must be given by path().
+        """
+        cmd = self._cmd("pg_dump") + [
+            "-h",
+            str(self.host),
+            "-p",
+            str(self.port),
+            "-U",
+            self.user,
+        ]
+        subprocess.run(cmd + args + [self.dbname], check=True, env=self._env())
+
+    def _env(self):
+        env = dict(os.environ)
+        env["PGPASSWORD"] = self.password
+        return env
+
+    def restore(
+        self,
+        filename,
+        entries,
+        ignore_errors=False,
+        workers=1,
+        single_transaction=False,
+    ):
+        """
+        Restores the given toc entries; the list file is passed on stdin.
+        With single_transaction a failed or aborted restore leaves nothing
+        behind.
+        """
+        cmd = self._cmd("pg_restore") + [
+            "-h",
+            str(self.host),
+            "-p",
+            str(self.port),
+            "-U",
+            self.user,
+            "-d",
+            self.dbname,
+            "--no-owner",
+            "--no-privileges",
+            "-L",
+            "/dev/stdin",
+        ]
+        if workers > 1:
+            cmd += ["-j", str(workers)]
+        if single_transaction:
+            cmd += ["--single-transaction"]
+        elif not ignore_errors:
+            cmd += ["--exit-on-error"]
+        cmd += [self.path(filename)]
+        listing = "\n".join(x.line for x in entries) + "\n"
+        process = subprocess.run(
+            cmd,
+            input=listing,
+            encoding="utf8",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=self._env(),
+        )
+        if process.returncode:
+            if not ignore_errors:
+                raise Exception(
+                    f"pg_restore failed for {entries[0].desc} "
+                    f"{entries[0].tag}:\n{process.stdout}"
+                )
+            click.secho(process.stdout, fg="yellow")
+
+
+class Checkpoint(object):
+    def __init__(self, path, dump_path, dbname):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        stat = Path(dump_path).stat()
+        self.identity = {
+            "dump": str(dump_path),
+            "signature": [stat.st_size, stat.st_mtime_ns],
+            "database": dbname,
+        }
+        self.done = set()
+
+    def load(self):
+        """
+        Returns True if a checkpoint of the same dump and database exists.
+        """
+        if not self.path.exists():
+            return False
+        try:
+            data = json.loads(self.path.read_text())
+        except ValueError:
+            return False
+        if {k: data.get(k) for k in self.identity} != self.identity:
+            return False
+        self.done = set(data["done"])
+        return True
+
+    def _write(self):
+        data = dict(self.identity)
+        data["done"] = sorted(self.done)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        _safe_write_file(self.path, json.dumps(data, indent=4))
+
+    def reset(self):
+        with self.lock:
+            self.done = set()
+            self._write()
+
+    def mark_done(self, key):
+        with self.lock:
+            self.done.add(key)
+            self._write()
+
+    def remove(self):
+        if self.path.exists():
+            self.path.unlink()
+
+
+def _qualified_table_name(name):
+    """
+    Schema qualified name; the regclass names of pg_stat_progress_copy and
+    older catalog entries leave out the public schema.
+    """
+    return name if "." in name else f"public.{name}"
+
+
+def _quote_ident(name):
+    """
+    Like quote_ident of postgres (keywords left aside), so that the keys
+    match those of regclass::text and dump_catalog.get_row_estimates.
+    """
+    if re.match(r"^[a-z_][a-z0-9_$]*$", name):
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _table_key(schema, table):
+    return f"{_quote_ident(schema)}.{_quote_ident(table)}"
+
+
+class ProgressMonitor(threading.Thread):
+    """
+    Samples pg_stat_progress_copy and reports rows/s, MB/s and ETA per table.
+    """
+
+    def __init__(self, conn, progress_file, row_estimates=None):
+        super().__init__(daemon=True)
+        self.conn = conn
+        self.progress_file = Path(progress_file)
+        self.row_estimates = {
+            _qualified_table_name(k): v for k, v in (row_estimates or {}).items()
+        }
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.phase = ""
+        self.started = arrow.get()
+        self.last = {}
+        self.can_sample = _get_server_version_num(conn) >= 140000
+
+    def set_phase(self, phase):
+        self.phase = phase
+        click.secho(f"Restore phase: {phase}", fg="yellow")
+        self.write()
+
+    def table_started(self, table):
+        with self.lock:
+            self.tables[table] = {
+                "state": "running",
+                "started": arrow.get().isoformat(),
+                "rows": 0,
+                "bytes": 0,
+            }
+
+    def table_done(self, table):
+        with self.lock:
+            info = self.tables.setdefault(table, {"rows": 0})
+            duration = (
+                arrow.get() - arrow.get(info.get("started", self.started.isoformat()))
+            ).total_seconds()
+            size = _execute_sql(
+                self.conn,
+                "select pg_total_relation_size(%s::regclass)",
+                params=(table,),
+                fetchone=True,
+            )[0]
+            info.update(
+                {
+                    "state": "done",
+                    "bytes": size,
+                    "duration": duration,
+                    "mb_per_sec": round(size / 1024 / 1024 / max(duration, 0.001), 2),
+                }
+            )
+        click.secho(
+            f"Restored {table} in {round(duration, 1)}s "
+            f"({info['mb_per_sec']} MB/s)",
+            fg="green",
+        )
+        self.write()
+
+    def _sample(self):
+        rows = _execute_sql(
+            self.conn,
+            (
+                "select relid::regclass::text, tuples_processed, bytes_processed "
+                "from pg_stat_progress_copy "
+                f"where datname = '{self.conn.dbname}'"
+            ),
+            fetchall=True,
+        )
+        now = time.time()
+        for table, tuples, bytes in rows:
+            table = _qualified_table_name(table)
+            last_time, last_tuples, last_bytes = self.last.get(
+                table, (now, tuples, bytes)
+            )
+            self.last[table] = (now, tuples, bytes)
+            elapsed = now - last_time
+            if not elapsed:
+                continue
+            rows_per_sec = (tuples - last_tuples) / elapsed
+            mb_per_sec = (bytes - last_bytes) / elapsed / 1024 / 1024
+            eta = None
+            estimate = self.row_estimates.get(table)
+            if estimate and rows_per_sec:
+                eta = max(0, int((estimate - tuples) / rows_per_sec))
+            with self.lock:
+                info = self.tables.setdefault(table, {"state": "running"})
+                info.update(
+                    {
+                        "rows": tuples,
+                        "bytes": bytes,
+                        "rows_per_sec": int(rows_per_sec),
+                        "mb_per_sec": round(mb_per_sec, 2),
+                        "eta": eta,
+                    }
+                )
+            click.secho(
+                f"{table}: {tuples} rows, {int(rows_per_sec)} rows/s, "
+                f"{round(mb_per_sec, 2)} MB/s, "
+                f"ETA {'n/a' if eta is None else str(eta) + 's'}"
+            )
+
+    def write(self):
+        with self.lock:
+            data = {
+                "database": self.conn.dbname,
+                "phase": self.phase,
+                "started": self.started.isoformat(),
+                "updated": arrow.get().isoformat(),
+                "tables": self.tables,
+            }
+            self.progress_file.parent.mkdir(exist_ok=True, parents=True)
+            _safe_write_file(
+                self.progress_file, json.dumps(data, indent=4)
+            )
+
+    def run(self):
+        while not self.stop_event.wait(MONITOR_INTERVAL):
+            try:
+                if self.can_sample:
+                    self._sample()
+                self.write()
+            except Exception as ex:
+                click.secho(f"Progress sampling failed: {ex}", fg="yellow")
+
+    def stop(self):
+        self.stop_event.set()
+        self.write()
+
+
+def get_checkpoint_file(config, dbname):
+    return config.dirs["run/restore"] / f"{dbname}.checkpoint.json"
+
+
+def get_progress_file(config, dbname):
+    return config.dirs["run/restore"] / f"{dbname}.progress.json"
+
+
+def _parallel(entries, method, workers):
+    """
+    Calls method for all entries with workers threads; returns the entries
+    that raised.
+    """
+    failed = []
+
+    def _run(entry):
+        try:
+            method(entry)
+        except Exception as ex:
+            click.secho(str(ex), fg="red")
+            failed.append(entry)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(_run, entries))
+    return failed
+
+
+def read_toc(runner, filename, exclude_tables=None):
+    """
+    Toc entries of the archive without the database itself, the public
+    schema and the data of excluded tables.
+    """
+    exclude_tables = exclude_tables or []
+    return [
+        x
+        for x in parse_toc(runner.list(filename))
+        if x.desc not in SKIP_TYPES
+        and not (x.desc == "SCHEMA" and x.tag == "public")
+        and not (x.desc == "TABLE DATA" and x.tag in exclude_tables)
+    ]
+
+
+def restore(
+    runner,
+    conn,
+    checkpoint,
+    monitor,
+    filename,
+    workers=1,
+    exclude_tables=None,
+    ignore_errors=False,
+    cold_tables=None,
+):
+    """
+    Restores the archive filename into conn.dbname step by step. Steps that
+    are found in the checkpoint are skipped. Owners and privileges are not
+    restored.
+
+    :param conn: DBConnection to the database that is restored
+    :param cold_tables: their data is not restored; returns the toc entries
+    left out (data and foreign keys) for restore_deferred
+    """
+    exclude_tables = exclude_tables or []
+    cold_tables = cold_tables or []
+    deferred = []
+    toc = read_toc(runner, filename, exclude_tables)
+    pre_data = [x for x in toc if x.section == "pre-data"]
+    table_data = [x for x in toc if x.desc == "TABLE DATA"]
+    deferred += [x for x in table_data if x.tag in cold_tables]
+    table_data = [x for x in table_data if x.tag not in cold_tables]
+    other_data = [
+        x for x in toc if x.section == "data" and x.desc != "TABLE DATA"
+    ]
+    post_data = [x for x in toc if x.section == "post-data"]
+    deferred += [
+        x for x in post_data if x.desc == "FK CONSTRAINT" and x.table in cold_tables
+    ]
+    post_data = [x for x in post_data if x not in deferred]
+    monitor.start()
+    try:
+        if "pre-data" not in checkpoint.done:
+            monitor.set_phase("pre-data")
+            runner.restore(filename, pre_data, ignore_errors=ignore_errors)
+            checkpoint.mark_done("pre-data")
+
+        monitor.set_phase("data")
+        _restore_table_data(
+            runner,
+            conn,
+            checkpoint,
+            monitor,
+            filename,
+            [x for x in table_data if x.key not in checkpoint.done],
+            workers,
+            ignore_errors,
+        )
+        if other_data and "data-other" not in checkpoint.done:
+            runner.restore(filename, other_data, ignore_errors=ignore_errors)
+            checkpoint.mark_done("data-other")
+
+        monitor.set_phase("post-data")
+        deferred += _restore_post_data(
+            runner,
+            checkpoint,
+            filename,
+            [x for x in post_data if x.key not in checkpoint.done],
+            workers,
+            ignore_errors,
+            defer_foreign_keys=bool(cold_tables),
+        )
+        monitor.set_phase("done")
+    finally:
+        monitor.stop()
+    return deferred
+
+
+def _restore_table_data(
+    runner,
+    conn,
+    checkpoint,
+    monitor,
+    filename,
+    entries,
+    workers,
+    ignore_errors,
+    truncate=True,
+    single_transaction=False,
+):
+    def _load(entry):
+        table = _table_key(entry.schema, entry.tag)
+        monitor.table_started(table)
+        if truncate:
+            # partially loaded at a previous try
+            _execute_sql(conn, f"truncate only {table}")
+        runner.restore(
+            filename,
+            [entry],
+            ignore_errors=ignore_errors,
+            single_transaction=single_transaction,
+        )
+        checkpoint.mark_done(entry.key)
+        try:
+            monitor.table_done(table)
+        except Exception as ex:
+            # the table is loaded - statistics must not fail the restore
+            click.secho(f"No statistics for {table}: {ex}", fg="yellow")
+
+    failed = _parallel(entries, _load, workers)
+    if failed:
+        raise Exception(
+            "Restore of tables failed: " + ", ".join(x.tag for x in failed)
+        )
+
+
+def _restore_post_data(
+    runner,
+    checkpoint,
+    filename,
+    entries,
+    workers,
+    ignore_errors,
+    defer_foreign_keys=False,
+):
+    """
+    Returns the foreign keys that failed, if defer_foreign_keys is set;
+    they usually reference the data of cold tables.
+    """
+
+    def _restore(entry):
+        runner.restore(filename, [entry], ignore_errors=ignore_errors)
+        checkpoint.mark_done(entry.key)
+
+    first_wave = [x for x in entries if x.desc in POST_DATA_FIRST_WAVE]
+    second_wave = [
+        x
+        for x in entries
+        if x.desc not in POST_DATA_FIRST_WAVE and not x.inherits_section
+    ]
+    failed = _parallel(first_wave, _restore, workers)
+    # foreign keys lock both tables and may deadlock with each other, so
+    # failed ones get a second, serial try
+    failed += _parallel(second_wave, _restore, workers)
+    deferred = []
+    for entry in failed:
+        try:
+            _restore(entry)
+        except Exception:
+            if not defer_foreign_keys or entry.desc != "FK CONSTRAINT":
+                raise
+            click.secho(f"Deferring foreign key {entry.tag}", fg="yellow")
+            deferred.append(entry)
+    # comments on the objects created above
+    for entry in entries:
+        if entry.inherits_section:
+            _restore(entry)
+    return deferred
+
+
+def get_deferred_file(config, dbname):
+    return config.dirs["run/restore"] / f"{dbname}.deferred.json"
+
+
+def write_deferred(path, dump_path, filename, dumps_path, entries):
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    _safe_write_file(
+        path,
+        json.dumps(
+            {
+                "dump": str(dump_path),
+                "filename": str(filename),
+                "dumps_path": str(dumps_path),
+                "entries": [x.line for x in entries],
+            },
+            indent=4,
+        ),
+    )
+
+
+def read_deferred(path):
+    """
+    Returns the content of the deferred file with the toc entries parsed.
+    """
+    data = json.loads(Path(path).read_text())
+    data["entries"] = list(_parse_toc_lines(data["entries"]))
+    return data
+
+
+def restore_deferred(
+    runner, conn, checkpoint, monitor, filename, entries, workers, ignore_errors
+):
+    """
+    Loads the deferred table data into the live database and creates the
+    deferred foreign keys afterwards. Tables are not truncated: new records
+    may have been created meanwhile. Every table is loaded in a single
+    transaction instead, so an interrupted load leaves it as before and
+    the next call loads it again.
+    """
+    table_data = [x for x in entries if x.desc == "TABLE DATA"]
+    foreign_keys = [x for x in entries if x.desc != "TABLE DATA"]
+    monitor.start()
+    try:
+        monitor.set_phase("deferred data")
+        _restore_table_data(
+            runner,
+            conn,
+            checkpoint,
+            monitor,
+            filename,
+            [x for x in table_data if x.key not in checkpoint.done],
+            workers,
+            ignore_errors,
+            truncate=False,
+            single_transaction=True,
+        )
+        monitor.set_phase("deferred foreign keys")
+        _restore_post_data(
+            runner,
+            checkpoint,
+            filename,
+            [x for x in foreign_keys if x.key not in checkpoint.done],
+            workers,
+            ignore_errors,
+        )
+        monitor.set_phase("done")
+    finally:
+        monitor.stop()
@@ -0,0 +1,156 @@
+"""
+Template databases of restored dumps.
+
+After a restore the restored database is copied to a template database
+named after the content hash of the dump. Restoring the same dump again is
+then just a CREATE DATABASE ... TEMPLATE. The meta data (dump file, hash,
+last usage) is stored as comment on the template database, so the
+postgres instance itself is the registry.
+
+RESTORE_TEMPLATE_CACHE=<n> keeps the n most recently used templates;
+0 disables the cache.
+"""
+import json
+import hashlib
+import arrow
+import click
+from .tools import _execute_sql
+from .tools import _clone_database
+from .tools import _remove_postgres_connections
+from . import dump_catalog
+
+TEMPLATE_PREFIX = "wodoo_tpl_"
+
+
+def get_dump_hash(config, filepath):
+    """
+    sha256 of the dump file; kept in the dump catalog, so that unchanged
+    multi-GB files are not read again.
+    """
+    return dump_catalog.get_sha256(filepath)
+
+
+def get_keep_count(config):
+    return config.restore_template_cache_as_int or 0
+
+
+def get_template_key(dump_hash, exclude_tables=None, dev_project=None):
+    """
+    :param dev_project: set if the template represents the state after
+    the dev scripts of that project ran
+    """
+    key = "|".join(
+        [
+            dump_hash,
+            ",".join(sorted(exclude_tables or [])),
+            dev_project or "",
+        ]
+    )
+    return hashlib.sha256(key.encode("utf8")).hexdigest()
+
+
+def get_template_name(key):
+    return TEMPLATE_PREFIX + key[:32]
+
+
+def get_templates(conn):
+    rows = _execute_sql(
+        conn.clone(dbname="postgres"),
+        (
+            "select datname, shobj_description(oid, 'pg_database'), "
+            "pg_database_size(oid) "
+            "from pg_database "
+            f"where datname like '{TEMPLATE_PREFIX}%'"
+        ),
+        fetchall=True,
+    )
+    templates = []
+    for name, comment, size in rows:
+        try:
+            info = json.loads(comment or "{}")
+        except ValueError:
+            info = {}
+        info["name"] = name
+        info["size"] = size
+        info.setdefault("last_used", "")
+        templates.append(info)
+    return sorted(templates, key=lambda x: x["last_used"], reverse=True)
+
+
+def _set_info(conn, name, info):
+    info = json.dumps(info).replace("'", "''")
+    _execute_sql(
+        conn.clone(dbname="postgres"),
+        f"comment on database {name} is '{info}'",
+        notransaction=True,
+    )
+
+
+def find_template(conn, keys):
+    """
+    Returns the first existing template of the given keys.
+    """
+    templates = {x["name"]: x for x in get_templates(conn)}
+    for key in keys:
+        name = get_template_name(key)
+        if name in templates:
+            return templates[name]
+
+
+def touch_template(conn, template):
+    info = {k: v for k, v in template.items() if k not in ["name", "size"]}
+    info["last_used"] = arrow.get().isoformat()
+    _set_info(conn, template["name"], info)
+
+
+def clone_template(conn, template, dest_db):
+    click.secho(f"Cloning {dest_db} from template {template['name']}", fg="green")
+    _clone_database(conn, template["name"], dest_db)
+    touch_template(conn, template)
+
+
+def store_template(conn, source_db, key, filename, dev_project=None):
+    name = get_template_name(key)
+    drop_template(conn, name)
+    click.secho(f"Storing {source_db} as template {name}", fg="yellow")
+    _clone_database(conn, source_db, name)
+    _execute_sql(
+        conn.clone(dbname="postgres"),
+        f"alter database {name} with allow_connections false is_template true",
+        notransaction=True,
+    )
+    _set_info(
+        conn,
+        name,
+        {
+            "filename": str(filename),
+            "dev": dev_project or "",
+            "last_used": arrow.get().isoformat(),
+        },
+    )
+
+
+def drop_template(conn, name):
+    assert name.startswith(TEMPLATE_PREFIX)
+    conn = conn.clone(dbname="postgres")
+    exists = _execute_sql(
+        conn,
+        f"select count(*) from pg_database where datname = '{name}'",
+        fetchone=True,
+    )[0]
+    if not exists:
+        return
+    _execute_sql(
+        conn, f"alter database {name} with is_template false", notransaction=True
+    )
+    _remove_postgres_connections(conn.clone(dbname=name))
+    _execute_sql(conn, f"drop database {name}", notransaction=True)
+
+
+def prune_templates(conn, keep):
+    """
+    Drops the least recently used templates, so that keep are left.
+    """
+    for template in get_templates(conn)[keep:]:
+        click.secho(f"Dropping template {template['name']}", fg="yellow")
+        drop_template(conn, template["name"])
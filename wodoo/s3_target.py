@@ -0,0 +1,228 @@
+"""
+S3 compatible object storage as backup target (AWS, MinIO, ...).
+
+Dumps are addressed as s3://<bucket>/<key>. Backups are streamed from
+pg_dump into a multipart upload: parts of PART_SIZE bytes are uploaded
+in parallel while the next ones are read, no local file is written.
+Restores read the object with parallel ranged GETs and feed it into
+pg_restore/psql.
+
+Next to the dumps of a prefix the index .wodoo_catalog.json keeps the
+dump type of every uploaded dump, like the local dump catalog.
+
+Requires boto3; endpoint and credentials come from S3_ENDPOINT_URL,
+S3_REGION, S3_ACCESS_KEY and S3_SECRET_KEY or the usual AWS settings.
+"""
+import io
+import json
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+import arrow
+from .tools import abort
+
+SCHEME = "s3://"
+PART_SIZE = 64 * 1024 * 1024
+RANGE_SIZE = 16 * 1024 * 1024
+CATALOG_KEY = ".wodoo_catalog.json"
+
+
+def is_s3_url(url):
+    return bool(url) and str(url).startswith(SCHEME)
+
+
+def parse_url(url):
+    bucket, _, key = str(url)[len(SCHEME) :].partition("/")
+    if not bucket:
+        abort(f"Invalid url: {url}")
+    return bucket, key
+
+
+def get_client(config):
+    try:
+        import boto3
+    except ImportError:
+        abort("S3 targets require boto3: pip install boto3")
+    return boto3.client(
+        "s3",
+        endpoint_url=config.s3_endpoint_url or None,
+        region_name=config.s3_region or None,
+        aws_access_key_id=config.s3_access_key or None,
+        aws_secret_access_key=config.s3_secret_key or None,
+    )
+
+
+def _read_full(stream, size):
+    """
+    Reads size bytes unless the stream ends; pipes return less per read.
+    """
+    parts, missing = [], size
+    while missing:
+        data = stream.read(missing)
+        if not data:
+            break
+        parts.append(data)
+        missing -= len(data)
+    return b"".join(parts)
+
+
+def upload(config, stream, url, dump_type, workers=4, check=None):
+    """
+    Uploads the binary stream to url; returns the size.
+
+    :param check: called at the end of the stream before the upload is
+                  completed; if it raises (e.g. pg_dump failed) the upload
+                  is aborted and nothing is stored under url.
+    """
+    client = get_client(config)
+    bucket, key = parse_url(url)
+    data = _read_full(stream, PART_SIZE)
+    if len(data) < PART_SIZE:
+        if check:
+            check()
+        client.put_object(Bucket=bucket, Key=key, Body=data)
+        _register(client, bucket, key, dump_type)
+        return len(data)
+
+    upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+    parts, size = [], 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            pending = []
+
+            def _upload_part(number, body):
+                res = client.upload_part(
+                    Bucket=bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body,
+                )
+                return {"PartNumber": number, "ETag": res["ETag"]}
+
+            while data:
+                size += len(data)
+                pending.append(executor.submit(_upload_part, len(pending) + 1, data))
+                # bounded memory: at most workers parts wait in memory
+                while sum(1 for x in pending if not x.done()) >= workers:
+                    next(x for x in pending if not x.done()).result()
+                data = _read_full(stream, PART_SIZE)
+            parts = [x.result() for x in pending]
+        if check:
+            check()
+        client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except BaseException:
+        client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    _register(client, bucket, key, dump_type)
+    return size
+
+
+def _catalog_key(key):
+    return posixpath.join(posixpath.dirname(key), CATALOG_KEY)
+
+
+def _read_catalog(client, bucket, key):
+    try:
+        body = client.get_object(Bucket=bucket, Key=_catalog_key(key))["Body"]
+    except client.exceptions.NoSuchKey:
+        return {}
+    return json.loads(body.read())
+
+
+def _register(client, bucket, key, dump_type):
+    catalog = _read_catalog(client, bucket, key)
+    catalog[posixpath.basename(key)] = {
+        "type": dump_type,
+        "created": arrow.get().isoformat(),
+    }
+    client.put_object(
+        Bucket=bucket,
+        Key=_catalog_key(key),
+        Body=json.dumps(catalog, indent=4).encode("utf8"),
+    )
+
+
+def list_dumps(config, url):
+    """
+    Dumps below the prefix of url, newest first: dicts with name, size,
+    mtime and type.
+    """
+    client = get_client(config)
+    bucket, prefix = parse_url(url)
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    catalog = _read_catalog(client, bucket, prefix + CATALOG_KEY)
+    result = []
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        for obj in page.get("Contents", []):
+            name = obj["Key"][len(prefix) :]
+            if name.startswith("."):
+                continue
+            result.append(
+                {
+                    "name": name,
+                    "size": obj["Size"],
+                    "mtime": obj["LastModified"],
+                    "type": catalog.get(name, {}).get("type", ""),
+                }
+            )
+    return sorted(result, key=lambda x: x["mtime"], reverse=True)
+
+
+class RangedReader(io.RawIOBase):
+    """
+    Readable stream of an object; the next ranges are fetched ahead in
+    threads.
+    """
+
+    def __init__(self, config, url, workers=4):
+        self.client = get_client(config)
+        self.bucket, self.key = parse_url(url)
+        self.size = self.client.head_object(Bucket=self.bucket, Key=self.key)[
+            "ContentLength"
+        ]
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.ahead = workers * 2
+        self.futures = []
+        self.offset = 0
+        self.buffer = memoryview(b"")
+
+    def _get(self, start, end):
+        res = self.client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end}"
+        )
+        return res["Body"].read()
+
+    def _fill(self):
+        while self.offset < self.size and len(self.futures) < self.ahead:
+            end = min(self.offset + RANGE_SIZE, self.size) - 1
+            self.futures.append(self.executor.submit(self._get, self.offset, end))
+            self.offset = end + 1
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.buffer:
+            self._fill()
+            if not self.futures:
+                return 0
+            self.buffer = memoryview(self.futures.pop(0).result())
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        super().close()
+
+
+def open_dump(config, url, workers=4):
+    return io.BufferedReader(RangedReader(config, url, workers), 1024 * 1024)
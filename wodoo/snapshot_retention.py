@@ -0,0 +1,58 @@
+"""
+Retention rules for snapshots.
+
+A snapshot is kept if it is one of the newest keep_last ones, the newest
+of one of the last keep_daily days or the newest of one of the last
+keep_weekly weeks. If the kept snapshots use more than max_size bytes,
+the oldest of them are dropped until they fit; the newest snapshot is
+always kept. Snapshots are dicts of the snapshot backends with name,
+date and size (None if the backend cannot tell).
+"""
+import arrow
+
+
+def _newest_per_period(snapshots, count, frame):
+    result, periods = [], set()
+    for snapshot in snapshots:
+        period = arrow.get(snapshot["date"]).floor(frame)
+        if period in periods:
+            continue
+        if len(periods) >= count:
+            break
+        periods.add(period)
+        result.append(snapshot)
+    return result
+
+
+def select(snapshots, keep_last=0, keep_daily=0, keep_weekly=0, max_size=0):
+    """
+    Returns (keep, remove), both newest first.
+    """
+    snapshots = sorted(
+        [x for x in snapshots if x.get("date")],
+        key=lambda x: arrow.get(x["date"]),
+        reverse=True,
+    )
+    keep = snapshots[:keep_last]
+    keep += _newest_per_period(snapshots, keep_daily, "day")
+    keep += _newest_per_period(snapshots, keep_weekly, "week")
+    if snapshots:
+        keep.append(snapshots[0])
+    keep_names = set(x["name"] for x in keep)
+    keep = [x for x in snapshots if x["name"] in keep_names]
+
+    if max_size:
+        while len(keep) > 1 and get_size(keep) > max_size:
+            keep.pop()
+
+    keep_names = set(x["name"] for x in keep)
+    remove = [x for x in snapshots if x["name"] not in keep_names]
+    return keep, remove
+
+
+def get_size(snapshots):
+    return sum(x.get("size") or 0 for x in snapshots)
+
+
+def has_sizes(snapshots):
+    return all(x.get("size") is not None for x in snapshots)
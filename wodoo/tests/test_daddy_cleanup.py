@@ -0,0 +1,150 @@
+import random
+from array import array
+import arrow
+from .. import daddy_cleanup
+from .. import incremental_backup
+
+# a wednesday; the sunday bin is 2024-06-09
+NOW = arrow.get(2024, 6, 12, 12)
+
+
+class FakeFiles(object):
+    """
+    Files of daddy_cleanup without the file system.
+    """
+
+    def __init__(self, files):
+        files = sorted(files, key=lambda x: x[1].timestamp())
+        self.paths = [x[0] for x in files]
+        self.is_set = [len(x) > 2 and x[2] for x in files]
+        self.mtimes = array("d", (x[1].timestamp() for x in files))
+        self.sizes = array("q", (0 for x in files))
+        self.sidecars = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+
+def _daily_files(start, end, hour=3):
+    day = start.replace(hour=hour)
+    while day <= end:
+        yield day.format("YYYY-MM-DD-HH"), day
+        day = day.shift(days=1)
+
+
+def _kept(plan):
+    return {x["path"] for x in plan if x["action"] == "keep"}
+
+
+def _old_kept(files, days_notouch, now):
+    """
+    The files get_to_delete_files kept before the rework: overlapping bins
+    of all families, the newest file of every bin survives.
+    """
+    bins = set()
+    for family in daddy_cleanup.get_bin_families(now).values():
+        bins |= set(family)
+    keep = set()
+    newest = {}
+    for path, mtime in zip(files.paths, files.mtimes):
+        mt = arrow.get(mtime)
+        if (now - mt).days <= days_notouch:
+            keep.add(path)
+            continue
+        for bin in bins:
+            if bin[0] <= mt <= bin[1]:
+                if bin not in newest or newest[bin][1] < mtime:
+                    newest[bin] = (path, mtime)
+    return keep | {x[0] for x in newest.values()}
+
+
+class TestRetention(object):
+    def test_bins(self):
+        families = daddy_cleanup.get_bin_families(NOW)
+        assert families["sunday"] == [
+            (arrow.get(2024, 6, 9), arrow.get(2024, 6, 9, 23, 59, 59))
+        ]
+        assert [x[0].format("YYYY-MM-DD") for x in families["week"]] == [
+            "2024-05-13",
+            "2024-05-20",
+            "2024-05-27",
+            "2024-06-03",
+        ]
+        assert [x[0].format("YYYY-MM") for x in families["month"]] == [
+            "2023-12",
+            "2024-01",
+            "2024-02",
+            "2024-03",
+            "2024-04",
+            "2024-05",
+        ]
+        assert [x[0].format("YYYY-MM") for x in families["quarter"]] == [
+            "2023-06",
+            "2023-09",
+            "2023-12",
+            "2024-03",
+        ]
+        assert families["year"][-1][0].year == 2024
+        assert len(families["year"]) == 20
+
+    def test_daily_backups(self):
+        files = FakeFiles(_daily_files(arrow.get(2021, 1, 1), NOW))
+        plan = daddy_cleanup.make_plan(files, 1, now=NOW)
+        assert _kept(plan) == {
+            # younger than a day
+            "2024-06-12-03",
+            "2024-06-11-03",
+            # newest of 2024
+            "2024-06-10-03",
+            # sunday and weeks
+            "2024-06-09-03",
+            "2024-06-02-03",
+            "2024-05-26-03",
+            "2024-05-19-03",
+            # months
+            "2024-05-31-03",
+            "2024-04-30-03",
+            "2024-03-31-03",
+            "2024-02-29-03",
+            "2024-01-31-03",
+            "2023-12-31-03",
+            # quarters
+            "2023-09-30-03",
+            "2023-06-30-03",
+            # years
+            "2022-12-31-03",
+            "2021-12-31-03",
+        }
+        assert len(plan) == len(files)
+
+    def test_same_files_as_before(self):
+        rnd = random.Random(42)
+        start = NOW.shift(years=-3).timestamp()
+        files = FakeFiles(
+            (f"file{i}", arrow.get(rnd.uniform(start, NOW.timestamp())))
+            for i in range(3000)
+        )
+        for days_notouch in [0, 1, 5]:
+            plan = daddy_cleanup.make_plan(files, days_notouch, now=NOW)
+            assert _kept(plan) == _old_kept(files, days_notouch, NOW)
+
+    def test_backup_set_chain(self, monkeypatch):
+        chains = {"/d/inc2": ["full", "inc1", "inc2"]}
+        monkeypatch.setattr(
+            incremental_backup,
+            "load_manifest",
+            lambda path: {"chain": chains.get(path, [])},
+        )
+        files = FakeFiles(
+            [
+                ("/d/other", arrow.get(2024, 5, 1), True),
+                ("/d/full", arrow.get(2024, 5, 10), True),
+                ("/d/inc1", arrow.get(2024, 5, 11), True),
+                ("/d/inc2", arrow.get(2024, 5, 12), True),
+            ]
+        )
+        plan = {x["path"]: x for x in daddy_cleanup.make_plan(files, 1, now=NOW)}
+        assert plan["/d/inc2"]["reason"] == "newest of month 2024-05-01"
+        assert plan["/d/full"]["reason"] == "needed by backup set inc2"
+        assert plan["/d/inc1"]["action"] == "keep"
+        assert plan["/d/other"]["action"] == "delete"
@@ -0,0 +1,139 @@
+import os
+from .. import restore_engine
+from .. import dump_catalog
+
+
+class TestProgressMonitor(object):
+    def _get_monitor(self, monkeypatch, tmp_path, row_estimates, samples):
+        monkeypatch.setattr(
+            restore_engine, "_get_server_version_num", lambda conn: 150000
+        )
+        monkeypatch.setattr(
+            restore_engine,
+            "_execute_sql",
+            lambda conn, sql, **kwargs: samples.pop(0),
+        )
+
+        class Conn(object):
+            dbname = "test"
+
+        return restore_engine.ProgressMonitor(
+            Conn(), tmp_path / "progress.json", row_estimates=row_estimates
+        )
+
+    def _sample_twice(self, monitor, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(restore_engine.time, "time", lambda: now[0])
+        monitor._sample()
+        now[0] += 10
+        monitor._sample()
+
+    def test_eta_with_qualified_estimates(self, monkeypatch, tmp_path):
+        samples = [[("res_partner", 1000, 0)], [("res_partner", 2000, 0)]]
+        monitor = self._get_monitor(
+            monkeypatch, tmp_path, {"public.res_partner": 12000}, samples
+        )
+        self._sample_twice(monitor, monkeypatch)
+        # 100 rows/s, 10000 rows left
+        assert monitor.tables["public.res_partner"]["eta"] == 100
+
+    def test_eta_with_unqualified_estimates(self, monkeypatch, tmp_path):
+        samples = [[("res_partner", 1000, 0)], [("res_partner", 2000, 0)]]
+        monitor = self._get_monitor(
+            monkeypatch, tmp_path, {"res_partner": 12000}, samples
+        )
+        self._sample_twice(monitor, monkeypatch)
+        assert monitor.tables["public.res_partner"]["eta"] == 100
+
+    def test_no_eta_without_estimate(self, monkeypatch, tmp_path):
+        samples = [[("other.data", 1000, 0)], [("other.data", 2000, 0)]]
+        monitor = self._get_monitor(
+            monkeypatch, tmp_path, {"public.res_partner": 12000}, samples
+        )
+        self._sample_twice(monitor, monkeypatch)
+        assert monitor.tables["other.data"]["eta"] is None
+
+    def test_eta_with_catalog_estimates(self, monkeypatch, tmp_path):
+        def _execute_sql(conn, sql, **kwargs):
+            assert "quote_ident(n.nspname)" in sql
+            return [("public.res_partner", 12000), ('public."Mixed"', 500)]
+
+        monkeypatch.setattr(dump_catalog, "_execute_sql", _execute_sql)
+        estimates = dump_catalog.get_row_estimates(None)
+        samples = [[("res_partner", 1000, 0)], [("res_partner", 2000, 0)]]
+        monitor = self._get_monitor(monkeypatch, tmp_path, estimates, samples)
+        self._sample_twice(monitor, monkeypatch)
+        assert monitor.tables["public.res_partner"]["eta"] == 100
+
+
+class TestTableData(object):
+    def test_table_key(self):
+        assert restore_engine._table_key("public", "res_partner") == (
+            "public.res_partner"
+        )
+        assert restore_engine._table_key("public", "Mixed") == 'public."Mixed"'
+        assert restore_engine._table_key("my-schema", 'a"b') == (
+            '"my-schema"."a""b"'
+        )
+
+    def test_statistics_do_not_fail_the_restore(self, monkeypatch):
+        executed = []
+        monkeypatch.setattr(
+            restore_engine,
+            "_execute_sql",
+            lambda conn, sql, **kwargs: executed.append(sql),
+        )
+
+        class Runner(object):
+            def restore(self, filename, entries, **kwargs):
+                pass
+
+        class Checkpoint(object):
+            done = set()
+
+            def mark_done(self, key):
+                self.done.add(key)
+
+        class Monitor(object):
+            def table_started(self, table):
+                pass
+
+            def table_done(self, table):
+                raise Exception("connection lost")
+
+        entry = restore_engine.TocEntry(
+            "1; 0 0 TABLE DATA public Mixed odoo",
+            1,
+            "TABLE DATA",
+            "public",
+            "Mixed",
+            "odoo",
+        )
+        checkpoint = Checkpoint()
+        restore_engine._restore_table_data(
+            Runner(), None, checkpoint, Monitor(), "dump", [entry], 1, False
+        )
+        assert checkpoint.done == {entry.key}
+        assert executed == ['truncate only public."Mixed"']
+
+
+class TestDumpCatalog(object):
+    def test_sha256_of_overwritten_dump_is_dropped(self, tmp_path):
+        dump = tmp_path / "odoo.dump.gz"
+        dump.write_bytes(b"\x1f\x8b" + b"a" * 100)
+        dump_catalog.update_entry(dump, {"sha256": "old"}, sidecar=True)
+        assert dump_catalog.get_sha256(dump) == "old"
+
+        # same size, other content and mtime
+        dump.write_bytes(b"\x1f\x8b" + b"b" * 100)
+        stat = dump.stat()
+        os.utime(dump, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert dump_catalog.get_sha256(dump) == dump_catalog.get_file_hash(dump)
+
+    def test_copy_keeps_sidecar(self, tmp_path):
+        dump = tmp_path / "odoo.dump.gz"
+        dump.write_bytes(b"\x1f\x8b" + b"a" * 100)
+        dump_catalog.update_entry(dump, {"type": "pg_custom"}, sidecar=True)
+        stat = dump.stat()
+        os.utime(dump, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert dump_catalog.get_entry(dump)["type"] == "pg_custom"
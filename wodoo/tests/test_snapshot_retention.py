@@ -0,0 +1,98 @@
+import types
+import arrow
+from .. import snapshot_retention
+from .. import lib_db_snapshots
+
+NOW = arrow.get(2024, 6, 12, 12)
+GB = 1024**3
+
+
+def _snapshot(name, hours_ago, size=None):
+    return {
+        "name": name,
+        "date": NOW.shift(hours=-hours_ago).datetime,
+        "size": size,
+    }
+
+
+def _names(snapshots):
+    return [x["name"] for x in snapshots]
+
+
+class TestSelect(object):
+    def test_keep_last(self):
+        snapshots = [_snapshot(f"s{i}", i) for i in range(6)]
+        keep, remove = snapshot_retention.select(snapshots, keep_last=3)
+        assert _names(keep) == ["s0", "s1", "s2"]
+        assert _names(remove) == ["s3", "s4", "s5"]
+
+    def test_newest_is_always_kept(self):
+        snapshots = [_snapshot(f"s{i}", i) for i in range(3)]
+        keep, remove = snapshot_retention.select(snapshots)
+        assert _names(keep) == ["s0"]
+        assert _names(remove) == ["s1", "s2"]
+
+    def test_daily_and_weekly(self):
+        # two snapshots a day over three weeks
+        snapshots = [_snapshot(f"s{i}", i * 12) for i in range(42)]
+        keep, remove = snapshot_retention.select(
+            snapshots, keep_last=1, keep_daily=3, keep_weekly=2
+        )
+        days = {arrow.get(x["date"]).floor("day") for x in keep}
+        weeks = {arrow.get(x["date"]).floor("week") for x in keep}
+        assert len(days) == 4
+        assert len(weeks) == 2
+        # the newest of every kept day
+        for snapshot in keep:
+            day = arrow.get(snapshot["date"]).floor("day")
+            newer = [
+                x
+                for x in snapshots
+                if arrow.get(x["date"]).floor("day") == day
+                and x["date"] > snapshot["date"]
+            ]
+            assert not newer
+        assert len(keep) + len(remove) == len(snapshots)
+
+    def test_budget_drops_the_oldest(self):
+        snapshots = [_snapshot(f"s{i}", i, size=4 * GB) for i in range(5)]
+        keep, remove = snapshot_retention.select(
+            snapshots, keep_last=5, max_size=10 * GB
+        )
+        assert _names(keep) == ["s0", "s1"]
+        assert _names(remove) == ["s2", "s3", "s4"]
+
+    def test_budget_keeps_the_newest(self):
+        snapshots = [_snapshot(f"s{i}", i, size=20 * GB) for i in range(2)]
+        keep, remove = snapshot_retention.select(
+            snapshots, keep_last=2, max_size=10 * GB
+        )
+        assert _names(keep) == ["s0"]
+        assert _names(remove) == ["s1"]
+
+    def test_snapshots_without_date_are_left(self):
+        snapshots = [_snapshot("s0", 0), {"name": "nodate", "date": None}]
+        keep, remove = snapshot_retention.select(snapshots)
+        assert _names(keep) == ["s0"]
+        assert remove == []
+
+
+class TestPrune(object):
+    def test_pre_update_prefix_only(self, monkeypatch):
+        removed = []
+        monkeypatch.setattr(
+            lib_db_snapshots,
+            "_remove_snapshots",
+            lambda config, snapshots, keep_clones=False: removed.extend(snapshots),
+        )
+        prefix = lib_db_snapshots.PRE_UPDATE_PREFIX
+        snapshots = [_snapshot(f"{prefix}{i}", i) for i in range(4)]
+        snapshots += [_snapshot(f"manual{i}", 10 + i) for i in range(4)]
+
+        # like the module level api of the snapshot backends
+        snapshot_manager = types.SimpleNamespace()
+        setattr(snapshot_manager, "__get_snapshots", lambda config: snapshots)
+
+        config = types.SimpleNamespace(snapshot_manager=snapshot_manager, force=True)
+        lib_db_snapshots._prune(config, False, 2, 0, 0, 0, prefix=prefix)
+        assert _names(removed) == [f"{prefix}2", f"{prefix}3"]
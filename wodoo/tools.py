@@ -382,6 +382,31 @@ def __rename_db_drop_target(conn, from_db, to_db):
     _remove_postgres_connections(conn.clone(dbname=to_db))
 
 
+def _get_server_version_num(conn):
+    return int(
+        _execute_sql(
+            conn.clone(dbname="postgres"), "show server_version_num", fetchone=True
+        )[0]
+    )
+
+
+def _clone_database(conn, template, dest_db):
+    """
+    Creates dest_db as copy of template; the template must not have any
+    connections. Uses the file copy strategy on postgres 15+, which is
+    much faster for big databases than the default wal_log strategy.
+    """
+    _remove_postgres_connections(conn.clone(dbname=template))
+    strategy = ""
+    if _get_server_version_num(conn) >= 150000:
+        strategy = " STRATEGY FILE_COPY"
+    _execute_sql(
+        conn.clone(dbname="postgres"),
+        f"create database {dest_db} template {template}{strategy}",
+        notransaction=True,
+    )
+
+
 def _merge_env_dict(env):
     res = {}
     for k, v in os.environ.items():
@@ -416,6 +441,16 @@ def __dc_out(config, cmd, env={}):
     return subprocess.check_output(c, env=_merge_env_dict(env))
 
 
+def __dc_popen(config, cmd, env={}, **kwargs):
+    """
+    Like __dc but returns the process; e.g. to stream into its stdin.
+    """
+    ensure_project_name(config)
+    c = __get_cmd(config) + cmd
+    env = _set_default_envs(env)
+    return subprocess.Popen(c, env=_merge_env_dict(env), **kwargs)
+
+
 def __dcexec(config, cmd, interactive=True, env=None):
     ensure_project_name(config)
     env = _set_default_envs(env)
@@ -732,30 +767,28 @@ def __do_command(cmd, *params, **kwparams):
 
 
 def _get_dump_files(backupdir, fnfilter=None):
+    """
+    Rows (nr, filename, age, size, type) of the dumps, newest first; read
+    from the dump catalog.
+    """
     import humanize
+    from .dump_catalog import get_catalog
 
-    _files = list(backupdir.glob("*"))
-
-    def _get_ctime(filepath):
-        if fnfilter and fnfilter not in filepath.name:
-            return False
-        try:
-            return (backupdir / filepath).stat().st_ctime
-        except Exception:
-            return 0
+    catalog = get_catalog(backupdir)
+    names = [x for x in catalog if not fnfilter or fnfilter in x]
+    names = sorted(names, key=lambda x: catalog[x]["ctime"], reverse=True)
 
     rows = []
-    for i, file in enumerate(
-        sorted(filter(lambda x: _get_ctime(x), _files), reverse=True, key=_get_ctime)
-    ):
-        filepath = backupdir / file
-        delta = arrow.get() - arrow.get(filepath.stat().st_mtime)
+    for i, name in enumerate(names):
+        entry = catalog[name]
+        delta = arrow.get() - arrow.get(entry["mtime"])
         rows.append(
             (
                 i + 1,
-                file.name,
+                name,
                 humanize.naturaltime(delta),
-                humanize.naturalsize(filepath.stat().st_size),
+                humanize.naturalsize(entry["size"]),
+                entry.get("type", ""),
             )
         )
 
@@ -0,0 +1,269 @@
+"""
+Continuous WAL archiving and point in time restore for RUN_POSTGRES.
+
+With POSTGRES_WAL_ARCHIVE=1 the archive directory (dirs wal_archive) is
+mounted into the postgres container at /wal_archive:
+- wal/: the archived WAL segments (archive_command)
+- base/<name>/: base backups taken with pg_basebackup while postgres runs
+- basebackups.json: index of the base backups with start/end time and the
+  first WAL segment they need
+
+A point in time restore extracts the newest base backup finished before
+the target time into a new docker volume and lets postgres replay the
+archived WAL up to the target time on its first start there.
+"""
+import json
+import subprocess
+import arrow
+import click
+from pathlib import Path
+from .tools import _execute_sql
+from .tools import _get_server_version_num
+from .tools import abort
+
+CONTAINER_PATH = "/wal_archive"
+INDEX_FILENAME = "basebackups.json"
+WAL_ARCHIVE_SETTINGS = {
+    "wal_level": "replica",
+    "archive_mode": "on",
+    "archive_command": (
+        f"test ! -f {CONTAINER_PATH}/wal/%f && cp %p {CONTAINER_PATH}/wal/%f"
+    ),
+    "archive_timeout": "300",
+}
+# restore profile settings that cannot be combined with archiving
+CONFLICTING_RESTORE_SETTINGS = [
+    "wal_level",
+    "archive_mode",
+    "max_wal_senders",
+    "full_page_writes",
+]
+
+
+def get_archive_dir(config):
+    return config.dirs["wal_archive"]
+
+
+def get_container_name(config):
+    return f"{config.project_name}_postgres"
+
+
+def ensure_enabled(config):
+    if not config.run_postgres:
+        abort("WAL archiving requires RUN_POSTGRES=1")
+    if not config.postgres_wal_archive:
+        abort("Please set POSTGRES_WAL_ARCHIVE=1 and reload first.")
+
+
+def _docker_exec(config, cmd, user="postgres", env=None):
+    args = ["docker", "exec", "-u", user]
+    for k, v in (env or {}).items():
+        args += ["-e", f"{k}={v}"]
+    return subprocess.check_output(
+        args + [get_container_name(config)] + cmd, encoding="utf8"
+    )
+
+
+def prepare_archive_dir(config):
+    get_archive_dir(config).mkdir(parents=True, exist_ok=True)
+    _docker_exec(
+        config,
+        [
+            "sh",
+            "-c",
+            f"mkdir -p {CONTAINER_PATH}/wal {CONTAINER_PATH}/base && "
+            f"chown postgres:postgres {CONTAINER_PATH}/wal {CONTAINER_PATH}/base",
+        ],
+        user="root",
+    )
+
+
+def set_archiving(conn, active):
+    """
+    Writes the archive settings via ALTER SYSTEM; postgres must be
+    restarted afterwards for archive_mode and wal_level.
+    """
+    conn = conn.clone(dbname="postgres")
+    for key, value in WAL_ARCHIVE_SETTINGS.items():
+        value = value.replace("'", "''")
+        if active:
+            sql = f"alter system set {key} = '{value}'"
+        else:
+            sql = f"alter system reset {key}"
+        _execute_sql(conn, sql, notransaction=True)
+
+
+def _read_index(config):
+    path = get_archive_dir(config) / INDEX_FILENAME
+    if not path.exists():
+        return []
+    return json.loads(path.read_text())
+
+
+def _write_index(config, index):
+    path = get_archive_dir(config) / INDEX_FILENAME
+    path.write_text(json.dumps(index, indent=4))
+
+
+def list_basebackups(config):
+    return sorted(_read_index(config), key=lambda x: x["end"])
+
+
+def basebackup(config, conn):
+    """
+    pg_basebackup into base/<timestamp> inside the running container.
+    """
+    conn = conn.clone(dbname="postgres")
+    name = arrow.get().strftime("%Y%m%d%H%M%S")
+    start = arrow.get().isoformat()
+    # segment that is written at the moment - the backup needs nothing older
+    wal_file = _execute_sql(
+        conn, "select pg_walfile_name(pg_current_wal_lsn())", fetchone=True
+    )[0]
+    click.secho(f"Creating base backup {name}", fg="yellow")
+    _docker_exec(
+        config,
+        [
+            "pg_basebackup",
+            "-h",
+            "127.0.0.1",
+            "-U",
+            config.DB_USER,
+            "-D",
+            f"{CONTAINER_PATH}/base/{name}",
+            "-Ft",
+            "-z",
+            "-X",
+            "stream",
+            "-c",
+            "fast",
+        ],
+        env={"PGPASSWORD": config.DB_PWD},
+    )
+    # the end of the backup must be archived before it can be restored
+    _execute_sql(conn, "select pg_switch_wal()", notransaction=True)
+    index = _read_index(config)
+    index.append(
+        {
+            "name": name,
+            "start": start,
+            "end": arrow.get().isoformat(),
+            "wal_file": wal_file,
+            "server_version_num": _get_server_version_num(conn),
+        }
+    )
+    _write_index(config, index)
+    return name
+
+
+def prune(config, keep):
+    """
+    Keeps the newest keep base backups and the WAL they need.
+    """
+    index = list_basebackups(config)
+    if keep < 1 or len(index) <= keep:
+        return
+    drop, index = index[:-keep], index[-keep:]
+    for backup in drop:
+        click.secho(f"Removing base backup {backup['name']}", fg="yellow")
+        _docker_exec(config, ["rm", "-rf", f"{CONTAINER_PATH}/base/{backup['name']}"])
+    _docker_exec(
+        config,
+        ["pg_archivecleanup", f"{CONTAINER_PATH}/wal", index[0]["wal_file"]],
+    )
+    _write_index(config, index)
+
+
+def find_basebackup(config, target_time):
+    """
+    Newest base backup that was finished before target_time.
+    """
+    candidates = [
+        x for x in list_basebackups(config) if arrow.get(x["end"]) <= target_time
+    ]
+    return candidates[-1] if candidates else None
+
+
+def _get_data_subdir(config, conn):
+    """
+    Path of the data directory relative to the mountpoint of the postgres
+    volume inside the container.
+    """
+    data_directory = _execute_sql(
+        conn.clone(dbname="postgres"), "show data_directory", fetchone=True
+    )[0]
+    mounts = json.loads(
+        subprocess.check_output(
+            [
+                "docker",
+                "inspect",
+                "-f",
+                "{{json .Mounts}}",
+                get_container_name(config),
+            ],
+            encoding="utf8",
+        )
+    )
+    for mount in sorted(mounts, key=lambda x: len(x["Destination"]), reverse=True):
+        if data_directory.startswith(mount["Destination"]):
+            return str(Path(data_directory).relative_to(mount["Destination"]))
+    abort(f"No volume found for data directory {data_directory}")
+
+
+def _get_image(config):
+    return subprocess.check_output(
+        ["docker", "inspect", "-f", "{{.Config.Image}}", get_container_name(config)],
+        encoding="utf8",
+    ).strip()
+
+
+def restore_to_volume(config, conn, backup, target_time, volume):
+    """
+    Extracts the base backup into the new volume and configures the
+    recovery up to target_time; the replay happens at the next start of
+    postgres on that volume.
+    """
+    if backup["server_version_num"] < 120000:
+        abort("Point in time restore requires postgres 12 or newer.")
+    subdir = _get_data_subdir(config, conn)
+    image = _get_image(config)
+    data = f"/restore/{subdir}".rstrip("/.")
+    recovery = (
+        f"restore_command = 'cp {CONTAINER_PATH}/wal/%f %p'\n"
+        f"recovery_target_time = '{target_time.isoformat()}'\n"
+        "recovery_target_action = 'promote'\n"
+    )
+    script = (
+        "set -e\n"
+        f"mkdir -p {data}\n"
+        f"tar xzf {CONTAINER_PATH}/base/{backup['name']}/base.tar.gz -C {data}\n"
+        f"mkdir -p {data}/pg_wal\n"
+        f"tar xzf {CONTAINER_PATH}/base/{backup['name']}/pg_wal.tar.gz "
+        f"-C {data}/pg_wal\n"
+        f"touch {data}/recovery.signal\n"
+        f"cat >> {data}/postgresql.auto.conf <<'EOF'\n{recovery}EOF\n"
+        f"chown -R postgres:postgres /restore\n"
+        f"chmod 700 {data}\n"
+    )
+    subprocess.check_call(["docker", "volume", "create", volume])
+    click.secho(
+        f"Extracting base backup {backup['name']} into volume {volume}", fg="yellow"
+    )
+    subprocess.check_call(
+        [
+            "docker",
+            "run",
+            "--rm",
+            "-u",
+            "root",
+            "-v",
+            f"{volume}:/restore",
+            "-v",
+            f"{get_archive_dir(config)}:{CONTAINER_PATH}",
+            "--entrypoint",
+            "sh",
+            image,
+            "-c",
+            script,
+        ]
+    )
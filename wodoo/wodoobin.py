@@ -0,0 +1,284 @@
+"""
+Chunked wodoobin format (WODOO_BIN2) for postgres volumes.
+
+Layout:
+    WODOO_BIN2\\n<postgres version>\\n
+    chunk 0 .. n: gzip compressed, independent of each other
+    index: gzip compressed json
+    footer: offset of the index (8 bytes, big endian) + FOOTER_MAGIC
+
+A chunk holds up to CHUNK_SIZE bytes of file content; small files share
+a chunk, large files (relation segments) are split over several chunks.
+The index lists every chunk with offset, length and sha256 and every
+file/dir/symlink with its meta data and pieces (chunk, offset in chunk,
+offset in file, length). So chunks can be compressed and extracted in
+parallel, verified without extracting and single files can be pulled.
+
+The old format (WODOO_BIN: header + tar.gz) is restored by lib_backup.
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import struct
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+MAGIC = b"WODOO_BIN2\n"
+FOOTER_MAGIC = b"WBIN2IDX"
+FOOTER = struct.Struct(">Q8s")
+CHUNK_SIZE = 64 * 1024 * 1024
+# every worker holds a raw chunk and its compressed result in memory
+MAX_PACK_WORKERS = 8
+FORMAT_VERSION = 2
+
+
+def is_chunked(filepath):
+    with open(filepath, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def _compress(data, level):
+    compressed = gzip.compress(data, compresslevel=level)
+    return compressed, hashlib.sha256(compressed).hexdigest(), len(data)
+
+
+def _walk(folder):
+    """
+    Entries of folder in a stable order, folders before their content.
+    """
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        root = Path(root)
+        for name in dirs + sorted(files):
+            path = root / name
+            stat = path.lstat()
+            entry = {
+                "path": str(path.relative_to(folder)),
+                "mode": stat.st_mode & 0o7777,
+                "uid": stat.st_uid,
+                "gid": stat.st_gid,
+                "mtime": stat.st_mtime,
+            }
+            if path.is_symlink():
+                entry["type"] = "symlink"
+                entry["target"] = os.readlink(path)
+            elif path.is_dir():
+                entry["type"] = "dir"
+            else:
+                entry["type"] = "file"
+                entry["size"] = stat.st_size
+                entry["pieces"] = []
+            yield path, entry
+
+
+def pack(folder, destpath, pg_version, workers=4, level=6):
+    """
+    Writes the content of folder to destpath.
+    """
+    folder = Path(folder)
+    workers = max(1, min(workers, MAX_PACK_WORKERS))
+    entries, chunks = [], []
+    buffer = io.BytesIO()
+
+    with open(destpath, "wb") as out, ThreadPoolExecutor(
+        max_workers=workers
+    ) as executor:
+        out.write(MAGIC + f"{pg_version}\n".encode("utf8"))
+        pending = []
+
+        def _write(future):
+            compressed, sha, size = future.result()
+            chunks.append(
+                {
+                    "offset": out.tell(),
+                    "length": len(compressed),
+                    "sha256": sha,
+                    "size": size,
+                }
+            )
+            out.write(compressed)
+
+        def _flush():
+            nonlocal buffer
+            if not buffer.tell():
+                return
+            pending.append(executor.submit(_compress, buffer.getvalue(), level))
+            buffer = io.BytesIO()
+            # bounded memory: chunks are written in order
+            while len(pending) > workers:
+                _write(pending.pop(0))
+
+        for path, entry in _walk(folder):
+            entries.append(entry)
+            if entry["type"] != "file":
+                continue
+            with open(path, "rb") as file:
+                file_offset = 0
+                while True:
+                    block = file.read(CHUNK_SIZE - buffer.tell())
+                    if not block:
+                        break
+                    entry["pieces"].append(
+                        [
+                            len(chunks) + len(pending),
+                            buffer.tell(),
+                            file_offset,
+                            len(block),
+                        ]
+                    )
+                    buffer.write(block)
+                    file_offset += len(block)
+                    if buffer.tell() >= CHUNK_SIZE:
+                        _flush()
+        _flush()
+        for future in pending:
+            _write(future)
+
+        index_offset = out.tell()
+        index = {
+            "version": FORMAT_VERSION,
+            "pg_version": str(pg_version),
+            "chunk_size": CHUNK_SIZE,
+            "chunks": chunks,
+            "entries": entries,
+        }
+        out.write(gzip.compress(json.dumps(index).encode("utf8")))
+        out.write(FOOTER.pack(index_offset, FOOTER_MAGIC))
+
+
+def read_header(filepath):
+    """
+    Returns the postgres version from the header.
+    """
+    with open(filepath, "rb") as file:
+        file.readline()
+        return file.readline().decode("utf8").strip()
+
+
+def read_index(filepath):
+    with open(filepath, "rb") as file:
+        file.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, magic = FOOTER.unpack(file.read(FOOTER.size))
+        if magic != FOOTER_MAGIC:
+            raise Exception(f"{filepath}: index missing - file truncated?")
+        file.seek(index_offset)
+        data = file.read(os.path.getsize(filepath) - FOOTER.size - index_offset)
+    return json.loads(gzip.decompress(data))
+
+
+def _read_chunk(filepath, chunk, verify=True):
+    with open(filepath, "rb") as file:
+        file.seek(chunk["offset"])
+        compressed = file.read(chunk["length"])
+    if verify and hashlib.sha256(compressed).hexdigest() != chunk["sha256"]:
+        raise Exception(f"Checksum mismatch of chunk at offset {chunk['offset']}")
+    return compressed
+
+
+def verify(filepath, workers=4, deep=False):
+    """
+    Checks the sha256 of all chunks; with deep also decompresses them.
+    Returns the list of broken chunk numbers.
+    """
+    index = read_index(filepath)
+
+    def _verify(nr):
+        chunk = index["chunks"][nr]
+        try:
+            data = _read_chunk(filepath, chunk)
+            if deep and len(gzip.decompress(data)) != chunk["size"]:
+                raise Exception("size mismatch")
+        except Exception:
+            return nr
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = executor.map(_verify, range(len(index["chunks"])))
+    return [x for x in results if x is not None]
+
+
+def _pieces_by_chunk(entries):
+    result = {}
+    for entry in entries:
+        for chunk_nr, chunk_offset, file_offset, length in entry.get("pieces", []):
+            result.setdefault(chunk_nr, []).append(
+                (entry["path"], chunk_offset, file_offset, length)
+            )
+    return result
+
+
+def extract(filepath, dest, workers=4, paths=None):
+    """
+    Extracts the archive (or only the files in paths) to dest.
+    """
+    dest = Path(dest)
+    index = read_index(filepath)
+    entries = index["entries"]
+    if paths:
+        paths = set(str(Path(x)) for x in paths)
+        entries = [x for x in entries if x["path"] in paths]
+        missing = paths - set(x["path"] for x in entries)
+        if missing:
+            raise Exception(f"Not in archive: {', '.join(sorted(missing))}")
+
+    dest.mkdir(parents=True, exist_ok=True)
+    for entry in entries:
+        path = dest / entry["path"]
+        if entry["type"] == "dir":
+            path.mkdir(parents=True, exist_ok=True)
+        elif entry["type"] == "symlink":
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.symlink(entry["target"], path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "wb") as file:
+                file.truncate(entry["size"])
+
+    def _extract_chunk(item):
+        chunk_nr, pieces = item
+        data = gzip.decompress(_read_chunk(filepath, index["chunks"][chunk_nr]))
+        for path, chunk_offset, file_offset, length in pieces:
+            fd = os.open(dest / path, os.O_WRONLY)
+            try:
+                os.pwrite(fd, data[chunk_offset : chunk_offset + length], file_offset)
+            finally:
+                os.close(fd)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(_extract_chunk, _pieces_by_chunk(entries).items()))
+
+    # deepest first, so that the mtime of folders is not changed afterwards
+    for entry in reversed(entries):
+        path = dest / entry["path"]
+        if entry["type"] == "symlink":
+            continue
+        if os.geteuid() == 0:
+            os.chown(path, entry["uid"], entry["gid"])
+        os.chmod(path, entry["mode"])
+        os.utime(path, (entry["mtime"], entry["mtime"]))
+
+
+def main():
+    """
+    Entry point to run extract with sudo; see lib_backup._restore_wodoo_bin
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["extract", "verify"])
+    parser.add_argument("filepath")
+    parser.add_argument("dest", nargs="?")
+    parser.add_argument("-j", "--workers", type=int, default=4)
+    args = parser.parse_args()
+    if args.command == "extract":
+        extract(args.filepath, args.dest, workers=args.workers)
+    else:
+        broken = verify(args.filepath, workers=args.workers, deep=True)
+        if broken:
+            sys.exit(f"Broken chunks: {broken}")
+
+
+if __name__ == "__main__":
+    main()